@@ -0,0 +1,378 @@
+"""
+Completion backends behind `GPT3`, selected with COMPLETION_BACKEND:
+
+    openai      the completions endpoint at OPENAI_API_BASE (any OpenAI-compatible server), pooled connections
+    replay      completions recorded earlier (COMPLETION_RECORD_PATH) served from COMPLETION_REPLAY_PATH
+    synthetic   a canned scene (or edit, for edit prompts) after SYNTHETIC_LATENCY seconds, streamed in
+                SYNTHETIC_CHUNK_SIZE pieces
+
+The last two need no network, so load tests and benchmarks measure the server itself. Setting
+COMPLETION_RECORD_PATH on any backend appends every prompt -> completion pair to that file.
+
+Completions stop at the closing fence (COMPLETION_PARAMS['stop']). A caller that passes its own `max_tokens` gets
+Truncated, carrying the text so far, when the completion runs into it (see app.output_budget).
+"""
+import os
+import abc
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+import httpx
+from typing import AsyncIterator, Dict, Optional, Tuple
+from app.example_data import example_data
+from app.example_selection import estimate_tokens, truncate_tokens
+from app.metrics import count_tokens
+
+COMPLETION_BACKEND = os.environ.get('COMPLETION_BACKEND', 'openai')
+
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1')
+COMPLETION_TIMEOUT = float(os.environ.get('COMPLETION_TIMEOUT', 60.0))  # seconds, including time spent queued
+MAX_CONCURRENT_COMPLETIONS = int(os.environ.get('MAX_CONCURRENT_COMPLETIONS', 32))
+
+COMPLETION_REPLAY_PATH = os.environ.get('COMPLETION_REPLAY_PATH')  # JSONL of {prompt, completion}
+COMPLETION_RECORD_PATH = os.environ.get('COMPLETION_RECORD_PATH')
+
+SYNTHETIC_LATENCY = float(os.environ.get('SYNTHETIC_LATENCY', 0.5))  # seconds per completion
+SYNTHETIC_JITTER = float(os.environ.get('SYNTHETIC_JITTER', 0.0))  # +/- fraction of the latency
+SYNTHETIC_CHUNK_SIZE = int(os.environ.get('SYNTHETIC_CHUNK_SIZE', 4))  # characters per streamed "token"
+
+COMPLETION_PARAMS = {
+    'model': 'code-davinci-002',
+    'temperature': 0,
+    'max_tokens': 1000,
+    'stop': ['```'],  # the end of the YAML block; anything after it would be thrown away
+    'top_p': 1,
+    'frequency_penalty': 0,
+    'presence_penalty': 0,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_completion() -> str:
+    """The example scene, then more text past the closing fence, as code-davinci-002 does without a stop sequence"""
+    from app.conversion import figma_to_yaml  # app.conversion is heavy and not needed by the other backends
+    scene_yaml = figma_to_yaml(example_data[0])
+    return f'{scene_yaml}```\n---\n\nA blue circle\n```\n{scene_yaml}'
+
+
+def synthetic_edit_completion() -> str:
+    """An edit as ops (renaming the scene, so it applies to any scene), then more text past the closing fence"""
+    return f"- update: []\n  name: Edited\n```\n---\n\n{synthetic_completion()}"
+
+
+def is_edit_prompt(prompt: str) -> bool:
+    """Whether the prompt's last block is an edit's instruction (see app.format_query.get_live_edit_prompt)"""
+    return prompt.rsplit('```', 1)[0].rstrip().rsplit('\n', 1)[-1].startswith('Modification:')
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+class ReplayMiss(LookupError):
+    """The replay backend has no recording for a prompt"""
+
+
+class Truncated(Exception):
+    """The completion ran into the `max_tokens` its caller passed; `text` is what was generated"""
+
+    def __init__(self, text: str):
+        super().__init__('The completion hit max_tokens')
+        self.text = text
+
+
+class CompletionBackend(abc.ABC):
+    """Produces completions for prompts; `complete` / `stream` are for the event loop, `complete_sync` for threads"""
+    name = ''
+    timeout = COMPLETION_TIMEOUT
+
+    @abc.abstractmethod
+    async def _complete(self, prompt: str, **params) -> str:
+        pass
+
+    async def complete(self, prompt: str, timeout: Optional[float] = None, **params) -> str:
+        """Returns the completion text; raises asyncio.TimeoutError if it takes longer than `timeout` overall"""
+        return await asyncio.wait_for(self._complete(prompt, **params), timeout or self.timeout)
+
+    @abc.abstractmethod
+    def complete_sync(self, prompt: str, **params) -> str:
+        pass
+
+    @abc.abstractmethod
+    def stream(self, prompt: str, **params) -> AsyncIterator[str]:
+        """Yields the completion text as it is generated; closing the generator drops the upstream request"""
+
+    async def aclose(self):
+        pass
+
+
+########################################################################################################################
+# OpenAI-compatible HTTP
+########################################################################################################################
+
+class OpenAIBackend(CompletionBackend):
+    """Client for the completions endpoint with pooled HTTP sessions and bounded concurrency"""
+    name = 'openai'
+
+    def __init__(self, api_base: str = OPENAI_API_BASE, api_key: str = OPENAI_API_KEY,
+                 timeout: float = COMPLETION_TIMEOUT, max_concurrency: int = MAX_CONCURRENT_COMPLETIONS):
+        self.api_base = api_base.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._sync_client: Optional[httpx.Client] = None
+        if not api_key:
+            logger.warning('OPENAI_API_KEY is not set; completion requests will be rejected')
+
+    def _session_args(self) -> dict:
+        return {
+            'base_url': self.api_base,
+            'headers': {'Authorization': f'Bearer {self.api_key}'},
+            'timeout': httpx.Timeout(self.timeout, connect=10.0),
+            'limits': httpx.Limits(max_connections=self.max_concurrency,
+                                   max_keepalive_connections=self.max_concurrency),
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """The session is created lazily so it binds to the server's event loop, not the importer's"""
+        if self._client is None or self._client.is_closed or str(self._client.base_url).rstrip('/') != self.api_base:
+            self._client = httpx.AsyncClient(**self._session_args())
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def _get_sync_client(self) -> httpx.Client:
+        if self._sync_client is None or self._sync_client.is_closed \
+                or str(self._sync_client.base_url).rstrip('/') != self.api_base:
+            self._sync_client = httpx.Client(**self._session_args())
+        return self._sync_client
+
+    @staticmethod
+    def _text(prompt: str, body: dict, params: dict) -> str:
+        choice = body['choices'][0]
+        text = choice['text']
+        usage = body.get('usage') or {}
+        count_tokens(usage.get('prompt_tokens') or estimate_tokens(prompt),
+                     usage.get('completion_tokens') or estimate_tokens(text))
+        if choice.get('finish_reason') == 'length' and 'max_tokens' in params:
+            raise Truncated(text)
+        return text
+
+    async def _complete(self, prompt: str, **params) -> str:
+        client = self._get_client()
+        async with self._semaphore:
+            response = await client.post('/completions', json={**COMPLETION_PARAMS, **params, 'prompt': prompt})
+            response.raise_for_status()
+            return self._text(prompt, response.json(), params)
+
+    def complete_sync(self, prompt: str, **params) -> str:
+        response = self._get_sync_client().post('/completions',
+                                                json={**COMPLETION_PARAMS, **params, 'prompt': prompt})
+        response.raise_for_status()
+        return self._text(prompt, response.json(), params)
+
+    async def stream(self, prompt: str, **params) -> AsyncIterator[str]:
+        client = self._get_client()
+        async with self._semaphore:
+            async with client.stream(
+                    'POST', '/completions',
+                    json={**COMPLETION_PARAMS, **params, 'prompt': prompt, 'stream': True},
+            ) as response:
+                response.raise_for_status()
+                generated = []
+                try:
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data:'):
+                            continue
+                        data = line[len('data:'):].strip()
+                        if data == '[DONE]':
+                            break
+                        generated.append(json.loads(data)['choices'][0]['text'])
+                        yield generated[-1]
+                finally:  # streamed responses carry no usage, so these are estimates
+                    count_tokens(estimate_tokens(prompt), estimate_tokens(''.join(generated)))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+########################################################################################################################
+# Local stand-ins
+########################################################################################################################
+
+class CannedBackend(CompletionBackend):
+    """Answers from memory after a (simulated) delay; the stream spreads that delay over its chunks"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, chunk_size: int = SYNTHETIC_CHUNK_SIZE,
+                 seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = max(chunk_size, 1)
+        self._rng = random.Random(seed)
+
+    @abc.abstractmethod
+    def lookup(self, prompt: str) -> str:
+        """The whole completion for `prompt`"""
+
+    def delay(self) -> float:
+        return max(self.latency * (1 + self.jitter * (2 * self._rng.random() - 1)), 0.0)
+
+    @staticmethod
+    def limit(text: str, params: dict) -> Tuple[str, bool]:
+        """The text cut at the stop sequences and max_tokens, as the completions endpoint would; and if truncated"""
+        params = {**COMPLETION_PARAMS, **params}
+        stop = params.get('stop') or []
+        for seq in [stop] if type(stop) is str else stop:
+            text = text.split(seq)[0]
+        if estimate_tokens(text) > params['max_tokens']:
+            return truncate_tokens(text, params['max_tokens']), True
+        return text, False
+
+    @staticmethod
+    def rest(prompt: str, text: str) -> str:
+        """What is left of `text` when the prompt already ends with its start (a truncated answer, continued)"""
+        written = prompt.rsplit('```', 1)[-1]
+        return text[len(written):] if written and text.startswith(written) else text
+
+    def answer(self, prompt: str, text: str, params: dict) -> str:
+        text, truncated = self.limit(self.rest(prompt, text), params)
+        count_tokens(estimate_tokens(prompt), estimate_tokens(text))
+        if truncated and 'max_tokens' in params:
+            raise Truncated(text)
+        return text
+
+    async def _complete(self, prompt: str, **params) -> str:
+        text = self.lookup(prompt)
+        await asyncio.sleep(self.delay())
+        return self.answer(prompt, text, params)
+
+    def complete_sync(self, prompt: str, **params) -> str:
+        text = self.lookup(prompt)
+        time.sleep(self.delay())
+        return self.answer(prompt, text, params)
+
+    async def stream(self, prompt: str, **params) -> AsyncIterator[str]:
+        text = self.limit(self.rest(prompt, self.lookup(prompt)), params)[0]
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        per_chunk = self.delay() / max(len(chunks), 1)
+        n_sent = 0
+        try:
+            for chunk in chunks:
+                await asyncio.sleep(per_chunk)
+                n_sent += len(chunk)
+                yield chunk
+        finally:
+            count_tokens(estimate_tokens(prompt), estimate_tokens(text[:n_sent]))
+
+
+class SyntheticBackend(CannedBackend):
+    """The same completion for every prompt; by default the example scene, or an edit as ops for edit prompts"""
+    name = 'synthetic'
+
+    def __init__(self, text: Optional[str] = None, latency: float = SYNTHETIC_LATENCY, jitter: float = SYNTHETIC_JITTER,
+                 chunk_size: int = SYNTHETIC_CHUNK_SIZE):
+        super().__init__(latency, jitter, chunk_size)
+        self.text = text
+        self._scene_text = synthetic_completion() if text is None else None
+        self._edit_text = synthetic_edit_completion() if text is None else None
+
+    def lookup(self, prompt: str) -> str:
+        if self.text is not None:
+            return self.text
+        return self._edit_text if is_edit_prompt(prompt) else self._scene_text
+
+
+class ReplayBackend(CannedBackend):
+    """Recorded completions, matched on the exact prompt; unrecorded prompts raise ReplayMiss"""
+    name = 'replay'
+
+    def __init__(self, path: str = COMPLETION_REPLAY_PATH, latency: float = 0.0, chunk_size: int = SYNTHETIC_CHUNK_SIZE):
+        super().__init__(latency, 0.0, chunk_size)
+        if not path:
+            raise ValueError('The replay backend needs COMPLETION_REPLAY_PATH')
+        self.path = path
+        self.recordings: Dict[str, str] = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.recordings[prompt_key(record['prompt'])] = record['completion']
+
+    def lookup(self, prompt: str) -> str:
+        try:
+            return self.recordings[prompt_key(prompt)]
+        except KeyError:
+            raise ReplayMiss(f'No recorded completion for prompt {prompt_key(prompt)[:12]} in {self.path}')
+
+
+class RecordingBackend(CompletionBackend):
+    """Wraps another backend, appending each finished prompt -> completion pair to a JSONL file for replay"""
+
+    def __init__(self, inner: CompletionBackend, path: str):
+        self.inner = inner
+        self.name = inner.name
+        self.timeout = inner.timeout
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getattr__(self, item):
+        return getattr(self.inner, item)
+
+    def record(self, prompt: str, completion: str):
+        line = json.dumps({'prompt': prompt, 'completion': completion}) + '\n'
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+    async def _complete(self, prompt: str, **params) -> str:
+        text = await self.inner._complete(prompt, **params)
+        self.record(prompt, text)
+        return text
+
+    def complete_sync(self, prompt: str, **params) -> str:
+        text = self.inner.complete_sync(prompt, **params)
+        self.record(prompt, text)
+        return text
+
+    async def stream(self, prompt: str, **params) -> AsyncIterator[str]:
+        chunks, generated, finished = self.inner.stream(prompt, **params), [], False
+        try:
+            async for chunk in chunks:
+                generated.append(chunk)
+                yield chunk
+            finished = True
+        except GeneratorExit:  # the consumer had all it wanted (e.g. the closing fence), not an upstream failure
+            finished = True
+            raise
+        finally:
+            await chunks.aclose()
+            if finished:
+                self.record(prompt, ''.join(generated))
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'replay': ReplayBackend,
+    'synthetic': SyntheticBackend,
+}
+
+
+def make_backend(name: str = COMPLETION_BACKEND, record_path: Optional[str] = COMPLETION_RECORD_PATH) -> CompletionBackend:
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown COMPLETION_BACKEND {name!r}; expected one of {", ".join(BACKENDS)}')
+    backend = BACKENDS[name]()
+    return RecordingBackend(backend, record_path) if record_path else backend
@@ -0,0 +1,97 @@
+"""
+Post-processing of completions into Figma scenes, shared by the single-item endpoints and /convert/batch.
+Batches run it in a process pool so that one worker's event loop isn't stuck parsing YAML for many items.
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from app.types import Coord, Scene
+from app.utils import get_tl_br_w_h, denormalize_dims
+from app.conversion import yaml_to_figma, apply_scene_diff, place_ops, patch_figma
+from app.scene_diff import is_ops_diff
+from app.repair import ParseReport, parse_diff_yaml
+from app.context_pruning import Pruning, restore_ops
+from app.metrics import stage
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))  # completions in flight per batch
+# processes for post-processing batch results (per server worker); 0 = run it in the event loop's thread pool
+BATCH_PROCESSES = int(os.environ.get('BATCH_PROCESSES', min(4, os.cpu_count() or 1)))
+
+
+def primary_result(yaml_str: str, tl: Coord, w: int) -> dict:
+    """Response body for a primary completion"""
+    report = ParseReport()
+    output_scene = yaml_to_figma(yaml_str, tl, w, report)
+    return {
+        'outputScene': output_scene,
+        **report.as_dict(),
+    }
+
+
+def is_clean(result: dict) -> bool:
+    """Whether a result came out of its completion whole: something was drawn and nothing had to be dropped"""
+    return bool(result['outputScene']) and not result['dropped']
+
+
+def edit_result(yaml_str: str, scene: Scene, pruning: Optional[Pruning] = None) -> dict:
+    """
+    Response body for an edit completion against `scene`, placed where the scene was; `pruning` is what the
+    prompt left out of the scene, if anything
+    """
+    tl, br, w, h = get_tl_br_w_h(scene)
+    report = ParseReport()
+    with stage('yaml_parse'):
+        scene_diff = restore_ops(parse_diff_yaml(yaml_str, report), pruning, report)
+    scene_diffed = apply_scene_diff(scene, scene_diff)
+    with stage('denormalize'):
+        scene_diffed = denormalize_dims(scene_diffed, tl, w, inplace=True)
+    return {
+        'outputScene': [scene_diffed],
+        'x': tl[0],
+        'y': tl[1],
+        **report.as_dict(),
+    }
+
+
+def edit_patch_result(yaml_str: str, scene: Scene, pruning: Optional[Pruning] = None) -> dict:
+    """
+    Response body for a session edit: the edit as ops over `scene` in Figma units (`patch`), so untouched nodes
+    keep their exact geometry, plus the patched `scene` itself
+    """
+    tl, br, w, h = get_tl_br_w_h(scene)
+    report = ParseReport()
+    with stage('yaml_parse'):
+        scene_diff = restore_ops(parse_diff_yaml(yaml_str, report), pruning, report)
+    with stage('denormalize'):
+        if is_ops_diff(scene_diff):
+            patch = place_ops(scene_diff, tl, w)
+        else:  # jsondiff-style diffs from older prefixes can't be placed node by node
+            patch = [{'replace': [], 'node': denormalize_dims(apply_scene_diff(scene, scene_diff), tl, w, inplace=True)}]
+    with stage('diff_patch'):
+        patched = patch_figma(scene, patch)
+    return {
+        'patch': patch,
+        'scene': patched,
+        **report.as_dict(),
+    }
+
+
+class ResultPool(object):
+    """Lazily started process pool for `primary_result` / `edit_result`"""
+    executor: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def get(cls) -> Optional[ProcessPoolExecutor]:
+        if cls.executor is None and BATCH_PROCESSES > 0:
+            # spawn, not fork: the server process has live threads (prefix writer, HTTP client)
+            cls.executor = ProcessPoolExecutor(max_workers=BATCH_PROCESSES,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return cls.executor
+
+    @classmethod
+    def shutdown(cls):
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False, cancel_futures=True)
+            cls.executor = None
@@ -0,0 +1,157 @@
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+DB_EVICT_SLACK = 0.01  # share of max_db_entries evicted beyond the excess, so the count is re-read only now and then
+
+
+class CompletionCache(object):
+    """
+    Content-addressed cache of completions: an in-memory LRU in front of an optional SQLite file that
+    survives restarts. Entries are evicted by count (per tier) and by age (`ttl` seconds, 0 = never).
+    `table` lets other string values share the machinery (e.g. edit sessions).
+
+    The file's least recently used rows are evicted, by an index on `accessed`, once this process has counted
+    more than `max_db_entries` of them; the count is re-read from the file then, as other workers share it.
+    On the event loop, `aset` writes to the file from a thread.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 0, db_path: Optional[str] = None,
+                 max_db_entries: int = 100000, table: str = 'completions'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self.table = table
+        self._memory = OrderedDict()  # key -> (created, value)
+        self._lock = threading.Lock()  # the memory tier and counters
+        self._db_lock = threading.Lock()  # the SQLite connection
+        self._db = None
+        self._db_entries = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)')
+            self._db_entries = self._db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    @staticmethod
+    def make_key(prompt: str, params: dict) -> str:
+        """sha256 over the model parameters and the full formatted prompt"""
+        payload = json.dumps({'params': params, 'prompt': prompt}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl) and now - created > self.ttl
+
+    def _remember(self, key: str, created: float, value: str):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        # =====[ Memory tier ]=====
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+                self.evictions += 1
+
+        # =====[ Disk tier ]=====
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(f'SELECT value, created FROM {self.table} WHERE key = ?', (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._db.execute(f'UPDATE {self.table} SET accessed = ? WHERE key = ?', (now, key))
+                elif row is not None:
+                    self._db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                    self._db_entries -= 1
+
+        with self._lock:
+            if row is not None and not self._expired(row[1], now):
+                self._remember(key, row[1], row[0])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[0]
+            if row is not None:  # expired
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            self._write(key, value, now)
+
+    async def aset(self, key: str, value: str):
+        """`set` for the event loop: the memory tier right away, the file from a thread"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, key, value, now)
+
+    def _write(self, key: str, value: str, now: float):
+        with self._db_lock:
+            inserted = self._db.execute(
+                f'INSERT OR IGNORE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, value, now, now)
+            ).rowcount
+            if not inserted:
+                self._db.execute(f'UPDATE {self.table} SET value = ?, created = ?, accessed = ? WHERE key = ?',
+                                 (value, now, now, key))
+            self._db_entries += inserted
+            if self._db_entries > self.max_db_entries:
+                self._evict()
+
+    def _evict(self):
+        """Deletes the least recently used rows over `max_db_entries`, and DB_EVICT_SLACK of it more"""
+        self._db_entries = self._db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        if self._db_entries <= self.max_db_entries:
+            return
+        excess = self._db_entries - self.max_db_entries + int(self.max_db_entries * DB_EVICT_SLACK)
+        self._db.execute(
+            f'DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)',
+            (excess,)
+        )
+        self._db_entries -= excess
+        with self._lock:
+            self.evictions += excess
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+            }
+        if self._db is not None:
+            with self._db_lock:
+                stats['disk_entries'] = self._db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        return stats
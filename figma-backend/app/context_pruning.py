@@ -0,0 +1,246 @@
+"""
+Selection-scoped context for edits of large scenes. Instead of the whole scene, the edit prompt shows the nodes
+the instruction is about (matched on their names and text), the PRUNE_NEIGHBORS leaves nearest to each of them and
+the groups on the way to those, after a one-line summary of what was left out:
+
+    # not shown: 1890 of 2000 leaves (842 RECTANGLE, 630 TEXT, 418 ELLIPSE) in x 0-100, y 0-100
+    name: Frame 1.0
+    type: FRAME
+    node:
+      children:
+        3: ...
+        17: ...
+
+Children keep their indices in the full scene, so the ops the model writes already address it. The exception is
+`at` / `to` under a group with hidden children, which the model can't count: there they are read as "before the
+child with this index" and placed among the hidden children by `restore_ops`.
+
+Small scenes (under PRUNE_MIN_LEAVES leaves), instructions that match nothing in the scene ("add a footer") and
+ones that match too much of it (more than PRUNE_MAX_SHOWN of the leaves) get the whole scene, as before.
+"""
+import os
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from app.types import Scene, DSLYaml
+from app.scene import SceneNode, SceneTree, to_dsl, to_dsl_subset
+from app.scene_diff import Op, Path, is_ops_diff, longest_increasing
+from app.conversion import figma_to_dsl_tree, figma_to_yaml
+from app.transform import collect_leaves
+from app.example_selection import TfidfIndex
+from app.yaml_codec import dump_yaml
+from app.repair import ParseReport
+from app.metrics import stage
+from app import dsl_format
+
+EDIT_PRUNING = os.environ.get('EDIT_PRUNING', '1') != '0'
+PRUNE_MIN_LEAVES = int(os.environ.get('PRUNE_MIN_LEAVES', 100))
+PRUNE_MAX_SHOWN = float(os.environ.get('PRUNE_MAX_SHOWN', 0.5))  # share of the leaves
+PRUNE_NEIGHBORS = int(os.environ.get('PRUNE_NEIGHBORS', 6))  # nearest leaves shown around each match
+PRUNE_RELATIVE_SCORE = 0.6  # nodes matching at least this share of the best match's score are shown
+PRUNE_CELL = 5.0  # spatial grid cell, in normalized units (scenes are OUTPUT_WIDTH wide)
+
+Box = Tuple[float, float, float, float]  # x0, y0, x1, y1
+
+
+class Pruning(NamedTuple):
+    """What an edit prompt left out of its scene"""
+    partial: Dict[Path, int]  # groups shown with some of their children hidden -> their number of children
+    shown: int  # leaves
+    total: int
+
+
+def union(boxes: List[Box]) -> Optional[Box]:
+    if not boxes:
+        return None
+    return min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+
+def gap(a: Box, b: Box) -> float:
+    """Distance between two boxes along the axis they are furthest apart on; 0 if they overlap"""
+    return max(b[0] - a[2], a[0] - b[2], b[1] - a[3], a[1] - b[3], 0)
+
+
+def is_under(path: Path, ancestors: Set[Path]) -> bool:
+    return any(path[:i] in ancestors for i in range(len(path) + 1))
+
+
+class SceneIndex(object):
+    """A normalized scene tree's nodes by path, with a TF-IDF index over their names and text and a grid of leaves"""
+
+    def __init__(self, tree: SceneTree):
+        self.nodes: Dict[Path, SceneNode] = {}
+        self.boxes: Dict[Path, Box] = {}
+        self.n_children: Dict[Path, int] = {}
+        self.leaves: List[Path] = []
+        self._walk(tree, ())
+        self.paths = list(self.nodes)
+        self.names = TfidfIndex([self.document(self.nodes[path]) for path in self.paths])
+        self.grid: Dict[Tuple[int, int], List[Path]] = {}
+        for path in self.leaves:
+            (cx0, cy0), (cx1, cy1) = self.cell(self.boxes[path][:2]), self.cell(self.boxes[path][2:])
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self.grid.setdefault((cx, cy), []).append(path)
+        self.extent = max((max(abs(cx), abs(cy)) for cx, cy in self.grid), default=0)
+
+    def _walk(self, x: SceneTree, path: Path) -> Optional[Box]:
+        if type(x) is not list:
+            self.nodes[path] = x
+        if type(x) is list or x.children is not None:
+            children = x if type(x) is list else x.children
+            self.n_children[path] = len(children)
+            box = union([b for b in (self._walk(c, (*path, ix)) for ix, c in enumerate(children)) if b is not None])
+        else:
+            props = x.props or {}
+            position = props.get('position') or {}
+            x0, y0 = position.get('x') or 0, position.get('y') or 0
+            box = x0, y0, x0 + (props.get('width') or 0), y0 + (props.get('height') or 0)
+            self.leaves.append(path)
+        if box is not None:
+            self.boxes[path] = box
+        return box
+
+    @staticmethod
+    def document(node: SceneNode) -> str:
+        text = (node.props or {}).get('characters') if node.children is None else None
+        return f'{node.name} {node.type} {text or ""}'
+
+    @staticmethod
+    def cell(point) -> Tuple[int, int]:
+        return int(point[0] // PRUNE_CELL), int(point[1] // PRUNE_CELL)
+
+    def matches(self, instruction: str) -> List[Path]:
+        """The nodes whose names / text are closest to the instruction's words; none if nothing shares a word"""
+        scores = self.names.scores(instruction)
+        best = max(scores, default=0)
+        if best <= 0:
+            return []
+        return [path for path, score in zip(self.paths, scores) if score >= best * PRUNE_RELATIVE_SCORE]
+
+    def nearest(self, path: Path, k: int) -> List[Path]:
+        """The `k` leaves nearest to the node at `path`, outside of it, searched ring by ring over the grid"""
+        box = self.boxes.get(path)
+        if box is None or k <= 0:
+            return []
+        (cx0, cy0), (cx1, cy1) = self.cell(box[:2]), self.cell(box[2:])
+        found: Dict[Path, float] = {}
+        for r in range(self.extent * 2 + 2):
+            for cx in range(cx0 - r, cx1 + r + 1):
+                for cy in range(cy0 - r, cy1 + r + 1):
+                    if r and cx0 - r < cx < cx1 + r and cy0 - r < cy < cy1 + r:
+                        continue  # inside the ring: seen already
+                    for leaf in self.grid.get((cx, cy), ()):
+                        if leaf[:len(path)] != path and leaf not in found:
+                            found[leaf] = gap(box, self.boxes[leaf])
+            # =====[ Leaves not seen yet are at least r cells away ]=====
+            if len(found) >= k and sorted(found.values())[k - 1] <= r * PRUNE_CELL:
+                break
+        return sorted(found, key=lambda leaf: (found[leaf], leaf))[:k]
+
+
+########################################################################################################################
+# Pruning
+########################################################################################################################
+
+def prune(tree: SceneTree, instruction: str) -> Optional[Tuple[Set[Path], Pruning, str]]:
+    """The paths to show for `instruction`, what was left out and the summary line for it; None to show everything"""
+    index = SceneIndex(tree)
+    matched = index.matches(instruction)
+    if not matched:
+        return None
+    shown = set(matched)
+    for path in matched:
+        shown.update(index.nearest(path, PRUNE_NEIGHBORS))
+    shown = {path for path in shown if not any(path[:i] in shown for i in range(len(path)))}  # (in one shown)
+
+    hidden = [leaf for leaf in index.leaves if not is_under(leaf, shown)]
+    n_shown = len(index.leaves) - len(hidden)
+    if not hidden or n_shown > PRUNE_MAX_SHOWN * len(index.leaves):
+        return None
+
+    # =====[ Groups on the way to what is shown, with children left out ]=====
+    drawn = {path[:i] for path in shown for i in range(len(path) + 1)}
+    partial = {}
+    for group in drawn - shown:
+        n_drawn = sum((*group, ix) in drawn for ix in range(index.n_children[group]))
+        if n_drawn < index.n_children[group]:
+            partial[group] = index.n_children[group]
+    return shown, Pruning(partial, n_shown, len(index.leaves)), summary(index, hidden)
+
+
+def summary(index: SceneIndex, hidden: List[Path]) -> str:
+    types = Counter(index.nodes[leaf].type for leaf in hidden)
+    x0, y0, x1, y1 = union([index.boxes[leaf] for leaf in hidden])
+    kinds = ', '.join(f'{n} {t}' for t, n in types.most_common())
+    return f'# not shown: {len(hidden)} of {len(index.leaves)} leaves ({kinds}) in x {x0:g}-{x1:g}, y {y0:g}-{y1:g}\n'
+
+
+def edit_context(instruction: str, scene: Scene) -> Tuple[DSLYaml, Optional[Pruning]]:
+    """The scene as the edit prompt shows it, and what was left out of it (None when nothing was)"""
+    if not EDIT_PRUNING or len(collect_leaves(scene)) < PRUNE_MIN_LEAVES:
+        return figma_to_yaml(scene), None
+    tree = figma_to_dsl_tree(scene)
+    with stage('prune_context'):
+        pruned = prune(tree, instruction)
+    codec = dsl_format.codec
+    if pruned is None:
+        return dump_yaml(codec.encode_scene(to_dsl(tree))), None
+    shown, pruning, line = pruned
+    return line + dump_yaml(codec.encode_scene(to_dsl_subset(tree, shown))), pruning
+
+
+########################################################################################################################
+# Diffs against a pruned scene
+########################################################################################################################
+
+def place_among_hidden(parent: Path, n_children: int, placed: List[Op], deletes: Set[Path]) -> List[Op]:
+    """
+    Inserts and moves under a group with hidden children, as ops over all of its children: each goes before
+    the first child at or after its `at` / `to` that stays where it is (or last), and whatever else has to move
+    for that is moved.
+    """
+    moves = {op['move'][-1]: op for op in placed if 'move' in op and tuple(op['move']) not in deletes}
+    placed = [op for op in placed if 'insert' in op or moves.get(op['move'][-1]) is op]
+    staying = [ix for ix in range(n_children) if (*parent, ix) not in deletes and ix not in moves]
+    before: Dict[Optional[int], List[Op]] = {}
+    for op in placed:
+        target = op['at'] if 'insert' in op else op['to']
+        before.setdefault(next((ix for ix in staying if ix >= target), None), []).append(op)
+
+    order = []
+    for ix in staying:
+        order.extend(before.get(ix, []))
+        order.append(ix)
+    order.extend(before.get(None, []))
+
+    existing = [x if type(x) is int else x['move'][-1] for x in order if type(x) is int or 'move' in x]
+    kept = longest_increasing(existing)
+    ops = []
+    for at, x in enumerate(order):
+        if type(x) is not int and 'insert' in x:
+            ops.append({**x, 'at': at})
+        else:
+            ix = x if type(x) is int else x['move'][-1]
+            if ix not in kept:
+                ops.append({'move': [*parent, ix], 'to': at})
+    return ops
+
+
+def restore_ops(scene_diff, pruning: Optional[Pruning], report: Optional[ParseReport] = None):
+    """A diff the model wrote against a pruned scene, as a diff of the whole scene"""
+    if pruning is None or not is_ops_diff(scene_diff):
+        return scene_diff
+    report = report if report is not None else ParseReport()
+    ops, placed = [], {}
+    for op in scene_diff:
+        parent = tuple(op['insert']) if 'insert' in op else tuple(op['move'][:-1]) if 'move' in op else None
+        if 'replace' in op:
+            report.dropped.append('replace op against a pruned scene (it would drop what was not shown)')
+        elif parent in pruning.partial:
+            placed.setdefault(parent, []).append(op)
+        else:
+            ops.append(op)
+    deletes = {tuple(op['delete']) for op in scene_diff if 'delete' in op}
+    for parent, parent_ops in placed.items():
+        ops.extend(place_among_hidden(parent, pruning.partial[parent], parent_ops, deletes))
+    return ops
@@ -1,99 +1,126 @@
-import yaml
-from copy import deepcopy
-from app.utils import normalize_dims, denormalize_dims
-from app.types import Coord, Scene, FigmaFrame, FigmaNode, DSLNode, DSLJson, DSLYaml
-from app.utils import rgb_to_hex, hex_to_rgb
-from jsondiff import diff, patch
-from app.utils import lists_to_dicts, dicts_to_lists, extract_children
-
-
-def figma_to_json_dsl_node(node: FigmaNode) -> DSLNode:
-    """Converts a Figma node to JSON DSL. Includes normalization etc."""
-    # TODO: convert types intelligently - color, position, etc.
-    # TODO: list to dict, etc.
-    output_node = deepcopy(node)
-    if node['node'].get('color'):
-        figma_color = node['node']['color']
-        hex_color = rgb_to_hex(figma_color)
-        output_node['node']['color'] = hex_color
-    return output_node
-
-
-def json_dsl_to_figma_node(node: DSLNode) -> FigmaNode:
-    """Converts a Figma node to JSON DSL. Includes normalization etc."""
-    # TODO: convert types intelligently - color, position, etc.
-    # TODO: list to dict, etc.
-    output_node = deepcopy(node)
-    if node['node'].get('color'):
-        hex_color = node['node']['color']
-        rgb_color = hex_to_rgb(hex_color)
-        output_node['node']['color'] = rgb_color
-    return output_node
-
-
-def figma_to_json_dsl_inner(scene_norm: Scene):
-    if type(scene_norm) is list:
-        return [figma_to_json_dsl_inner(node) for node in scene_norm]
-    elif scene_norm.get('type') in ('FRAME', 'GROUP'):
-        scene_norm['node']['children'] = [figma_to_json_dsl_inner(child) for child in scene_norm['node']['children']]
-        return scene_norm
-    else:
-        return figma_to_json_dsl_node(scene_norm)
+from typing import List, Union
+from app.types import Coord, Scene, DSLJson
+from app.utils import rgb_to_hex, hex_to_rgb, OUTPUT_WIDTH
+from jsondiff import patch
+from app.scene import SceneTree, from_figma, from_dsl, to_figma, to_dsl, leaves
+from app.transform import normalize_nodes, denormalize_nodes
+from app.scene_diff import Op, Patch, diff_trees, is_ops_diff
+from app.yaml_codec import dump_yaml
+from app.repair import ParseReport, parse_dsl_yaml
+from app.metrics import stage
+from app import dsl_format
+
+def figma_to_dsl_tree(scene_raw: Scene) -> SceneTree:
+    """Parses a Figma scene into a normalized scene tree with hex colors"""
+    with stage('normalize'):
+        tree = from_figma(scene_raw)
+        leaf_nodes = leaves(tree)
+        normalize_nodes([leaf.props for leaf in leaf_nodes], OUTPUT_WIDTH)
+        for leaf in leaf_nodes:
+            if leaf.props.get('color'):
+                leaf.props['color'] = rgb_to_hex(leaf.props['color'])
+    return tree
+
+
+def hex_colors_to_rgb(tree: SceneTree) -> SceneTree:
+    """Converts the leaves' hex colors back to Figma colors, in place"""
+    for leaf in leaves(tree):
+        if leaf.props.get('color'):
+            leaf.props['color'] = hex_to_rgb(leaf.props['color'])
+    return tree
+
+
+def dsl_to_figma_tree(scene: DSLJson) -> SceneTree:
+    """Parses JSON DSL (either format, see app.dsl_format) into a scene tree with Figma colors, still normalized"""
+    return hex_colors_to_rgb(from_dsl(dsl_format.codec.decode_scene(scene)))
 
 
 def figma_to_json_dsl(scene_raw: Scene) -> DSLJson:
-    """Converts a Figma scene to JSON DSL. Includes normalization etc."""
-    scene_norm = normalize_dims(scene_raw)
-    scene_norm = figma_to_json_dsl_inner(scene_norm)
-    scene_norm = lists_to_dicts(scene_norm)
-    return scene_norm
-
-
-def json_dsl_to_figma_inner(scene):
-    if type(scene) is list:
-        return [json_dsl_to_figma_inner(node) for node in scene]
-    elif scene.get('type') in ('FRAME', 'GROUP'):
-        scene['node']['children'] = [json_dsl_to_figma_inner(child) for child in scene['node']['children']]
-        return scene
-    else:
-        return json_dsl_to_figma_node(scene)
+    """Converts a Figma scene to JSON DSL, in the configured DSL format. Includes normalization etc."""
+    return dsl_format.codec.encode_scene(to_dsl(figma_to_dsl_tree(scene_raw)))
 
 
 def json_dsl_to_figma(scene: DSLJson) -> Scene:
     """Converts a JSON DSL scene to a Figma scene"""
-    scene = dicts_to_lists(scene)
-    scene = json_dsl_to_figma_inner(scene)
-    scene = extract_children(scene)
-    return scene
+    return to_figma(dsl_to_figma_tree(scene))
+
+
+def json_dsl_to_placed_figma(scene: DSLJson, tl: Coord, w: int) -> Scene:
+    """Converts a JSON DSL scene to a Figma scene placed at `tl` with width `w`"""
+    with stage('denormalize'):
+        tree = dsl_to_figma_tree(scene)
+        denormalize_nodes([leaf.props for leaf in leaves(tree)], tl, w, OUTPUT_WIDTH)
+        return to_figma(tree)
 
 
 def figma_to_yaml(scene_raw: Scene) -> str:
     """Converts a Figma scene to YAML. Includes normalization etc."""
     scene_dslj = figma_to_json_dsl(scene_raw)
-    scene_dsly = yaml.dump(scene_dslj, sort_keys=False)
+    with stage('yaml_dump'):
+        scene_dsly = dump_yaml(scene_dslj)
     return scene_dsly
 
 
-def yaml_to_figma(yaml_str: str, tl: Coord, w: int) -> Scene:
-    """Converts a yaml_str (gpt3 output) to a Figma scene"""
-    scene_dslj = yaml.safe_load(yaml_str)
-    scene_figma = json_dsl_to_figma(scene_dslj)
-    scene = denormalize_dims(scene_figma, tl, w)
+def yaml_to_figma(yaml_str: str, tl: Coord, w: int, report: ParseReport = None) -> Scene:
+    """
+    Converts a yaml_str (gpt3 output) to a Figma scene. Parsing is tolerant (see app.repair): what had to be
+    repaired or dropped is recorded on `report`, if given.
+    """
+    with stage('yaml_parse'):
+        scene_dslj = parse_dsl_yaml(yaml_str, report)
+    if scene_dslj is None:
+        return []
+    scene = json_dsl_to_placed_figma(scene_dslj, tl, w)
     if not type(scene) is list:
         scene = [scene]
     return scene
 
 
-def get_scene_diff(a: Scene, b: Scene) -> dict:
-    """Returns a diff between two scenes"""
-    a, b = figma_to_json_dsl(a), figma_to_json_dsl(b)
-    js_diff = diff(a, b)
-    return js_diff
-
-
-def apply_scene_diff(a: Scene, js_diff: dict) -> Scene:
-    """Applies a diff to a scene"""
-    a_dslj = figma_to_json_dsl(a)
-    a_patched_dslj = patch(a_dslj, js_diff)
-    a_formatted = json_dsl_to_figma(a_patched_dslj)
-    return a_formatted
+def get_scene_diff(a: Scene, b: Scene) -> List[Op]:
+    """Returns a diff between two scenes, as a list of ops over the normalized DSL (see app.scene_diff)"""
+    codec = dsl_format.codec
+    return codec.encode_ops(diff_trees(figma_to_dsl_tree(a), figma_to_dsl_tree(b), codec.encode_props))
+
+
+def apply_scene_diff(a: Scene, scene_diff: Union[List[Op], dict]) -> Scene:
+    """Applies a diff to a scene; jsondiff-style diffs (from older prompt prefixes) are still accepted"""
+    if not is_ops_diff(scene_diff):  # made against the verbose DSL
+        return json_dsl_to_figma(patch(to_dsl(figma_to_dsl_tree(a)), scene_diff))
+    tree = figma_to_dsl_tree(a)
+    with stage('diff_patch'):
+        tree = Patch(dsl_format.codec.decode_ops(scene_diff)).apply(tree)
+        return to_figma(hex_colors_to_rgb(tree))
+
+
+def place_props(props: dict, tl: Coord, w: int) -> dict:
+    """An update op's (possibly partial) `set` in Figma units, as `json_dsl_to_placed_figma` would place it"""
+    position = props.get('position') if type(props.get('position')) is dict else {}
+    node = {'position': {'x': position.get('x', 0), 'y': position.get('y', 0)},
+            'width': props.get('width', 0), 'height': props.get('height', 0), 'fontSize': props.get('fontSize')}
+    denormalize_nodes([node], tl, w, OUTPUT_WIDTH)
+    placed = dict(props)
+    for k in ('width', 'height', 'fontSize'):
+        if k in props and props[k] is not None:
+            placed[k] = node[k]
+    if position:
+        placed['position'] = {**position, **{k: node['position'][k] for k in ('x', 'y') if k in position}}
+    if type(props.get('color')) is str:
+        placed['color'] = hex_to_rgb(props['color'])
+    return placed
+
+
+def place_ops(ops: List[Op], tl: Coord, w: int) -> List[Op]:
+    """A diff over the normalized DSL as ops over the Figma scene it was made for (placed at `tl`, width `w`)"""
+    placed = []
+    for op in dsl_format.codec.decode_ops(ops):
+        if 'update' in op and op.get('set'):
+            op = {**op, 'set': place_props(op['set'], tl, w)}
+        elif 'insert' in op or 'replace' in op:
+            op = {**op, 'node': json_dsl_to_placed_figma(op['node'], tl, w)}
+        placed.append(op)
+    return placed
+
+
+def patch_figma(scene: Scene, ops: List[Op]) -> Scene:
+    """Applies ops that are already in Figma units (see `place_ops`) to a Figma scene"""
+    return to_figma(Patch(ops).apply(from_figma(scene)))
@@ -0,0 +1,157 @@
+"""
+Text to dashboard: the model writes an app in the YAML of app.modification's examples,
+
+    Title: Films and Actors Dashboard
+    Queries:
+        Films: "SELECT * FROM film"
+    Components:
+        FilmsTable:
+            type: Table
+            data: "{{queries.Films.data}}"
+            columns: film_id, title, description, release_year
+            onRowClicked: Films
+            layouts: {top: 80, left: 2, width: 20, height: 500}
+
+which is converted to a ToolJet app import, imported, and wired to the dvdrental data source. Modifications
+re-write the app, or with MODIFICATION_FORMAT=patch only patch it (see app.modification).
+"""
+import json
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from app import modification
+from app.modification import mod_prompt, format_modification, format_patch_modification, apply_app_patch, dump_app
+from app.tooljet import ToolJetClient, ToolJetError
+from app.yaml_codec import load_yaml
+from app.metrics import stage
+
+DATA_SOURCE = 'dvdrental'  # every query runs against it (see app.tooljet.dvdrental_options)
+EVENTS = ('onClick', 'onRowClicked', 'onSelect')  # component keys naming the query to run
+PROPERTY_NAMES = {'label': 'text'}  # DSL key -> ToolJet property, where they differ
+LAYOUT_KEYS = ('top', 'left', 'width', 'height')
+ID_NAMESPACE = uuid.UUID('5d0b4a8e-5f57-4bde-9a6b-3a1d2f9c8e41')  # ids are derived from names: imports reproduce
+
+
+def dashboard_prompt(prompt: str, app_yaml: Optional[str] = None) -> str:
+    """A new app from `prompt`, or `app_yaml` (a previous completion) modified as `prompt` says"""
+    if app_yaml and modification.MODIFICATION_FORMAT == 'patch':
+        return format_patch_modification(None, app_yaml, prompt)
+    if app_yaml:
+        return format_modification(None, app_yaml, prompt)
+    return mod_prompt + f'Query: {prompt}\n\n```'
+
+
+def parse_app_yaml(yaml_str: str) -> dict:
+    try:
+        spec = load_yaml(yaml_str)
+    except Exception as e:
+        raise ValueError(f'Unparseable app: {e}')
+    if type(spec) is not dict or not spec.get('Title'):
+        raise ValueError(f'Not an app: {yaml_str[:200]!r}')
+    return spec
+
+
+def completed_app(completion: str, app_yaml: Optional[str] = None) -> Tuple[str, dict]:
+    """The app a completion of `dashboard_prompt` stands for, as YAML and parsed"""
+    if not app_yaml or modification.MODIFICATION_FORMAT != 'patch':
+        return completion, parse_app_yaml(completion)
+    try:
+        patch = load_yaml(completion)
+    except Exception as e:
+        raise ValueError(f'Unparseable patch: {e}')
+    with stage('apply_patch'):
+        spec = apply_app_patch(parse_app_yaml(app_yaml), patch)
+        yaml_str = '\n' + dump_app(spec)  # as the model would write it, after the opening fence
+    if not spec.get('Title'):
+        raise ValueError('The patch removes the app\'s title')
+    return yaml_str, spec
+
+
+########################################################################################################################
+# ToolJet import
+########################################################################################################################
+
+def tooljet_component(name: str, spec: dict, query_ids: Dict[str, str], make_id: Callable[..., str]) -> dict:
+    spec = dict(spec) if type(spec) is dict else {}
+    kind = str(spec.pop('type', 'Text'))
+    layout = spec.pop('layouts', None)
+    layout = layout if type(layout) is dict else {}
+    events = [{'eventId': key, 'actionId': 'run-query', 'queryName': str(spec[key]),
+               'queryId': query_ids.get(str(spec.pop(key)))} for key in EVENTS if key in spec]
+    properties = {}
+    for key, value in spec.items():
+        if key == 'columns':
+            names = value if type(value) is list else str(value).split(',')
+            value = [{'id': make_id('column', name, str(c).strip()), 'name': str(c).strip(), 'key': str(c).strip()}
+                     for c in names if str(c).strip()]
+        properties[PROPERTY_NAMES.get(key, key)] = {'value': value}
+    return {
+        'component': {'name': name, 'component': kind,
+                      'definition': {'properties': properties, 'events': events, 'styles': {}}},
+        'layouts': {'desktop': {k: layout[k] for k in LAYOUT_KEYS if k in layout}},
+    }
+
+
+def tooljet_import(spec: dict) -> dict:
+    """ToolJet's app import (export) format for a parsed app: one version, one data source, its queries"""
+    title = str(spec['Title'])
+
+    def make_id(*parts: str) -> str:
+        return str(uuid.uuid5(ID_NAMESPACE, '/'.join([title, *parts])))
+
+    version_id, source_id = make_id('version'), make_id('source', DATA_SOURCE)
+    queries = spec.get('Queries') if type(spec.get('Queries')) is dict else {}
+    components = spec.get('Components') if type(spec.get('Components')) is dict else {}
+    query_ids = {str(name): make_id('query', str(name)) for name in queries}
+    return {
+        'name': title,
+        'isPublic': False,
+        'dataSources': [{'id': source_id, 'name': DATA_SOURCE, 'kind': 'postgresql', 'appVersionId': version_id,
+                         'options': {}}],
+        'dataQueries': [{'id': query_ids[str(name)], 'name': str(name), 'kind': 'postgresql',
+                         'dataSourceId': source_id, 'appVersionId': version_id,
+                         'options': {'mode': 'sql', 'query': str(sql), 'transformationLanguage': 'javascript'}}
+                        for name, sql in queries.items()],
+        'appVersions': [{'id': version_id, 'name': 'v1', 'definition': {
+            'components': {make_id('component', str(name)): tooljet_component(str(name), c, query_ids, make_id)
+                           for name, c in components.items()},
+        }}],
+        'editingVersion': {'id': version_id, 'name': 'v1'},
+    }
+
+
+########################################################################################################################
+# Pipeline
+########################################################################################################################
+
+async def build_dashboard(prompt: str, client: ToolJetClient, generate: Callable[[str], Awaitable[str]],
+                          app_yaml: Optional[str] = None) -> dict:
+    """
+    Prompt -> app YAML -> ToolJet import -> data source wiring. The connection to ToolJet is set up while the
+    model is writing, and every matching data source is wired concurrently.
+    """
+    warm = asyncio.ensure_future(client.warm())
+    try:
+        completion = await generate(dashboard_prompt(prompt, app_yaml))
+        yaml_str, spec = completed_app(completion, app_yaml)
+        with stage('tooljet_convert'):
+            app_json = tooljet_import(spec)
+    except BaseException:
+        warm.cancel()
+        raise
+    await warm
+    with stage('tooljet_import'):
+        url, app = await client.create_app(app_json)
+    app_id = app.get('id') if type(app) is dict else None
+    if app_id is None:
+        raise ToolJetError(f'POST /apps/import: no app id in the response {json.dumps(app)[:200]}')
+    version_id = (app.get('editing_version') or app.get('editingVersion') or app_json['editingVersion'])['id']
+    with stage('tooljet_wire'):
+        sources = [s for s in await client.get_data_sources(app_id, version_id) if s.get('name') == DATA_SOURCE]
+        await asyncio.gather(*[client.set_password(app_id, source['id']) for source in sources])
+    return {
+        'url': url,
+        'appId': app_id,
+        'app': yaml_str,
+        'dataSources': len(sources),
+    }
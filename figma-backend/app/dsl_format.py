@@ -0,0 +1,213 @@
+"""
+Encodings of the DSL that the model reads and writes, chosen with DSL_FORMAT:
+
+    verbose   the scene tree as it is: `name` / `type` / `node: {...}`, full property names, every value
+    compact   the same information in fewer tokens:
+                - nodes are flat: `n` and `t` for name and type, properties inline, `ch` for children
+                - property names are shortened with the alias table in SCHEMA
+                - values equal to their node type's default (SCHEMA) are left out; a default-bearing property
+                  the node doesn't have at all is written as null
+                - position and size are one tuple, `b: [x, y, w, h]`, in units of DSL_GRID normalized units
+
+    - n: Window
+      t: RECTANGLE
+      c: '#d9d9d9'
+      b: [0, 0, 57, 39]
+      sh: 4
+
+Decoding is the exact inverse of encoding (up to the grid, when DSL_GRID > 1) and leaves verbose input alone, so
+it is safe to run on anything the model produced. Nodes that don't fit the schema are kept verbose.
+"""
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.scene import GROUP_TYPES
+from app.utils import lists_to_dicts
+
+DSL_FORMAT = os.environ.get('DSL_FORMAT', 'verbose')
+DSL_GRID = int(os.environ.get('DSL_GRID', 1))  # normalized units per coordinate step in the compact DSL
+
+# property: (alias, default value per node type)
+SCHEMA: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    'characters': ('tx', {}),
+    'color': ('c', {}),
+    'opacity': ('o', {'RECTANGLE': 1}),
+    'cornerRadius': ('r', {'RECTANGLE': 0}),
+    'strokeWeight': ('sw', {'RECTANGLE': 1}),
+    'fontSize': ('fs', {}),
+    'fontWeight': ('fw', {'TEXT': 400}),
+    'textAlignHorizontal': ('al', {'TEXT': 'CENTER'}),
+    'dropShadow': ('sh', {}),
+}
+NAME, TYPE, CHILDREN, BOX = 'n', 't', 'ch', 'b'
+GEOMETRY = ('position', 'width', 'height')
+
+FULL_NAMES = {alias: key for key, (alias, _) in SCHEMA.items()}
+RESERVED = {NAME, TYPE, CHILDREN, BOX, *FULL_NAMES}
+
+
+def is_number(x) -> bool:
+    return type(x) in (int, float)
+
+
+class VerboseDSL(object):
+    """The DSL as the scene tree materializes it; every method is the identity"""
+    name = 'verbose'
+    salt = ''  # for the prompt fragments' content hashes
+    encode_props: Optional[Callable[[dict], dict]] = None  # props are diffed as they are
+
+    def encode_scene(self, dsl: Any) -> Any:
+        return dsl
+
+    def decode_scene(self, dsl: Any) -> Any:
+        return dsl
+
+    def encode_ops(self, ops: List[dict]) -> List[dict]:
+        return ops
+
+    def decode_ops(self, ops: List[dict]) -> List[dict]:
+        return ops
+
+
+class CompactDSL(VerboseDSL):
+    name = 'compact'
+
+    def __init__(self, grid: int = DSL_GRID):
+        self.grid = grid
+        self.salt = f';compact:{grid}'
+
+    ####################################################################################################################
+    # Properties
+    ####################################################################################################################
+
+    def box(self, props: dict) -> Optional[list]:
+        position = props.get('position')
+        if type(position) is not dict or set(position) != {'x', 'y'}:
+            return None
+        values = [position['x'], position['y'], props.get('width'), props.get('height')]
+        if not all(is_number(v) for v in values):
+            return None
+        return values if self.grid == 1 else [round(v / self.grid) for v in values]
+
+    def unbox(self, box: Any) -> Optional[dict]:
+        if type(box) is not list or len(box) != 4 or not all(is_number(v) for v in box):
+            return None
+        x, y, w, h = box if self.grid == 1 else [v * self.grid for v in box]
+        return {'position': {'x': x, 'y': y}, 'width': w, 'height': h}
+
+    def encode_props(self, props: dict) -> dict:
+        """Aliases and the geometry tuple, without leaving out defaults (for `set` in diffs)"""
+        box = self.box(props)
+        out = {}
+        for k, v in props.items():
+            if k in GEOMETRY and box is not None:
+                if BOX not in out:
+                    out[BOX] = box
+            else:
+                out[SCHEMA[k][0] if k in SCHEMA else k] = lists_to_dicts(v)
+        return out
+
+    def decode_props(self, props: dict) -> dict:
+        out = {}
+        for k, v in props.items():
+            geometry = self.unbox(v) if k == BOX else None
+            if geometry is not None:
+                out.update(geometry)
+            else:
+                out[FULL_NAMES.get(k, k)] = v
+        return out
+
+    ####################################################################################################################
+    # Nodes
+    ####################################################################################################################
+
+    def encode_node(self, node: Any) -> Any:
+        if type(node) is not dict or tuple(node) != ('name', 'type', 'node') or type(node['node']) is not dict:
+            return node  # not the DSL's usual shape: stays verbose
+        node_type, props = node['type'], node['node']
+        if any(k in RESERVED for k in props):
+            return node
+        defaults = {k: d[node_type] for k, (_, d) in SCHEMA.items() if node_type in d}
+        if any(props.get(k, 0) is None for k in defaults):
+            return node  # null already means "absent" for these
+        out = {NAME: node['name'], TYPE: node_type}
+        box = self.box(props)
+        for k, v in props.items():
+            if k == 'children' and node_type in GROUP_TYPES and type(v) is dict:
+                out[CHILDREN] = {ix: self.encode_node(child) for ix, child in v.items()}
+            elif k in GEOMETRY and box is not None:
+                if BOX not in out:
+                    out[BOX] = box
+            elif k in SCHEMA:
+                if not (k in defaults and type(v) is type(defaults[k]) and v == defaults[k]):
+                    out[SCHEMA[k][0]] = v
+            else:
+                out[k] = v
+        for k in defaults:
+            if k not in props:
+                out[SCHEMA[k][0]] = None
+        return out
+
+    def decode_node(self, node: Any) -> Any:
+        if type(node) is not dict or 'node' in node or (NAME not in node and TYPE not in node):
+            return node  # verbose (or not a node at all)
+        node_type = node.get(TYPE)
+        props = {}
+        for k, v in node.items():
+            if k in (NAME, TYPE):
+                continue
+            if k == CHILDREN:
+                props['children'] = self.decode_scene(v)
+            elif k in FULL_NAMES:
+                if v is not None:
+                    props[FULL_NAMES[k]] = v
+            else:
+                props.update(self.decode_props({k: v}))
+        for k, (alias, defaults) in SCHEMA.items():
+            if node_type in defaults and alias not in node:
+                props[k] = defaults[node_type]
+        return {'name': node.get(NAME), 'type': node_type, 'node': props}
+
+    def encode_scene(self, dsl: Any) -> Any:
+        if type(dsl) is dict and dsl and all(type(k) is int for k in dsl):
+            return {ix: self.encode_node(node) for ix, node in dsl.items()}
+        return self.encode_node(dsl)
+
+    def decode_scene(self, dsl: Any) -> Any:
+        if type(dsl) is dict and dsl and all(type(k) is int for k in dsl):
+            return {ix: self.decode_node(node) for ix, node in dsl.items()}
+        if type(dsl) is list:
+            return [self.decode_node(node) for node in dsl]
+        return self.decode_node(dsl)
+
+    ####################################################################################################################
+    # Diff ops
+    ####################################################################################################################
+
+    def encode_ops(self, ops: List[dict]) -> List[dict]:
+        """Ops from `diff_trees(..., encode_props=self.encode_props)`; only inserted nodes are left to encode"""
+        return [{**op, 'node': self.encode_node(op['node'])} if 'node' in op else op for op in ops]
+
+    def decode_ops(self, ops: Any) -> Any:
+        if type(ops) is not list:
+            return ops  # jsondiff-style diff
+        decoded = []
+        for op in ops:
+            if type(op) is dict:
+                op = dict(op)
+                if type(op.get('set')) is dict:
+                    op['set'] = self.decode_props(op['set'])
+                if type(op.get('unset')) is list:  # (unset is applied after set)
+                    op['unset'] = [name for k in op['unset']
+                                   for name in (GEOMETRY if k == BOX else [FULL_NAMES.get(k, k)])
+                                   if name not in (op.get('set') or {})]
+                if 'node' in op:
+                    op['node'] = self.decode_node(op['node'])
+            decoded.append(op)
+        return decoded
+
+
+FORMATS = {
+    'verbose': VerboseDSL(),
+    'compact': CompactDSL(),
+}
+codec = FORMATS[DSL_FORMAT]
@@ -0,0 +1,118 @@
+import re
+import math
+from collections import Counter
+from typing import List, Dict, Optional
+from app.types import Scene, FigmaFrame, UserTextInput
+from app.utils import get_primary_and_edit_example
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('p50k_base')  # code-davinci-002's tokenizer
+except Exception:  # not installed, or its vocabulary couldn't be downloaded
+    _ENCODING = None
+
+APPROX_TOKEN = re.compile(r'\w+|[^\w\s]|\n|\s{2,}')
+APPROX_TOKEN_MARGIN = 1.25  # the approximation runs up to ~10% under p50k_base on the training prompts
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def approximate_tokens(text: str) -> int:
+    """Word/punctuation/newline count with a safety margin, so that it doesn't undercount the real tokenizer"""
+    return math.ceil(len(APPROX_TOKEN.findall(text)) * APPROX_TOKEN_MARGIN)
+
+
+def estimate_tokens(text: str) -> int:
+    """Exact token count with tiktoken available, otherwise approximate_tokens"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return approximate_tokens(text)
+
+
+def truncate_tokens(text: str, n: int) -> str:
+    """The first `n` tokens of `text`, counted as estimate_tokens does"""
+    if _ENCODING is not None:
+        return _ENCODING.decode(_ENCODING.encode(text)[:n])
+    for ix, match in enumerate(APPROX_TOKEN.finditer(text)):
+        if math.ceil((ix + 1) * APPROX_TOKEN_MARGIN) > n:
+            return text[:match.start()]
+    return text
+
+
+def scene_structure(scene: Scene) -> str:
+    """Bag-of-words description of a scene's structure: node types, names and nesting depth"""
+    words, stack = [], [(scene, 0)]
+    while stack:
+        x, depth = stack.pop()
+        if type(x) is list:
+            stack.extend((y, depth) for y in x)
+            continue
+        words.extend([x.get('type', ''), f'depth{depth}', x.get('name', '')])
+        if x.get('type') in ('FRAME', 'GROUP'):
+            stack.extend((y, depth + 1) for y in x['node']['children'])
+    return ' '.join(words)
+
+
+class TfidfIndex(object):
+    """Minimal TF-IDF index over a fixed set of documents, scored by cosine similarity"""
+
+    def __init__(self, documents: List[str]):
+        counts = [Counter(WORD.findall(doc.lower())) for doc in documents]
+        n_docs = len(documents)
+        doc_freq = Counter(word for c in counts for word in c)
+        self.idf = {word: math.log((1 + n_docs) / (1 + df)) + 1 for word, df in doc_freq.items()}
+        self.vectors = [self._normalize({w: tf * self.idf[w] for w, tf in c.items()}) for c in counts]
+
+    @staticmethod
+    def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {w: v / norm for w, v in vector.items()}
+
+    def scores(self, query: str) -> List[float]:
+        counts = Counter(WORD.findall(query.lower()))
+        q = self._normalize({w: tf * self.idf[w] for w, tf in counts.items() if w in self.idf})
+        return [sum(v * doc.get(w, 0.0) for w, v in q.items()) for doc in self.vectors]
+
+
+class ExampleSelector(object):
+    """
+    Ranks training frames by similarity to the incoming request and packs the best ones into a token budget.
+    Built once per training scene, from the frames and the prompt fragments rendered for them.
+    """
+    STRUCTURE_WEIGHT = 0.5  # share of an edit's score that comes from the input scene's structure
+
+    def __init__(self, frames: List[FigmaFrame], fragments: List[dict]):
+        self.fragments = fragments
+        primary_texts, edit_texts, structures = [], [], []
+        for frame in frames:
+            ex_before, ex_after = get_primary_and_edit_example(frame)
+            primary_texts.append(ex_before['name'])
+            edit_texts.append(ex_after['name'])
+            structures.append(scene_structure(ex_before))
+        self.primary_index = TfidfIndex(primary_texts)
+        self.edit_index = TfidfIndex(edit_texts)
+        self.structure_index = TfidfIndex(structures)
+        self.primary_tokens = [estimate_tokens(f['primary']) + 1 for f in fragments]  # +1 for the joining newline
+        self.edit_tokens = [estimate_tokens(f['edit']) + 1 if f['edit'] is not None else None for f in fragments]
+
+    @staticmethod
+    def pack(scores: List[float], tokens: List[Optional[int]], budget: int) -> List[int]:
+        """Greedily takes the best-scoring examples that fit; returns their indices in training order"""
+        ranked = sorted((i for i, t in enumerate(tokens) if t is not None), key=lambda i: -scores[i])
+        chosen, used = [], 0
+        for i in ranked:
+            if used + tokens[i] <= budget:
+                chosen.append(i)
+                used += tokens[i]
+        return sorted(chosen)
+
+    def primary_prefix(self, prompt: UserTextInput, budget: int) -> str:
+        chosen = self.pack(self.primary_index.scores(prompt), self.primary_tokens, budget)
+        return '\n'.join(self.fragments[i]['primary'] for i in chosen)
+
+    def edit_prefix(self, prompt: UserTextInput, scene: Scene, budget: int) -> str:
+        text_scores = self.edit_index.scores(prompt)
+        structure_scores = self.structure_index.scores(scene_structure(scene))
+        scores = [(1 - self.STRUCTURE_WEIGHT) * t + self.STRUCTURE_WEIGHT * s
+                  for t, s in zip(text_scores, structure_scores)]
+        chosen = self.pack(scores, self.edit_tokens, budget)
+        return '\n'.join(self.fragments[i]['edit'] for i in chosen)
@@ -1,10 +1,37 @@
-import yaml
-import pickle
+import os
+import threading
 from copy import deepcopy
+from typing import Optional, Tuple
 from app.utils import normalize_dims, get_primary_and_edit_example
 from app.conversion import figma_to_yaml, yaml_to_figma, get_scene_diff
+from app.scene_diff import dump_ops
 from app.types import Scene, FigmaFrame
 from app.types import UserTextInput, EditPrompt, PrimaryPrompt
+from app.prefix_store import PrefixStore, frame_hash
+from app.example_selection import ExampleSelector, estimate_tokens
+from app.metrics import stage
+from app import dsl_format
+
+# prompt size limit, in tokens, for prefix + query (code-davinci-002's context minus the completion's max_tokens);
+# 0 disables example selection and always sends every example
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 7000))
+
+# seconds between checks for prefixes saved by other server processes
+PREFIX_REFRESH_INTERVAL = float(os.environ.get('PREFIX_REFRESH_INTERVAL', 1.0))
+
+# where /save-scene persists the prompt prefixes, shared by server processes; until then they are read from the
+# committed app/data.pkl, which is never written
+PREFIX_STORE_PATH = os.environ.get('PREFIX_STORE_PATH',
+                                   os.path.join(os.path.expanduser('~'), '.text-to-figma', 'prefixes.pkl'))
+PREFIX_SEED_PATH = os.path.join(os.path.dirname(__file__), 'data.pkl')
+
+# bumped whenever the rendering of a frame's fragments changes, so stored fragments get re-rendered
+FRAGMENT_FORMAT = 'ops-diff'
+
+
+def fragment_key(frame: FigmaFrame) -> str:
+    """A frame's fragments' key in the prefix store: its content under the current rendering (incl. DSL format)"""
+    return frame_hash(frame, FRAGMENT_FORMAT + dsl_format.codec.salt)
 
 
 ########################################################################################################################
@@ -42,8 +69,7 @@ def get_frame_edit_prompt(frame: FigmaFrame) -> EditPrompt:
 
     # =====[ Dump them to YAML ]=====
     ex_before_yaml = figma_to_yaml(ex_before)
-    js_diff = get_scene_diff(ex_before, ex_after)
-    diff_yaml = yaml.dump(js_diff, sort_keys=False)
+    diff_yaml = dump_ops(get_scene_diff(ex_before, ex_after))
     return f"""Input:
 ```
 {ex_before_yaml}
@@ -57,14 +83,19 @@ Modification: {mod_prompt}
 """
 
 
+def is_primary_only(frame: FigmaFrame) -> bool:
+    return '(Primary Only)' in frame['name']
+
+
 def get_edit_prompt(scene):
-    filtered_scene = [x for x in scene if not '(Primary Only)' in x['name']]
+    filtered_scene = [x for x in scene if not is_primary_only(x)]
     edit_prompts = [get_frame_edit_prompt(frame) for frame in filtered_scene]
     return '\n'.join(edit_prompts)
 
 
-def get_live_edit_prompt(prompt: UserTextInput, scene: Scene) -> EditPrompt:
-    scene_yaml = figma_to_yaml(scene)
+def get_live_edit_prompt(prompt: UserTextInput, scene: Scene, scene_yaml: Optional[str] = None) -> EditPrompt:
+    """`scene_yaml` is the scene as the prompt should show it, if not all of it (see app.context_pruning)"""
+    scene_yaml = scene_yaml if scene_yaml is not None else figma_to_yaml(scene)
     return f"""Input: 
 ```
 {scene_yaml}
@@ -73,30 +104,92 @@ Modification: {prompt}
 ```"""
 
 
+def get_frame_fragments(frame: FigmaFrame) -> dict:
+    """Both prompt entries for a training frame; `edit` is None for primary-only frames"""
+    return {
+        'primary': get_frame_primary_prompt(frame),
+        'edit': None if is_primary_only(frame) else get_frame_edit_prompt(frame),
+    }
+
+
 class QueryCreator(object):
-    """Manages creation of queries for submissions to GPT-3"""
+    """
+    Manages creation of queries for submissions to GPT-3. Safe to share between threads (the startup warm-up
+    loads the prefixes on its own thread): loading and recompiling the prefixes hold a lock, and queries are
+    formatted from a consistent snapshot of them.
+    """
     training_scene: Scene
     primary_prefix: str
     edit_prefix: str
-    DATA_PATH = '/Users/jonhack/CS/AI/text-to-figma/figma-backend/app/data.pkl'
 
-    def __init__(self):
-        pass
+    def __init__(self, data_path: str = None, token_budget: int = PROMPT_TOKEN_BUDGET):
+        """The default store is seeded from PREFIX_SEED_PATH; one at an explicit `data_path` starts out empty"""
+        self.store = PrefixStore(data_path or PREFIX_STORE_PATH, refresh_interval=PREFIX_REFRESH_INTERVAL,
+                                 seed_path=None if data_path else PREFIX_SEED_PATH)
+        self.token_budget = token_budget
+        self.loaded = False
+        self.training_scene, self.primary_prefix, self.edit_prefix = None, '', ''
+        self.selector: Optional[ExampleSelector] = None
+        self._lock = threading.RLock()  # (re-entrant: load re-renders through set_prefixes, which refreshes)
+
+    def load(self):
+        """Picks up the persisted prefixes"""
+        with self._lock:
+            if self.store.load():
+                self.training_scene = self.store.scene
+                self.primary_prefix = self.store.primary_prefix
+                self.edit_prefix = self.store.edit_prefix
+                keys = [fragment_key(frame) for frame in self.training_scene]
+                if all(key in self.store.fragments for key in keys):
+                    fragments = [self.store.fragments[key] for key in keys]
+                    self.selector = ExampleSelector(self.training_scene, fragments)
+                elif self.store.fragments:  # rendered in another format (e.g. DSL_FORMAT changed): re-render
+                    self.loaded = True
+                    self.set_prefixes(self.training_scene)
+            self.loaded = True
+
+    def refresh(self):
+        """Loads the prefixes on first use, then again whenever another worker has saved new ones"""
+        with self._lock:
+            if not self.loaded or self.store.stale():
+                self.load()
 
     def set_prefixes(self, scene: Scene):
-        self.training_scene = deepcopy(scene)
-        self.primary_prefix = get_primary_prompt(scene)
-        self.edit_prefix = get_edit_prompt(scene)
-        f = open(self.DATA_PATH, 'wb')
-        pickle.dump({
-            'scene': scene,
-            'primary_prefix': self.primary_prefix,
-            'edit_prefix': self.edit_prefix,
-        }, f)
+        """Recompiles the prefixes, only re-rendering frames whose content changed since the last save"""
+        with self._lock:
+            self.refresh()
+            self.training_scene = deepcopy(scene)
+            keys = [fragment_key(frame) for frame in scene]
+            fragments = {}
+            for key, frame in zip(keys, scene):
+                fragments[key] = fragments.get(key) or self.store.fragments.get(key) or get_frame_fragments(frame)
+            frame_fragments = [fragments[key] for key in keys]
+            self.primary_prefix = '\n'.join(f['primary'] for f in frame_fragments)
+            self.edit_prefix = '\n'.join(f['edit'] for f in frame_fragments if f['edit'] is not None)
+            self.selector = ExampleSelector(self.training_scene, frame_fragments)
+            self.store.update(self.training_scene, fragments, self.primary_prefix, self.edit_prefix)
+            self.loaded = True
+
+    def snapshot(self, kind: str) -> Tuple[str, Optional[ExampleSelector]]:
+        """The current `kind` (primary / edit) prefix and the selector built with it, refreshed if stale"""
+        with self._lock:
+            self.refresh()
+            return getattr(self, f'{kind}_prefix'), self.selector
 
     def format_query_primary(self, prompt: UserTextInput) -> PrimaryPrompt:
-        return f"""{self.primary_prefix}\n{prompt}\n```"""
-
-    def format_query_edit(self, prompt: UserTextInput, scene: Scene) -> EditPrompt:
-        midfix = get_live_edit_prompt(prompt, scene)
-        return f"""{self.edit_prefix}\n{midfix}"""
+        """With a token budget, only the examples most similar to the prompt that fit are included"""
+        prefix, selector = self.snapshot('primary')
+        query = f"""\n{prompt}\n```"""
+        if self.token_budget and selector is not None:
+            with stage('select_examples'):
+                prefix = selector.primary_prefix(prompt, self.token_budget - estimate_tokens(query))
+        return f"""{prefix}{query}"""
+
+    def format_query_edit(self, prompt: UserTextInput, scene: Scene, scene_yaml: Optional[str] = None) -> EditPrompt:
+        """With a token budget, examples are ranked on both the instruction and the input scene's structure"""
+        prefix, selector = self.snapshot('edit')
+        midfix = get_live_edit_prompt(prompt, scene, scene_yaml)
+        if self.token_budget and selector is not None:
+            with stage('select_examples'):
+                prefix = selector.edit_prefix(prompt, scene, self.token_budget - estimate_tokens(midfix) - 1)
+        return f"""{prefix}\n{midfix}"""
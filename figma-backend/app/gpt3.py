@@ -1,30 +1,168 @@
-import openai
-
-# EDIT ME
-print('Change your OpenAI Key!')
-openai.api_key = 'sk-ABCDEFGHIJKLMNOP'
+import os
+from typing import Optional, AsyncIterator
+from app.cache import CompletionCache
+from app.singleflight import SingleFlight
+from app.hedging import Hedger, Accept
+from app.backends import CompletionBackend, Truncated, make_backend, COMPLETION_PARAMS
+from app.output_budget import OutputBudget, BudgetFeatures
+from app.example_selection import estimate_tokens
+from app.metrics import stage, annotate, COMPLETION_CACHE, MAX_TOKENS, COMPLETION_TRUNCATED
 
+COMPLETION_CACHE_SIZE = int(os.environ.get('COMPLETION_CACHE_SIZE', 1024))
+COMPLETION_CACHE_TTL = float(os.environ.get('COMPLETION_CACHE_TTL', 0))  # seconds, 0 = never expire
+COMPLETION_CACHE_PATH = os.environ.get('COMPLETION_CACHE_PATH')  # SQLite file; unset = memory only
 
 
 class GPT3(object):
     """Handles interface with the model, including translation back and forth (?) from YAML"""
+    backend: CompletionBackend = make_backend()  # see app.backends
+    cache = CompletionCache(max_entries=COMPLETION_CACHE_SIZE, ttl=COMPLETION_CACHE_TTL, db_path=COMPLETION_CACHE_PATH)
+    singleflight = SingleFlight()
+    hedger = Hedger()
+    budget = OutputBudget()
+
+    @staticmethod
+    def cache_key(prompt: str) -> Optional[str]:
+        """Only deterministic (temperature=0) completions are worth caching"""
+        if COMPLETION_PARAMS['temperature'] != 0:
+            return None
+        return CompletionCache.make_key(prompt, COMPLETION_PARAMS)
 
     @staticmethod
     def _generate(prompt: str) -> str:
-        print('[GPT3] Generating...')
-        response = openai.Completion.create(
-            model="code-davinci-002",
-            prompt=prompt,
-            temperature=0,
-            max_tokens=1000,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
-        return response['choices'][0]['text']
+        with stage('completion'):
+            return GPT3.backend.complete_sync(prompt)
+
+    @classmethod
+    def cache_get(cls, key: Optional[str]) -> Optional[str]:
+        raw_gen = cls.cache.get(key) if key else None
+        result = 'skip' if not key else 'miss' if raw_gen is None else 'hit'
+        COMPLETION_CACHE.inc(1, result)
+        annotate(completion_cache=result)
+        return raw_gen
 
     @classmethod
     def generate_yaml(cls, prompt: str) -> str:
-        raw_gen = cls._generate(prompt)
+        key = cls.cache_key(prompt)
+        raw_gen = cls.cache_get(key)
+        if raw_gen is None:
+            raw_gen = cls._generate(prompt)
+            if key:
+                cls.cache.set(key, raw_gen)
         yaml_str = raw_gen.split('```')[0]
         return yaml_str
+
+    @classmethod
+    async def _acomplete(cls, prompt: str, timeout: Optional[float], features: Optional[BudgetFeatures],
+                         **params) -> str:
+        """
+        The completion, with max_tokens predicted from `features` (see app.output_budget). One that runs into
+        its budget is continued where it stopped, with what is left of the usual max_tokens.
+        """
+        max_tokens = cls.budget.predict(features)
+        if max_tokens is None:
+            text = await cls.backend.complete(prompt, timeout, **params)
+        else:
+            MAX_TOKENS.observe(max_tokens, features.kind)
+            try:
+                text = await cls.backend.complete(prompt, timeout, max_tokens=max_tokens, **params)
+            except Truncated as e:
+                COMPLETION_TRUNCATED.inc(1, features.kind)
+                annotate(truncated_at=max_tokens)
+                try:
+                    rest = await cls.backend.complete(prompt + e.text, timeout,
+                                                      max_tokens=cls.budget.ceiling - max_tokens, **params)
+                except Truncated as e_rest:  # at the usual max_tokens, as without a budget
+                    rest = e_rest.text
+                text = e.text + rest
+        cls.budget.observe(features, estimate_tokens(text))
+        return text
+
+    @classmethod
+    async def _agenerate(cls, prompt: str, key: Optional[str], timeout: Optional[float],
+                         features: Optional[BudgetFeatures] = None) -> str:
+        with stage('completion'):
+            raw_gen = await cls._acomplete(prompt, timeout, features)
+        if key:
+            await cls.cache.aset(key, raw_gen)
+        return raw_gen
+
+    @classmethod
+    async def agenerate_yaml(cls, prompt: str, timeout: Optional[float] = None,
+                             features: Optional[BudgetFeatures] = None) -> str:
+        """
+        Same as generate_yaml, but doesn't block the event loop while the model is generating.
+        Identical requests that arrive while one is already in flight share its completion.
+        """
+        key = cls.cache_key(prompt)
+        raw_gen = cls.cache_get(key)
+        if raw_gen is None:
+            if key:
+                raw_gen = await cls.singleflight.do(key, lambda: cls._agenerate(prompt, key, timeout, features))
+            else:
+                raw_gen = await cls._agenerate(prompt, key, timeout, features)
+        yaml_str = raw_gen.split('```')[0]
+        return yaml_str
+
+    @classmethod
+    async def agenerate_accepted(cls, prompt: str, accept: Accept, timeout: Optional[float] = None,
+                                 features: Optional[BudgetFeatures] = None) -> dict:
+        """
+        `accept`'s result for the completion. With hedging enabled (see app.hedging) several calls may be made,
+        and the first completion `accept` passes as clean is used. Only a clean one from a call at the usual
+        temperature is cached: a sampled or fallback completion isn't the deterministic answer for the key.
+        """
+        if not cls.hedger.enabled:
+            return accept(await cls.agenerate_yaml(prompt, timeout, features))[0]
+        key = cls.cache_key(prompt)
+        raw_gen = cls.cache_get(key)
+        if raw_gen is not None:
+            return accept(raw_gen.split('```')[0])[0]
+
+        async def complete(prompt_: str, **params) -> str:
+            return await cls._acomplete(prompt_, timeout, features, **params)
+
+        async def hedged() -> dict:
+            with stage('completion'):
+                hedge = await cls.hedger.run(prompt, complete, accept)
+            if key and hedge.deterministic:
+                await cls.cache.aset(key, hedge.text)
+            return hedge.result
+
+        if key:
+            return await cls.singleflight.do(f'accepted:{key}', hedged)
+        return await hedged()
+
+    @classmethod
+    async def astream_yaml(cls, prompt: str) -> AsyncIterator[str]:
+        """Yields the YAML as it is generated and stops at the closing fence instead of running to max_tokens"""
+        key = cls.cache_key(prompt)
+        raw_gen = cls.cache_get(key)
+        if raw_gen is not None:
+            yield raw_gen.split('```')[0]
+            return
+
+        generated, emitted = '', 0
+        chunks = cls.backend.stream(prompt)
+        try:
+            with stage('completion_stream'):
+                async for chunk in chunks:
+                    generated += chunk
+                    fence_ix = generated.find('```', max(emitted - 2, 0))
+                    if fence_ix >= 0:
+                        if fence_ix > emitted:
+                            yield generated[emitted:fence_ix]
+                        generated = generated[:fence_ix + 3]
+                        break
+                    # =====[ Hold back trailing backticks; they may be the start of the fence ]=====
+                    safe_end = len(generated.rstrip('`'))
+                    if safe_end > emitted:
+                        yield generated[emitted:safe_end]
+                        emitted = safe_end
+                else:
+                    if len(generated) > emitted:
+                        yield generated[emitted:]
+        finally:
+            await chunks.aclose()
+        if key:
+            await cls.cache.aset(key, generated)
@@ -0,0 +1,186 @@
+"""
+Hedged generation: more than one completion call for a prompt, keeping the first answer that converts cleanly.
+
+    - HEDGE_CANDIDATES > 1 starts that many calls at once (the extra ones sampled at HEDGE_TEMPERATURE, since at
+      temperature 0 they would all write the same thing)
+    - HEDGE_PERCENTILE > 0 starts a backup call once the first has been running longer than that percentile of
+      recent completion times (HEDGE_DELAY until there are enough of them)
+    - a call that fails, or whose answer doesn't convert cleanly, is replaced if nothing else is in flight (or
+      what is in flight has already run past the hedge threshold)
+
+The rest are cancelled as soon as one answer is accepted. Extra calls are paid for from a budget that every
+request adds HEDGE_BUDGET calls to (banked up to HEDGE_BUDGET_BURST), and no request makes more than
+HEDGE_MAX_CALLS, so hedging costs at most HEDGE_BUDGET more calls per request in the long run. When nothing is
+accepted the first answer that converted at all is used, as without hedging.
+"""
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+from app.metrics import HEDGE_CALLS, HEDGE_WINS, HEDGE_DENIED
+
+HEDGE_CANDIDATES = int(os.environ.get('HEDGE_CANDIDATES', 1))
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', 0))  # e.g. 95; 0 = no latency hedge
+HEDGE_DELAY = float(os.environ.get('HEDGE_DELAY', 10.0))  # seconds, until HEDGE_MIN_SAMPLES completions are timed
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', 20))
+HEDGE_MAX_CALLS = int(os.environ.get('HEDGE_MAX_CALLS', 3))  # per request, the first one included
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', 0.2))  # extra calls earned per request
+HEDGE_BUDGET_BURST = float(os.environ.get('HEDGE_BUDGET_BURST', 10))
+HEDGE_TEMPERATURE = float(os.environ.get('HEDGE_TEMPERATURE', 0.7))
+
+Complete = Callable[..., Awaitable[str]]  # (prompt, **params) -> raw completion
+Accept = Callable[[str], Tuple[Any, bool]]  # completion YAML -> (result, whether it converted cleanly)
+SAMPLED = ('candidate', 'resample')  # the calls made at HEDGE_TEMPERATURE
+
+
+class Hedged(NamedTuple):
+    result: Any  # `accept`'s
+    text: str  # the completion it came from
+    kind: str  # of the call that wrote it: first / candidate / hedge / retry / resample
+    clean: bool  # False for the fallback
+
+    @property
+    def deterministic(self) -> bool:
+        """Written at the usual temperature and accepted, i.e. what a plain call could have returned"""
+        return self.clean and self.kind not in SAMPLED
+
+
+class LatencyWindow(object):
+    """The last `size` completion times"""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+class HedgeBudget(object):
+    """Extra calls: `ratio` earned per request, banked up to `burst`, one spent per call"""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Hedger(object):
+    def __init__(self, candidates: int = HEDGE_CANDIDATES, percentile: float = HEDGE_PERCENTILE,
+                 max_calls: int = HEDGE_MAX_CALLS, budget: Optional[HedgeBudget] = None,
+                 temperature: float = HEDGE_TEMPERATURE, delay: float = HEDGE_DELAY):
+        self.candidates = candidates
+        self.percentile = percentile
+        self.max_calls = max_calls
+        self.budget = budget if budget is not None else HedgeBudget()
+        self.temperature = temperature
+        self.delay = delay
+        self.latency = LatencyWindow()
+        self.requests = 0
+        self.calls = 0
+        self.wins: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_calls > 1 and (self.candidates > 1 or self.percentile > 0)
+
+    def hedge_delay(self) -> float:
+        threshold = self.latency.percentile(self.percentile)
+        return threshold if threshold is not None else self.delay
+
+    async def _call(self, complete: Complete, prompt: str, params: dict) -> str:
+        start = time.perf_counter()
+        text = await complete(prompt, **params)
+        self.latency.observe(time.perf_counter() - start)
+        return text
+
+    async def run(self, prompt: str, complete: Complete, accept: Accept) -> Hedged:
+        """The accepted result and the call it came from; raises the last failure if every call failed"""
+        self.requests += 1
+        self.budget.deposit()
+        pending: Dict[asyncio.Future, str] = {}
+        n_calls, hedge_at, running_long = 0, None, False
+        fallback, failure = None, None
+
+        def launch(kind: str) -> bool:
+            nonlocal n_calls
+            if n_calls and (n_calls >= self.max_calls or not self.budget.withdraw()):
+                HEDGE_DENIED.inc(1, kind)
+                return False
+            n_calls += 1
+            self.calls += 1
+            HEDGE_CALLS.inc(1, kind)
+            params = {'temperature': self.temperature} if kind in SAMPLED else {}
+            pending[asyncio.ensure_future(self._call(complete, prompt, params))] = kind
+            return True
+
+        def won(kind: str):
+            self.wins[kind] = self.wins.get(kind, 0) + 1
+            HEDGE_WINS.inc(1, kind)
+
+        launch('first')
+        for _ in range(self.candidates - 1):
+            launch('candidate')
+        if self.percentile > 0:
+            hedge_at = time.perf_counter() + self.hedge_delay()
+        try:
+            while pending:
+                timeout = None if hedge_at is None else max(hedge_at - time.perf_counter(), 0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:  # the first call is running long
+                    hedge_at, running_long = None, True
+                    launch('hedge')
+                    continue
+                replacement = None
+                for task in done:
+                    kind = pending.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        failure, replacement = e, 'retry'
+                        continue
+                    try:
+                        result, clean = accept(text.split('```')[0])
+                    except Exception as e:
+                        failure, replacement = e, 'resample'
+                        continue
+                    if clean:
+                        won(kind)
+                        return Hedged(result, text, kind, True)
+                    fallback = fallback or Hedged(result, text, kind, False)
+                    replacement = 'resample'
+                if replacement and (not pending or running_long):
+                    launch(replacement)
+            if fallback is not None:
+                won('fallback')
+                return fallback
+            raise failure
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        accepted = sum(self.wins.values()) - self.wins.get('fallback', 0)
+        return {
+            'requests': self.requests,
+            'calls': self.calls,
+            'extra_calls_per_request': (self.calls - self.requests) / self.requests if self.requests else 0.0,
+            'wins': dict(self.wins),
+            'hedge_win_rate': (accepted - self.wins.get('first', 0)) / accepted if accepted else 0.0,
+            'budget': round(self.budget.tokens, 2),
+        }
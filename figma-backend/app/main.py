@@ -1,15 +1,29 @@
+import os
+import json
+import logging
 import uvicorn
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi import FastAPI, HTTPException
 from app.format_query import QueryCreator
 from pydantic import BaseModel
-from typing import List, Dict
-import yaml
-from app.utils import get_tl_br_w_h, denormalize_dims
-from app.conversion import apply_scene_diff
+from typing import List, Dict, Optional, Tuple
 from app.types import Scene, UserTextInput
 from app.gpt3 import GPT3
-from app.conversion import figma_to_yaml, yaml_to_figma
+from app.streaming import IncrementalSceneParser, dsl_node_to_figma
+from app.batch import primary_result, is_clean, edit_result, edit_patch_result, ResultPool
+from app.batch import BATCH_MAX_ITEMS, BATCH_CONCURRENCY
+from app.sessions import SceneSessions, StaleSession
+from app.output_budget import BudgetFeatures, budget_features
+from app.context_pruning import edit_context
+from app.warmup import WarmUp, warmup_steps, WARMUP_ENABLED
+from app.tooljet import ToolJetClient, ToolJetError
+from app.dashboard import build_dashboard
+from app import metrics
+from app.metrics import stage, annotate, MetricsMiddleware
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(message)s')  # trace lines are JSON
 
 app = FastAPI()
 
@@ -20,11 +34,64 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, known_paths=lambda: {route.path for route in app.routes})
 
 
+@app.get('/healthcheck')
 @app.post('/healthcheck')
 async def healthcheck():
-    return {'status': 'ok'}
+    """503 until the startup warm-up is done (or has run past WARMUP_TIMEOUT)"""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if warmup.ready else 503)
+
+
+@app.get('/stats')
+async def stats():
+    return {
+        'completion_cache': GPT3.cache.stats(),
+        'coalescing': GPT3.singleflight.stats(),
+        'hedging': GPT3.hedger.stats(),
+        'output_budget': GPT3.budget.stats(),
+    }
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+@app.on_event('startup')
+async def start_warmup():
+    if WARMUP_ENABLED:
+        warmup.start()
+
+
+@app.on_event('shutdown')
+async def close_completion_client():
+    await GPT3.backend.aclose()
+    await tooljet.aclose()
+    ResultPool.shutdown()
+
+
+async def generate_yaml(prompt: str, features: Optional[BudgetFeatures] = None) -> str:
+    """
+    Awaits the completion without blocking other requests; surfaces upstream timeouts as a 504. `features`
+    size the completion's max_tokens (see app.output_budget).
+    """
+    try:
+        with stage('generate'):
+            return await GPT3.agenerate_yaml(prompt, features=features)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Timed out waiting for the completion')
+
+
+async def generate_accepted(prompt: str, accept, features: Optional[BudgetFeatures] = None):
+    """generate_yaml followed by `accept`, with hedged completion calls when enabled (see app.hedging)"""
+    try:
+        with stage('generate'):
+            return await GPT3.agenerate_accepted(prompt, accept, features=features)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail='Timed out waiting for the completion')
 
 
 ########################################################################################################################
@@ -32,6 +99,7 @@ async def healthcheck():
 ########################################################################################################################
 
 query_creator = QueryCreator()
+warmup = WarmUp(warmup_steps(query_creator))
 
 
 class SaveSceneRequest(BaseModel):
@@ -58,52 +126,217 @@ async def save_scene(request: SaveSceneRequest):
 # Primary Query
 ########################################################################################################################
 
+PRIMARY_TL, PRIMARY_WIDTH = (200, 200), 400  # where new scenes are placed on the canvas
 
 
 class PrimaryQuery(BaseModel):
     prompt: UserTextInput
 
 
+def accept_primary(yaml_str: str) -> Tuple[dict, bool]:
+    result = primary_result(yaml_str, PRIMARY_TL, PRIMARY_WIDTH)
+    return result, is_clean(result)
+
+
 @app.post('/convert/primary')
 async def convert_primary(request: PrimaryQuery):
     # if True:
     #     return {'outputScene': example_data}
-    print(f'[CONVERT PRIMARY] Request received: {request.prompt}')
-    primary_prompt = query_creator.format_query_primary(request.prompt)
-    yaml_str = GPT3.generate_yaml(primary_prompt)
-    output_scene = yaml_to_figma(yaml_str, (200, 200), 400)
-    return {
-        'outputScene': output_scene,
-    }
+    annotate(prompt=request.prompt)
+    with stage('format_prompt'):
+        primary_prompt = query_creator.format_query_primary(request.prompt)
+    return await generate_accepted(primary_prompt, accept_primary, budget_features('primary', request.prompt))
+
+
+@app.post('/convert/primary/stream')
+async def convert_primary_stream(request: PrimaryQuery):
+    """
+    Streams NDJSON events: a `node` event for each top-level node as soon as the model has finished it,
+    then a `done` event with the full scene (same as /convert/primary returns), or an `error` event.
+    """
+    annotate(prompt=request.prompt)
+    with stage('format_prompt'):
+        primary_prompt = query_creator.format_query_primary(request.prompt)
+
+    async def events():
+        parser = IncrementalSceneParser()
+        yaml_str, n_nodes = '', 0
+        chunks = GPT3.astream_yaml(primary_prompt)
+        try:
+            async for chunk in chunks:
+                yaml_str += chunk
+                for node in parser.feed(chunk):
+                    yield json.dumps({'event': 'node', 'index': n_nodes,
+                                      'node': dsl_node_to_figma(node, PRIMARY_TL, PRIMARY_WIDTH)}) + '\n'
+                    n_nodes += 1
+            for node in parser.close():
+                yield json.dumps({'event': 'node', 'index': n_nodes,
+                                  'node': dsl_node_to_figma(node, PRIMARY_TL, PRIMARY_WIDTH)}) + '\n'
+                n_nodes += 1
+            yield json.dumps({'event': 'done', **primary_result(yaml_str, PRIMARY_TL, PRIMARY_WIDTH)}) + '\n'
+        except Exception as e:  # the response has already started, so errors have to go in-band
+            yield json.dumps({'event': 'error', 'detail': repr(e)}) + '\n'
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(events(), media_type='application/x-ndjson')
 
 
 ########################################################################################################################
 # Edits
 ########################################################################################################################
 
+sessions = SceneSessions()
+
+
 class EditQuery(BaseModel):
     prompt: UserTextInput
     scene: List[Dict]
+    session: Optional[str] = None  # starts (or restarts) a session that /convert/edit/delta can continue
+
+
+class DeltaEditQuery(BaseModel):
+    prompt: UserTextInput
+    session: str
+    base: str  # `sceneHash` of the session's last response
+    changes: List[Dict] = []  # the user's own edits since then, as scene diff ops in Figma units
 
 
 @app.post('/convert/edit')
 async def convert_edit(request: EditQuery):
     prompt, scene = request.prompt, request.scene
-    print(f'[CONVERT EDIT] Request received: {request.prompt}')
+    annotate(prompt=request.prompt)
     if type(scene) is list:
         scene = scene[0]
-    tl, br, w, h = get_tl_br_w_h(scene)
-    edit_prompt = query_creator.format_query_edit(request.prompt, scene)
-    yaml_str = GPT3.generate_yaml(edit_prompt)
-    js_diff = yaml.safe_load(yaml_str)
-    scene_diffed = apply_scene_diff(scene, js_diff)
-    scene_diffed = denormalize_dims(scene_diffed, tl, w)
+    with stage('format_prompt'):
+        scene_yaml, pruning = edit_context(request.prompt, scene)
+        edit_prompt = query_creator.format_query_edit(request.prompt, scene, scene_yaml)
+    yaml_str = await generate_yaml(edit_prompt, budget_features('edit', request.prompt, scene))
+    result = edit_result(yaml_str, scene, pruning)
+    if request.session:
+        result['sceneHash'] = await sessions.aput(request.session, result['outputScene'][0])
+    return result
+
+
+@app.post('/convert/edit/delta')
+async def convert_edit_delta(request: DeltaEditQuery):
+    """
+    Edits the session's scene without it being sent again. Responds with `patch`, the node-level ops that turn
+    the client's scene into the edited one, the new `sceneHash` and `scene`, the scene that hash is of: the
+    client's next `changes` must be diffed against it, since that is what they will be applied to. 409 means the
+    server no longer has the base scene, so the client should fall back to /convert/edit with the full scene.
+    """
+    annotate(prompt=request.prompt, session=request.session)
+    try:
+        scene = sessions.resolve(request.session, request.base, request.changes)
+    except StaleSession as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    with stage('format_prompt'):
+        scene_yaml, pruning = edit_context(request.prompt, scene)
+        edit_prompt = query_creator.format_query_edit(request.prompt, scene, scene_yaml)
+    yaml_str = await generate_yaml(edit_prompt, budget_features('edit', request.prompt, scene))
+    result = edit_patch_result(yaml_str, scene, pruning)
     return {
-        'outputScene': [scene_diffed],
-        'x': tl[0],
-        'y': tl[1]
+        'patch': result['patch'],
+        'sceneHash': await sessions.aput(request.session, result['scene']),
+        'scene': result['scene'],
+        'repairs': result['repairs'],
+        'dropped': result['dropped'],
     }
 
 
+########################################################################################################################
+# Batches
+########################################################################################################################
+
+class BatchItem(BaseModel):
+    prompt: UserTextInput
+    scene: Optional[List[Dict]] = None  # an edit of this scene; a primary query if absent
+
+
+class BatchQuery(BaseModel):
+    items: List[BatchItem]
+
+
+async def convert_batch_item(item: BatchItem) -> dict:
+    with stage('format_prompt'):
+        if item.scene:
+            scene = item.scene[0]
+            scene_yaml, pruning = edit_context(item.prompt, scene)
+            prompt = query_creator.format_query_edit(item.prompt, scene, scene_yaml)
+            fn, args = edit_result, (scene, pruning)
+            features = budget_features('edit', item.prompt, scene)
+        else:
+            prompt = query_creator.format_query_primary(item.prompt)
+            fn, args = primary_result, (PRIMARY_TL, PRIMARY_WIDTH)
+            features = budget_features('primary', item.prompt)
+    yaml_str = await generate_yaml(prompt, features)
+    with stage('postprocess'):
+        return await asyncio.get_running_loop().run_in_executor(ResultPool.get(), fn, yaml_str, *args)
+
+
+@app.post('/convert/batch')
+async def convert_batch(request: BatchQuery):
+    """
+    Runs many primary / edit queries with bounded concurrency and streams NDJSON back as they finish: a
+    `result` event (the single-item response plus the item's `index`) or an `error` event per item, then `done`.
+    """
+    annotate(batch_items=len(request.items))
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f'At most {BATCH_MAX_ITEMS} items per batch')
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(index: int, item: BatchItem) -> dict:
+        async with semaphore:
+            try:
+                return {'event': 'result', 'index': index, **(await convert_batch_item(item))}
+            except HTTPException as e:
+                return {'event': 'error', 'index': index, 'detail': e.detail}
+            except Exception as e:  # one bad item doesn't fail the batch
+                return {'event': 'error', 'index': index, 'detail': repr(e)}
+
+    async def events():
+        tasks = [asyncio.ensure_future(run(ix, item)) for ix, item in enumerate(request.items)]
+        n_errors = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                event = await next_done
+                n_errors += event['event'] == 'error'
+                yield json.dumps(event) + '\n'
+            yield json.dumps({'event': 'done', 'succeeded': len(tasks) - n_errors, 'failed': n_errors}) + '\n'
+        finally:
+            for task in tasks:  # the client went away
+                task.cancel()
+
+    return StreamingResponse(events(), media_type='application/x-ndjson')
+
+
+########################################################################################################################
+# Text to Dashboard
+########################################################################################################################
+
+tooljet = ToolJetClient()
+
+
+class DashboardQuery(BaseModel):
+    prompt: UserTextInput
+    app: Optional[str] = None  # the `app` of an earlier response, to modify rather than start over
+
+
+@app.post('/dashboard')
+async def dashboard(request: DashboardQuery):
+    """Prompt -> ToolJet app, imported and connected to its database; returns its URL (see app.dashboard)"""
+    annotate(prompt=request.prompt)
+    try:
+        return await build_dashboard(request.prompt, tooljet, generate_yaml, request.app)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ToolJetError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
 if __name__ == "__main__":
+    # development server; production runs several workers via `gunicorn -c gunicorn.conf.py app.main:app`
     uvicorn.run('app.main:app', host="0.0.0.0", port=8081, reload=True, workers=1)
@@ -0,0 +1,206 @@
+"""
+Low-overhead instrumentation: Prometheus-style counters / histograms (rendered by GET /metrics) plus a per-request
+trace that is logged as one JSON line when the response finishes.
+
+    with stage('yaml_parse'):
+        ...
+
+times the block into `t2f_stage_seconds{stage="yaml_parse"}` and the current request's trace. Each server
+process keeps its own registry.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+logger = logging.getLogger('text2figma.trace')
+REGISTRY = []
+
+
+def _labels_text(names: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{k}="{v}"' for k, v in zip(names, values)] + ([extra] if extra else [])
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter(object):
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, *label_values: str):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, total in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels_text(self.labels, values)} {total}')
+        return '\n'.join(lines)
+
+
+class Gauge(Counter):
+    def dec(self, amount: float = 1, *label_values: str):
+        self.inc(-amount, *label_values)
+
+    def render(self) -> str:
+        return super().render().replace(f'# TYPE {self.name} counter', f'# TYPE {self.name} gauge')
+
+
+class Histogram(object):
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._values: Dict[Tuple[str, ...], list] = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values: str):
+        ix = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            counts[ix] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = 'le="' + str(bound) + '"'
+                lines.append(f'{self.name}_bucket{_labels_text(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels_text(self.labels, values)} {counts[-1]}')
+            lines.append(f'{self.name}_count{_labels_text(self.labels, values)} {cumulative}')
+        return '\n'.join(lines)
+
+
+def render() -> str:
+    """The registry in the Prometheus text exposition format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+REQUEST_SECONDS = Histogram('t2f_request_seconds', 'Time to the end of the response body', ('endpoint', 'status'))
+REQUESTS_IN_FLIGHT = Gauge('t2f_requests_in_flight', 'Requests currently being served')
+STAGE_SECONDS = Histogram('t2f_stage_seconds', 'Time spent in each pipeline stage', ('stage',))
+TOKENS = Counter('t2f_tokens_total', 'Tokens sent to / generated by the model', ('kind',))
+TOKENS_PER_CALL = Histogram('t2f_tokens_per_call', 'Tokens per model call', ('kind',), TOKEN_BUCKETS)
+COMPLETION_CACHE = Counter('t2f_completion_cache_total', 'Completion cache lookups', ('result',))
+WARMUP_SECONDS = Gauge('t2f_warmup_seconds', 'Time spent in each startup warm-up step', ('step',))
+MAX_TOKENS = Histogram('t2f_max_tokens', 'max_tokens predicted for a completion', ('kind',), TOKEN_BUCKETS)
+COMPLETION_TRUNCATED = Counter('t2f_completion_truncated_total', 'Completions continued past their predicted budget',
+                               ('kind',))
+HEDGE_CALLS = Counter('t2f_hedge_calls_total', 'Completion calls made by hedged generation, by why', ('kind',))
+HEDGE_WINS = Counter('t2f_hedge_wins_total', 'Hedged generations, by the call whose answer was used', ('kind',))
+HEDGE_DENIED = Counter('t2f_hedge_denied_total', 'Extra calls not made for lack of budget', ('kind',))
+
+
+########################################################################################################################
+# Per-request trace
+########################################################################################################################
+
+class Trace(object):
+    __slots__ = ('request_id', 'path', 'start', 'stages', 'fields')
+
+    def __init__(self, path: str):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.path = path
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.fields: dict = {}
+
+    def log(self, status: int, duration: float):
+        logger.info(json.dumps({
+            'request_id': self.request_id,
+            'path': self.path,
+            'status': status,
+            'ms': round(duration * 1000, 2),
+            'stages_ms': {k: round(v * 1000, 2) for k, v in self.stages.items()},
+            **self.fields,
+        }, default=str))
+
+
+TRACE: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+
+
+def annotate(**fields):
+    """Adds fields to the current request's trace line"""
+    trace = TRACE.get()
+    if trace is not None:
+        trace.fields.update(fields)
+
+
+class stage(object):
+    """Context manager timing a pipeline stage"""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not METRICS_ENABLED:
+            return False
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, self.name)
+        trace = TRACE.get()
+        if trace is not None:
+            trace.stages[self.name] = trace.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def count_tokens(prompt_tokens: int, completion_tokens: int):
+    if not METRICS_ENABLED:
+        return
+    for kind, n in (('prompt', prompt_tokens), ('completion', completion_tokens)):
+        TOKENS.inc(n, kind)
+        TOKENS_PER_CALL.observe(n, kind)
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+class MetricsMiddleware(object):
+    """
+    ASGI middleware that times every HTTP request to the end of its body (streamed responses included) and logs
+    its trace. Paths outside `known_paths()` are counted as `other` to keep label cardinality bounded.
+    """
+
+    def __init__(self, app, known_paths: Callable[[], Set[str]]):
+        self.app = app
+        self.known_paths = known_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        trace = Trace(scope['path'])
+        token = TRACE.set(trace)
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            TRACE.reset(token)
+            duration = time.perf_counter() - trace.start
+            endpoint = scope['path'] if scope['path'] in self.known_paths() else 'other'
+            REQUEST_SECONDS.observe(duration, endpoint, str(status[0]))
+            trace.log(status[0], duration)
@@ -1,3 +1,24 @@
+"""
+Prompts for modifying a ToolJet app (see app.dashboard). With MODIFICATION_FORMAT=full the model re-writes the
+whole app; with `patch` it writes only what changes, as a merge patch (RFC 7386) over the app's YAML, where
+mappings merge, other values replace and null removes a key:
+
+    Queries:
+        Films: SELECT * FROM film ORDER BY release_year DESC
+    Components:
+        ActorsTable: null
+        FilmsTable:
+            layouts:
+                width: 40
+
+The patch prompt's few-shot examples are mod_prompt's, rewritten with `diff_apps` from their before/after pairs.
+"""
+import os
+import re
+import yaml
+from typing import List, NamedTuple
+from app.yaml_codec import load_yaml
+
 mod_prompt = """# Data Schema:
 actor(actor_id, first_name, last_name)
 film(film_id, title, description, release_year, special_features, rating)
@@ -230,4 +251,106 @@ Components:
 """
 
 def format_modification(original_prompt, gpt3_output, modification):
-    return mod_prompt + f'Query: ... \n```{gpt3_output}```' + f'\n\nModification: {modification}\n```'
\ No newline at end of file
+    return mod_prompt + f'Query: ... \n```{gpt3_output}```' + f'\n\nModification: {modification}\n```'
+
+
+########################################################################################################################
+# Patch mode
+########################################################################################################################
+
+MODIFICATION_FORMAT = os.environ.get('MODIFICATION_FORMAT', 'full')  # `full` (re-write the app) or `patch`
+
+PATCH_KEYS = ('Title', 'Queries', 'Components')
+PATCH_INSTRUCTION = '# Modifications are written as patches: only what changes, null to remove a query or component\n'
+EXAMPLE = re.compile(r'Query: (.*?)\n+```(.*?)```\s*Modification: (.*?)\n```(.*?)```', re.DOTALL)
+
+
+try:
+    from yaml import CSafeDumper as _SafeDumper
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper as _SafeDumper
+
+PLAIN_STR = re.compile(r'^[A-Za-z_](?:[\w ,.-]*\w)?$')  # names, words and column lists; written without quotes
+YAML_WORDS = {'y', 'n', 'yes', 'no', 'on', 'off', 'true', 'false', 'null'}  # read as booleans / null by some parser
+
+
+class AppDumper(_SafeDumper):
+    """Writes strings as the examples do: plain names and words, everything else double-quoted"""
+
+    def represent_str(self, data: str):
+        plain = PLAIN_STR.match(data) and data.lower() not in YAML_WORDS \
+            and self.resolve(yaml.ScalarNode, data, (True, False)) == 'tag:yaml.org,2002:str'
+        return self.represent_scalar('tag:yaml.org,2002:str', data, style=None if plain else '"')
+
+
+AppDumper.add_representer(str, AppDumper.represent_str)
+
+
+class ModificationExample(NamedTuple):
+    query: str
+    before: str
+    modification: str
+    after: str
+
+
+def mod_examples(prompt: str = mod_prompt) -> List[ModificationExample]:
+    return [ModificationExample(*match) for match in EXAMPLE.findall(prompt)]
+
+
+def dump_app(data: dict) -> str:
+    """An app or patch as YAML, in the block layout of the examples (and without folding long queries)"""
+    return yaml.dump(data, Dumper=AppDumper, sort_keys=False, indent=4, width=2 ** 16, allow_unicode=True)
+
+
+def diff_apps(before, after):
+    """The merge patch that turns `before` into `after`"""
+    if type(before) is not dict or type(after) is not dict:
+        return after
+    patch = {k: None for k in before if k not in after}
+    for k, v in after.items():
+        if k not in before:
+            patch[k] = v
+        elif before[k] != v:
+            patch[k] = diff_apps(before[k], v)
+    return patch
+
+
+def merge_patch(target, patch):
+    if type(patch) is not dict:
+        return patch
+    merged = dict(target) if type(target) is dict else {}
+    for k, v in patch.items():
+        if v is None:
+            merged.pop(k, None)
+        else:
+            merged[k] = merge_patch(merged.get(k), v)
+    return merged
+
+
+def apply_app_patch(app: dict, patch) -> dict:
+    if patch is None:  # nothing to change
+        return app
+    if type(patch) is not dict or not set(patch) <= set(PATCH_KEYS):
+        raise ValueError(f'Not an app patch: {patch!r:.200}')
+    for key in ('Queries', 'Components'):
+        if patch.get(key) is not None and type(patch[key]) is not dict:
+            raise ValueError(f'Not an app patch: {key} is not a mapping')
+    return merge_patch(app, patch)
+
+
+def make_patch_prompt(prompt: str = mod_prompt) -> str:
+    header = prompt[:prompt.index('---\n')]
+    header += PATCH_INSTRUCTION + '\n---\n\n'
+    shots = []
+    for example in mod_examples(prompt):
+        patch = diff_apps(load_yaml(example.before), load_yaml(example.after))
+        shots.append(f'Query: {example.query}\n\n```{example.before}```\n\n'
+                     f'Modification: {example.modification}\n```\n{dump_app(patch)}```\n')
+    return header + '---\n\n'.join(shots) + '\n'
+
+
+patch_prompt = make_patch_prompt()
+
+
+def format_patch_modification(original_prompt, gpt3_output, modification):
+    return patch_prompt + f'Query: ... \n```{gpt3_output}```' + f'\n\nModification: {modification}\n```'
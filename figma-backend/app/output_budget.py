@@ -0,0 +1,109 @@
+"""
+Per-request `max_tokens`, predicted from the sizes of earlier completions for similar requests: the same kind
+(primary / edit), a scene of about as many leaves, a query of about as many words. Sizes are bucketed by powers
+of two, and a prediction comes from the most specific bucket with OUTPUT_BUDGET_MIN_SAMPLES completions in it
+(none at all, until then: the request gets COMPLETION_PARAMS' max_tokens):
+
+    budget = OUTPUT_BUDGET_QUANTILE of the bucket's completion tokens * OUTPUT_BUDGET_MARGIN + OUTPUT_BUDGET_SLACK
+
+A completion that runs into its budget is continued from where it stopped with the rest of the usual max_tokens
+(see GPT3._acomplete), so a low prediction costs a round trip, never a cut-off scene. Observations are kept
+per process and, with OUTPUT_BUDGET_PATH set, appended to that JSONL file and read back at startup.
+"""
+import os
+import json
+import logging
+import threading
+from collections import deque
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.backends import COMPLETION_PARAMS
+from app.transform import collect_leaves
+from app.types import Scene
+
+OUTPUT_BUDGET_ENABLED = os.environ.get('OUTPUT_BUDGET', '1') != '0'
+OUTPUT_BUDGET_PATH = os.environ.get('OUTPUT_BUDGET_PATH')  # JSONL of observed completion sizes; unset = memory only
+OUTPUT_BUDGET_MIN_SAMPLES = int(os.environ.get('OUTPUT_BUDGET_MIN_SAMPLES', 20))
+OUTPUT_BUDGET_QUANTILE = float(os.environ.get('OUTPUT_BUDGET_QUANTILE', 0.99))
+OUTPUT_BUDGET_MARGIN = float(os.environ.get('OUTPUT_BUDGET_MARGIN', 1.25))
+OUTPUT_BUDGET_SLACK = int(os.environ.get('OUTPUT_BUDGET_SLACK', 16))  # tokens
+OUTPUT_BUDGET_WINDOW = 500  # completions kept per bucket
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetFeatures(NamedTuple):
+    kind: str  # primary / edit
+    leaves: int  # in the scene being edited
+    words: int  # in the user's query
+
+
+def budget_features(kind: str, query: str, scene: Optional[Scene] = None) -> BudgetFeatures:
+    return BudgetFeatures(kind, len(collect_leaves(scene)) if scene else 0, len(query.split()))
+
+
+def size_class(n: int) -> int:
+    return max(n, 0).bit_length()
+
+
+class OutputBudget(object):
+    def __init__(self, path: Optional[str] = OUTPUT_BUDGET_PATH, enabled: bool = OUTPUT_BUDGET_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self.buckets: Dict[Tuple, deque] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def keys(features: BudgetFeatures) -> Tuple[Tuple, ...]:
+        """Most to least specific"""
+        leaves, words = size_class(features.leaves), size_class(features.words)
+        return (features.kind, leaves, words), (features.kind, leaves), (features.kind,)
+
+    @property
+    def ceiling(self) -> int:
+        return COMPLETION_PARAMS['max_tokens']
+
+    def predict(self, features: Optional[BudgetFeatures]) -> Optional[int]:
+        """max_tokens for the request, or None to use the ceiling"""
+        if not self.enabled or features is None:
+            return None
+        for key in self.keys(features):
+            samples = self.buckets.get(key)
+            if samples is not None and len(samples) >= OUTPUT_BUDGET_MIN_SAMPLES:
+                ordered = sorted(samples)
+                quantile = ordered[min(int(len(ordered) * OUTPUT_BUDGET_QUANTILE), len(ordered) - 1)]
+                budget = int(quantile * OUTPUT_BUDGET_MARGIN) + OUTPUT_BUDGET_SLACK
+                return budget if budget < self.ceiling else None
+        return None
+
+    def _add(self, features: BudgetFeatures, tokens: int):
+        for key in self.keys(features):
+            samples = self.buckets.get(key)
+            if samples is None:
+                samples = self.buckets[key] = deque(maxlen=OUTPUT_BUDGET_WINDOW)
+            samples.append(tokens)
+
+    def observe(self, features: Optional[BudgetFeatures], tokens: int):
+        if not self.enabled or features is None:
+            return
+        with self._lock:
+            self._add(features, tokens)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps({**features._asdict(), 'tokens': tokens}) + '\n')
+
+    def load(self, path: str):
+        n_rows = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    self._add(BudgetFeatures(row['kind'], row['leaves'], row['words']), int(row['tokens']))
+                    n_rows += 1
+                except (ValueError, KeyError, TypeError):  # a partly written last line
+                    continue
+        logger.info(f'Output budget: {n_rows} completion sizes from {path}')
+
+    def stats(self) -> dict:
+        return {'enabled': self.enabled, 'observations': sum(len(v) for k, v in self.buckets.items() if len(k) == 1)}
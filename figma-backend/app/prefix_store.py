@@ -0,0 +1,132 @@
+import os
+import json
+import pickle
+import hashlib
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional
+from app.types import Scene, FigmaFrame
+
+STORE_FORMAT = 1  # layout of the persisted file
+
+
+def frame_hash(frame: FigmaFrame, salt: str = '') -> str:
+    """Content hash of a training frame; `salt` covers anything else the rendered fragment depends on"""
+    payload = json.dumps(frame, sort_keys=True, default=str) + salt
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PrefixStore(object):
+    """
+    Persistent store of the compiled prompt prefixes plus the per-frame fragments they were built from,
+    keyed on each frame's content hash so that unchanged frames never need re-rendering.
+
+    Every update bumps `revision`. Writes are atomic (temp file + rename) and happen on a background thread;
+    if several updates queue up, only the latest revision is written.
+
+    The file is the state shared between server processes: `stale` tells whether another process has replaced
+    it since it was last loaded (checked at most every `refresh_interval` seconds). Until it exists, the state is
+    read from `seed_path`, which is never written.
+    """
+
+    def __init__(self, path: str, refresh_interval: float = 1.0, seed_path: Optional[str] = None):
+        self.path = path
+        self.seed_path = seed_path
+        self.refresh_interval = refresh_interval
+        self.revision = 0
+        self.scene: Optional[Scene] = None
+        self.primary_prefix = ''
+        self.edit_prefix = ''
+        self.fragments: Dict[str, dict] = {}  # frame hash -> {'primary': str, 'edit': Optional[str]}
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prefix-store')
+        self._pending: Optional[Future] = None
+        self._written_revision = 0
+        self._file_version = None  # identifies the file last loaded or written by this process
+        self._last_checked = 0.0
+
+    @staticmethod
+    def _version(st: os.stat_result) -> tuple:
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def load(self) -> bool:
+        """Reads the persisted store, or else the seed, if there is one; returns whether anything was loaded"""
+        path = next((p for p in (self.path, self.seed_path) if p and os.path.exists(p) and os.path.getsize(p)), None)
+        if path is None:
+            return False
+        with open(path, 'rb') as f:
+            version = self._version(os.fstat(f.fileno())) if path == self.path else None
+            data = pickle.load(f)
+        with self._lock:
+            self._file_version = version
+            self._last_checked = time.monotonic()
+            self.scene = data['scene']
+            self.primary_prefix = data['primary_prefix']
+            self.edit_prefix = data['edit_prefix']
+            # =====[ Files written before the store existed only have the compiled prefixes ]=====
+            if data.get('format') == STORE_FORMAT:
+                self.revision = data['revision']
+                self.fragments = data['fragments']
+            self._written_revision = self.revision
+        return True
+
+    def stale(self) -> bool:
+        """Whether the file has been replaced by another process since this one last loaded or wrote it"""
+        now = time.monotonic()
+        if now - self._last_checked < self.refresh_interval:
+            return False
+        self._last_checked = now
+        if self._pending is not None and not self._pending.done():
+            return False  # our own update is about to replace it anyway
+        try:
+            version = self._version(os.stat(self.path))
+        except FileNotFoundError:
+            return False
+        return version != self._file_version
+
+    def update(self, scene: Scene, fragments: Dict[str, dict], primary_prefix: str, edit_prefix: str) -> int:
+        """Replaces the stored state and schedules it to be persisted; returns the new revision"""
+        with self._lock:
+            self.revision += 1
+            self.scene = scene
+            self.fragments = fragments
+            self.primary_prefix = primary_prefix
+            self.edit_prefix = edit_prefix
+            self._pending = self._writer.submit(self._write)
+            return self.revision
+
+    def _write(self):
+        with self._lock:
+            if self.revision == self._written_revision:
+                return
+            self._written_revision = self.revision
+            data = {
+                'format': STORE_FORMAT,
+                'revision': self.revision,
+                'scene': self.scene,
+                'primary_prefix': self.primary_prefix,
+                'edit_prefix': self.edit_prefix,
+                'fragments': self.fragments,
+            }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+                version = self._version(os.fstat(f.fileno()))
+            os.replace(tmp_path, self.path)
+            self._file_version = version
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def flush(self):
+        """Blocks until the latest update has been written"""
+        pending = self._pending
+        if pending is not None:
+            pending.result()
@@ -0,0 +1,242 @@
+"""
+Tolerant parsing of the model's YAML.
+
+Completions get cut off at max_tokens mid-node and occasionally contain small slips; rather than failing the
+request (and paying for a retry), we repair what we can and drop only the nodes that can't be salvaged:
+
+    1. unquoted hex colors (`color: #ff0000` is a comment to YAML) are quoted
+    2. if the document doesn't parse: tabs are expanded and stray indentation is snapped to the enclosing block
+    3. while it still doesn't parse: the innermost item (`N:` child or `- ` op) around the error is cut out
+    4. nodes missing their type / geometry are dropped, misplaced `children` are moved under `node`
+
+Everything repaired or dropped is recorded on a `ParseReport`.
+"""
+import re
+import yaml
+from typing import Any, List, Optional, Tuple
+from app.yaml_codec import load_yaml
+from app.scene import GROUP_TYPES
+from app import dsl_format
+
+HEX_COLOR = re.compile(r'^(\s*[A-Za-z_]\w*:[ \t]+)(#[0-9A-Fa-f]{3,8})([ \t]*(?:#.*)?)$')
+ITEM_LINE = re.compile(r'^( *)(?:\d+:\s*$|- )')  # a child in the int-keyed DSL, or an entry of a list
+KEY_LINE = re.compile(r'^ *(?:[A-Za-z_]\w*|\d+):(?: |$)')
+NAME_LINE = re.compile(r'^\s*name:\s*(.+?)\s*$')
+MAX_SALVAGE = 50  # items cut out before giving up on the rest of the document
+OP_KEYS = ('update', 'delete', 'move', 'insert', 'replace')
+
+
+class ParseReport(object):
+    """What the tolerant parser had to change: `repairs` were fixed in place, `dropped` were lost"""
+
+    def __init__(self):
+        self.repairs: List[str] = []
+        self.dropped: List[str] = []
+
+    def as_dict(self) -> dict:
+        return {'repairs': self.repairs, 'dropped': self.dropped}
+
+
+def indent_of(line: str) -> int:
+    return len(line) - len(line.lstrip(' '))
+
+
+########################################################################################################################
+# Text repairs
+########################################################################################################################
+
+def quote_hex_colors(lines: List[str], report: ParseReport) -> List[str]:
+    out = []
+    for ix, line in enumerate(lines):
+        match = HEX_COLOR.match(line) if '#' in line else None
+        if match:
+            line = f"{match.group(1)}'{match.group(2)}'{match.group(3)}"
+            report.repairs.append(f'line {ix + 1}: quoted hex color {match.group(2)}')
+        out.append(line)
+    return out
+
+
+def expand_tabs(lines: List[str], report: ParseReport) -> List[str]:
+    out, n_fixed = [], 0
+    for line in lines:
+        stripped = line.lstrip(' \t')
+        if '\t' in line[:len(line) - len(stripped)]:
+            line = line[:len(line) - len(stripped)].replace('\t', '  ') + stripped
+            n_fixed += 1
+        out.append(line)
+    if n_fixed:
+        report.repairs.append(f'replaced tab indentation on {n_fixed} lines')
+    return out
+
+
+def fix_indentation(lines: List[str], report: ParseReport) -> List[str]:
+    """
+    Snaps keys whose indentation matches no open block to the nearest enclosing one. Deeper lines that don't
+    look like keys are left alone, since they're continuations of folded scalars.
+    """
+    out, stack, opens = [], [], False
+    for ix, line in enumerate(lines):
+        if not line.strip() or line.lstrip().startswith('#'):
+            out.append(line)
+            continue
+        indent = indent_of(line)
+        if not stack or (opens and indent > stack[-1]):
+            stack.append(indent)
+        elif indent > stack[-1] and not KEY_LINE.match(line):
+            out.append(line)
+            continue
+        elif indent not in stack:
+            snapped = max([s for s in stack if s <= indent] or [stack[0]])
+            report.repairs.append(f'line {ix + 1}: re-indented from {indent} to {snapped} spaces')
+            line, indent = ' ' * snapped + line.lstrip(' '), snapped
+        while stack[-1] > indent:
+            stack.pop()
+        opens = line.rstrip().endswith(':')
+        if line.lstrip(' ').startswith('- '):  # a list entry's mapping continues two columns in
+            stack.append(indent + 2)
+        out.append(line)
+    return out
+
+
+########################################################################################################################
+# Salvage
+########################################################################################################################
+
+def error_line(e: yaml.YAMLError, n_lines: int) -> int:
+    """The line to blame; for an unterminated scalar that's where it started, not the end of the document"""
+    mark = getattr(e, 'problem_mark', None)
+    if isinstance(e, yaml.scanner.ScannerError) and e.context_mark is not None:
+        mark = e.context_mark
+    return min(mark.line, n_lines - 1) if mark is not None else n_lines - 1
+
+
+def enclosing_item(lines: List[str], ix: int) -> Optional[Tuple[int, int]]:
+    """[start, end) of the innermost item whose block contains line `ix`, if any"""
+    limit = indent_of(lines[ix]) + 1 if lines[ix].strip() else float('inf')
+    for start in range(ix, -1, -1):
+        if not lines[start].strip() or indent_of(lines[start]) >= limit:
+            continue
+        limit = indent_of(lines[start])
+        if ITEM_LINE.match(lines[start]):
+            end = start + 1
+            while end < len(lines) and (not lines[end].strip() or indent_of(lines[end]) > limit):
+                end += 1
+            return start, end
+    return None
+
+
+def describe(lines: List[str], start: int, end: int) -> str:
+    for line in lines[start:end]:
+        match = NAME_LINE.match(line)
+        if match:
+            return f'{match.group(1)} (lines {start + 1}-{end})'
+    return f'{lines[start].strip()} (lines {start + 1}-{end})'
+
+
+def tolerant_load(text: str, report: ParseReport) -> Any:
+    """`load_yaml` that repairs the text, then cuts out unparseable items until the rest loads"""
+    lines = quote_hex_colors(text.split('\n'), report)
+    try:
+        return load_yaml('\n'.join(lines))
+    except yaml.YAMLError:
+        pass
+    lines = fix_indentation(expand_tabs(lines, report), report)
+    for _ in range(MAX_SALVAGE):
+        try:
+            return load_yaml('\n'.join(lines))
+        except yaml.YAMLError as e:
+            ix = error_line(e, len(lines))
+            item = enclosing_item(lines, ix)
+            if item is None:
+                report.dropped.append(f'everything from line {ix + 1} on')
+                lines = lines[:ix]
+            else:
+                report.dropped.append(describe(lines, *item))
+                del lines[item[0]:item[1]]
+    report.dropped.append('the whole document')
+    return None
+
+
+########################################################################################################################
+# Structural cleanup
+########################################################################################################################
+
+def is_number(x) -> bool:
+    return type(x) in (int, float)
+
+
+def clean_node(node: Any, report: ParseReport) -> Optional[dict]:
+    """The node with its structure repaired, or None if it can't be placed"""
+    if type(node) is not dict or not isinstance(node.get('type'), str):
+        report.dropped.append(f'{node.get("name") if type(node) is dict else node!r}: no type')
+        return None
+    name = node.get('name')
+    if type(node.get('node')) is not dict:
+        report.dropped.append(f'{name}: no node properties')
+        return None
+    if 'children' in node and 'children' not in node['node']:
+        node = {**{k: v for k, v in node.items() if k != 'children'},
+                'node': {**node['node'], 'children': node['children']}}
+        report.repairs.append(f'{name}: moved children under node')
+    inner = node['node']
+    if node['type'] in GROUP_TYPES:
+        return {**node, 'node': {**inner, 'children': clean_children(inner.get('children'), report)}}
+    position = inner.get('position')
+    if type(position) is not dict or not is_number(position.get('x')) or not is_number(position.get('y')) \
+            or not is_number(inner.get('width')) or not is_number(inner.get('height')):
+        report.dropped.append(f'{name}: incomplete geometry')
+        return None
+    if inner.get('children'):
+        report.repairs.append(f'{name}: grouped the children of a {node["type"]} node')
+        return {**node, 'node': {**inner, 'children': clean_children(inner['children'], report)}}
+    return node
+
+
+def clean_children(children: Any, report: ParseReport) -> dict:
+    """Cleans each child and renumbers the survivors"""
+    if type(children) is dict and all(type(k) is int for k in children):
+        children = [v for _, v in sorted(children.items(), key=lambda item: item[0])]
+    if type(children) is not list:
+        return {}
+    cleaned = [clean_node(child, report) for child in children]
+    return {ix: child for ix, child in enumerate(c for c in cleaned if c is not None)}
+
+
+def parse_dsl_yaml(text: str, report: ParseReport = None) -> Any:
+    """Parses a scene from the model; None if nothing could be salvaged"""
+    report = report if report is not None else ParseReport()
+    data = dsl_format.codec.decode_scene(tolerant_load(text, report))
+    if type(data) is dict and data and all(type(k) is int for k in data):
+        return clean_children(data, report) or None
+    if type(data) is list:
+        return clean_children(data, report) or None
+    if data is None:
+        return None
+    return clean_node(data, report)
+
+
+def parse_diff_yaml(text: str, report: ParseReport = None) -> Any:
+    """Parses a scene diff from the model, dropping malformed ops; an empty diff means no changes"""
+    report = report if report is not None else ParseReport()
+    data = tolerant_load(text, report)
+    if type(data) is not list:
+        return data or []  # jsondiff-style diff from an older prefix
+    ops = []
+    for op in data:
+        if type(op) is dict and sum(k in op for k in OP_KEYS) == 1 and valid_op(op):
+            ops.append(op)
+        else:
+            report.dropped.append(f'malformed diff op: {op!r}')
+    return ops
+
+
+def valid_op(op: dict) -> bool:
+    key = next(k for k in OP_KEYS if k in op)
+    path = op[key]
+    if type(path) is not list or not all(type(i) is int for i in path):
+        return False
+    if key in ('insert', 'replace') and type(op.get('node')) is not dict:
+        return False
+    if key in ('insert', 'move') and type(op.get('at' if key == 'insert' else 'to')) is not int:
+        return False
+    return key != 'update' or type(op.get('set', {})) is dict
@@ -0,0 +1,148 @@
+from typing import Any, Callable, List, Optional, Set, Union
+from app.types import Scene, DSLJson
+from app.utils import lists_to_dicts, dicts_to_lists
+
+GROUP_TYPES = ('FRAME', 'GROUP')
+NODE_KEYS = ('name', 'type', 'node')
+
+
+class SceneNode(object):
+    """
+    Compact node of the scene tree used inside the conversion pipeline; dicts are only materialized at the
+    edges (`to_figma` / `to_dsl`).
+
+    `props` is the node's inner `node` dict. Groups and frames keep their children as SceneNodes in
+    `children`, with a placeholder left in `props` so key order survives the round trip. `keys` and `extra`
+    are only set for nodes whose top level isn't exactly name/type/node.
+    """
+    __slots__ = ('name', 'type', 'props', 'children', 'keys', 'extra')
+
+    def __init__(self, name: Optional[str], type: Optional[str], props: Optional[dict],
+                 children: Optional[List['SceneNode']] = None, keys: Optional[tuple] = None,
+                 extra: Optional[dict] = None):
+        self.name = name
+        self.type = type
+        self.props = props
+        self.children = children
+        self.keys = keys
+        self.extra = extra
+
+    def _materialize(self, props: Optional[dict], convert: Callable[[Any], Any] = None) -> dict:
+        if self.keys is None:
+            return {'name': self.name, 'type': self.type, 'node': props}
+        values = {'name': self.name, 'type': self.type, 'node': props}
+        extra = {k: convert(v) for k, v in self.extra.items()} if convert else self.extra
+        return {k: values[k] if k in NODE_KEYS else extra[k] for k in self.keys}
+
+
+SceneTree = Union[SceneNode, List[SceneNode]]
+
+
+def _make_node(d: dict, props: Optional[dict], children: Optional[List[SceneNode]]) -> SceneNode:
+    keys = tuple(d)
+    if keys == NODE_KEYS:
+        return SceneNode(d['name'], d['type'], props, children)
+    extra = {k: v for k, v in d.items() if k not in NODE_KEYS}
+    return SceneNode(d.get('name'), d.get('type'), props, children, keys, extra)
+
+
+########################################################################################################################
+# Parsing
+########################################################################################################################
+
+def from_figma(scene: Scene) -> SceneTree:
+    """Builds a tree from a Figma scene; the input is never mutated"""
+    if type(scene) is list:
+        return [from_figma(x) for x in scene]
+    if scene.get('type') in GROUP_TYPES:
+        props = {k: (None if k == 'children' else v) for k, v in scene['node'].items()}
+        return _make_node(scene, props, [from_figma(c) for c in scene['node']['children']])
+    node = scene.get('node')
+    return _make_node(scene, dict(node) if node is not None else None, None)
+
+
+def _as_list(x):
+    """One level of `dicts_to_lists`: an int-keyed dict becomes the list of its values, in key order"""
+    if type(x) is dict and all(type(k) is int for k in x):
+        return [v for _, v in sorted(x.items(), key=lambda item: item[0])]
+    return x
+
+
+def from_dsl(scene: DSLJson) -> SceneTree:
+    """
+    Builds a tree from parsed DSL (int-keyed dicts instead of lists). Non-group nodes that came back with
+    children become a group of the node followed by its children, like `extract_children` does.
+    """
+    scene = _as_list(scene)
+    if type(scene) is list:
+        return [from_dsl(x) for x in scene]
+    inner = scene['node']
+    if scene.get('type') in GROUP_TYPES:
+        props = {k: (None if k == 'children' else dicts_to_lists(v)) for k, v in inner.items()}
+        return _make_node(scene, props, [from_dsl(c) for c in _as_list(inner['children'])])
+    props = {k: dicts_to_lists(v) for k, v in inner.items()}
+    if not props.get('children'):
+        return _make_node(scene, props, None)
+    children = props.pop('children')
+    leaf = _make_node(scene, props, None)
+    group_children = [leaf, *[from_dsl(c) for c in children]]
+    return SceneNode(f'{scene.get("name")} Group', 'GROUP', {'children': None}, group_children)
+
+
+########################################################################################################################
+# Traversal & Materialization
+########################################################################################################################
+
+def leaves(tree: SceneTree) -> List[SceneNode]:
+    """Every non-group node, in document order"""
+    out, stack = [], [tree]
+    while stack:
+        x = stack.pop()
+        if type(x) is list:
+            stack.extend(reversed(x))
+        elif x.children is not None:
+            stack.extend(reversed(x.children))
+        else:
+            out.append(x)
+    return out
+
+
+def to_figma(tree: SceneTree) -> Scene:
+    """Materializes the tree as Figma dicts (children as lists)"""
+    if type(tree) is list:
+        return [to_figma(x) for x in tree]
+    if tree.children is None:
+        return tree._materialize(tree.props)
+    children = [to_figma(c) for c in tree.children]
+    return tree._materialize({k: (children if k == 'children' else v) for k, v in tree.props.items()})
+
+
+def to_dsl(tree: SceneTree) -> DSLJson:
+    """Materializes the tree as DSL dicts (every list becomes an int-keyed dict)"""
+    if type(tree) is list:
+        return {ix: to_dsl(x) for ix, x in enumerate(tree)}
+    if tree.children is None:
+        props = {k: lists_to_dicts(v) for k, v in tree.props.items()} if tree.props is not None else None
+        return tree._materialize(props, lists_to_dicts)
+    children = {ix: to_dsl(c) for ix, c in enumerate(tree.children)}
+    props = {k: (children if k == 'children' else lists_to_dicts(v)) for k, v in tree.props.items()}
+    return tree._materialize(props, lists_to_dicts)
+
+
+def to_dsl_subset(tree: SceneTree, shown: Set[tuple]) -> DSLJson:
+    """
+    Like `to_dsl`, but only with the nodes at `shown` (child-index paths, drawn whole) and the groups on the way
+    to them. Children keep their indices in `tree`, so the keys skip over what was left out.
+    """
+    drawn = {p[:i] for p in shown for i in range(len(p) + 1)}
+
+    def subset(x: SceneTree, path: tuple) -> DSLJson:
+        if path in shown:
+            return to_dsl(x)
+        if type(x) is list:
+            return {ix: subset(c, (*path, ix)) for ix, c in enumerate(x) if (*path, ix) in drawn}
+        children = {ix: subset(c, (*path, ix)) for ix, c in enumerate(x.children) if (*path, ix) in drawn}
+        props = {k: (children if k == 'children' else lists_to_dicts(v)) for k, v in x.props.items()}
+        return x._materialize(props, lists_to_dicts)
+
+    return subset(tree, ())
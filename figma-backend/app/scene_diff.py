@@ -0,0 +1,247 @@
+"""
+Scene-aware diff/patch over scene trees.
+
+Children are matched by name/type (nearest geometry breaks ties, then same-type nodes at nearly the same
+geometry are matched as renames), so inserting or reordering a node doesn't misalign its siblings the way
+an index-keyed diff does. A diff is a list of ops; paths are child indices into the *original* scene, and
+`at` / `to` are indices in the patched parent:
+
+    - {update: [0, 2], set: {cornerRadius: 10, position: {x: 3}}}
+    - {update: [0, 3], name: Cancel Text, unset: [dropShadow]}
+    - {move: [0, 1], to: 3}
+    - {delete: [0, 4]}
+    - {insert: [0], at: 5, node: {name: ..., type: ..., node: {...}}}
+
+`set` merges into nested dicts (so `position: {x: 3}` leaves y alone).
+"""
+import yaml
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+from app.scene import SceneNode, SceneTree, from_dsl, to_dsl, leaves
+from app.utils import lists_to_dicts, dicts_to_lists
+
+Path = Tuple[int, ...]
+Op = dict
+EncodeProps = Optional[Callable[[dict], dict]]
+
+RENAME_DISTANCE = 10  # max geometry distance (normalized units) for matching same-type nodes with new names
+
+
+def geometry(node: SceneNode) -> Tuple[float, float, float, float]:
+    """(x, y, width, height); the bbox of the leaves for groups"""
+    if node.children is not None:
+        boxes = [geometry(leaf) for leaf in leaves(node) if leaf is not node]
+        if not boxes:
+            return 0, 0, 0, 0
+        x0, y0 = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        x1, y1 = max(b[0] + b[2] for b in boxes), max(b[1] + b[3] for b in boxes)
+        return x0, y0, x1 - x0, y1 - y0
+    props = node.props or {}
+    position = props.get('position') or {}
+    return position.get('x', 0), position.get('y', 0), props.get('width', 0), props.get('height', 0)
+
+
+def distance(a: SceneNode, b: SceneNode) -> float:
+    return sum(abs(x - y) for x, y in zip(geometry(a), geometry(b)))
+
+
+########################################################################################################################
+# Diff
+########################################################################################################################
+
+def diff_values(a, b) -> Tuple[dict, list]:
+    """`set` and `unset` that turn dict a into dict b, recursing into nested dicts"""
+    set_, unset = {}, [k for k in a if k not in b]
+    for k, v in b.items():
+        if k not in a:
+            set_[k] = v
+        elif a[k] != v:
+            if type(a[k]) is dict and type(v) is dict and all(k2 in v for k2 in a[k]):
+                set_[k] = diff_values(a[k], v)[0]
+            else:
+                set_[k] = v
+    return set_, unset
+
+
+def match_children(a: List[SceneNode], b: List[SceneNode]) -> Dict[int, int]:
+    """Maps indices of b to indices of a"""
+    by_key: Dict[tuple, List[int]] = {}
+    for i, node in enumerate(a):
+        by_key.setdefault((node.name, node.type), []).append(i)
+    matched, used = {}, set()
+
+    # =====[ Same name & type; nearest geometry wins ]=====
+    for j, node in enumerate(b):
+        candidates = [i for i in by_key.get((node.name, node.type), []) if i not in used]
+        if candidates:
+            i = candidates[0] if len(candidates) == 1 else min(candidates, key=lambda i: distance(a[i], node))
+            matched[j] = i
+            used.add(i)
+
+    # =====[ Same type at (nearly) the same place: a rename ]=====
+    for j, node in enumerate(b):
+        if j in matched:
+            continue
+        candidates = [i for i, x in enumerate(a) if i not in used and x.type == node.type
+                      and distance(x, node) <= RENAME_DISTANCE]
+        if candidates:
+            i = min(candidates, key=lambda i: distance(a[i], node))
+            matched[j] = i
+            used.add(i)
+    return matched
+
+
+def longest_increasing(seq: List[int]) -> set:
+    """Values of a longest strictly increasing subsequence (patience sorting, O(n log n))"""
+    tails, tails_ix, prev = [], [], [None] * len(seq)
+    for ix, value in enumerate(seq):
+        pos = bisect_left(tails, value)
+        if pos == len(tails):
+            tails.append(value)
+            tails_ix.append(ix)
+        else:
+            tails[pos] = value
+            tails_ix[pos] = ix
+        prev[ix] = tails_ix[pos - 1] if pos else None
+    out, ix = set(), tails_ix[-1] if tails_ix else None
+    while ix is not None:
+        out.add(seq[ix])
+        ix = prev[ix]
+    return out
+
+
+def diff_children(a: List[SceneNode], b: List[SceneNode], path: Path, ops: List[Op],
+                  encode_props: EncodeProps = None):
+    matched = match_children(a, b)
+    kept = longest_increasing([matched[j] for j in range(len(b)) if j in matched])
+    matched_a = set(matched.values())
+    for i in range(len(a)):
+        if i not in matched_a:
+            ops.append({'delete': [*path, i]})
+    for j, node in enumerate(b):
+        if j not in matched:
+            ops.append({'insert': list(path), 'at': j, 'node': to_dsl(node)})
+        else:
+            i = matched[j]
+            if i not in kept:
+                ops.append({'move': [*path, i], 'to': j})
+            diff_nodes(a[i], node, (*path, i), ops, encode_props)
+
+
+def diff_nodes(a: SceneNode, b: SceneNode, path: Path, ops: List[Op], encode_props: EncodeProps = None):
+    op = {'update': list(path)}
+    if a.name != b.name:
+        op['name'] = b.name
+    props_a = {k: v for k, v in (a.props or {}).items() if k != 'children' or a.children is None}
+    props_b = {k: v for k, v in (b.props or {}).items() if k != 'children' or b.children is None}
+    if encode_props is not None:
+        props_a, props_b = encode_props(props_a), encode_props(props_b)
+    set_, unset = diff_values(props_a, props_b)
+    if set_:
+        op['set'] = set_ if encode_props is not None else lists_to_dicts(set_)
+    if unset:
+        op['unset'] = unset
+    if len(op) > 1:
+        ops.append(op)
+    if a.children is not None:
+        diff_children(a.children, b.children, path, ops, encode_props)
+
+
+def diff_trees(a: SceneTree, b: SceneTree, encode_props: EncodeProps = None) -> List[Op]:
+    """`encode_props` maps a node's props to the form `set` / `unset` are written in (see app.dsl_format)"""
+    ops = []
+    if type(a) is list and type(b) is list:
+        diff_children(a, b, (), ops, encode_props)
+    elif type(a) is SceneNode and type(b) is SceneNode and a.type == b.type:
+        diff_nodes(a, b, (), ops, encode_props)
+    else:
+        ops.append({'replace': [], 'node': to_dsl(b)})
+    return ops
+
+
+########################################################################################################################
+# Patch
+########################################################################################################################
+
+def merge(target: dict, changes: dict):
+    for k, v in changes.items():
+        if type(v) is dict and type(target.get(k)) is dict:
+            target[k] = dict(target[k])
+            merge(target[k], v)
+        else:
+            target[k] = v
+
+
+class Patch(object):
+    """Ops indexed by path, so they can all be applied in one walk of the tree"""
+
+    def __init__(self, ops: List[Op]):
+        self.updates: Dict[Path, Op] = {}
+        self.deletes = set()
+        self.moves: Dict[Path, int] = {}
+        self.inserts: Dict[Path, List[Tuple[int, dict]]] = {}
+        self.replace: Optional[dict] = None
+        for op in ops:
+            if 'update' in op:
+                self.updates[tuple(op['update'])] = op
+            elif 'delete' in op:
+                self.deletes.add(tuple(op['delete']))
+            elif 'move' in op:
+                self.moves[tuple(op['move'])] = op['to']
+            elif 'insert' in op:
+                self.inserts.setdefault(tuple(op['insert']), []).append((op['at'], op['node']))
+            elif 'replace' in op:
+                self.replace = op['node']
+            else:
+                raise ValueError(f'Unknown diff op: {op}')
+
+    def apply_children(self, children: List[SceneNode], path: Path) -> List[SceneNode]:
+        survivors = [(i, c) for i, c in enumerate(children) if (*path, i) not in self.deletes]
+        inserts = self.inserts.get(path, [])
+        out: List[Optional[SceneNode]] = [None] * (len(survivors) + len(inserts))
+        for at, node in inserts:
+            if not 0 <= at < len(out) or out[at] is not None:
+                raise ValueError(f'Bad insert position {at} under {list(path)}')
+            out[at] = from_dsl(node)
+        rest = []
+        for i, child in survivors:
+            child = self.apply_node(child, (*path, i))
+            to = self.moves.get((*path, i))
+            if to is None:
+                rest.append(child)
+            elif not 0 <= to < len(out) or out[to] is not None:
+                raise ValueError(f'Bad move target {to} under {list(path)}')
+            else:
+                out[to] = child
+        rest_iter = iter(rest)
+        return [x if x is not None else next(rest_iter) for x in out]
+
+    def apply_node(self, node: SceneNode, path: Path) -> SceneNode:
+        op = self.updates.get(path)
+        if op is not None:
+            node = SceneNode(op.get('name', node.name), node.type, dict(node.props or {}), node.children,
+                             node.keys, node.extra)
+            if op.get('set'):
+                merge(node.props, dicts_to_lists(op['set']))
+            for k in op.get('unset') or []:
+                node.props.pop(k, None)
+        if node.children is not None:
+            node = SceneNode(node.name, node.type, node.props, self.apply_children(node.children, path),
+                             node.keys, node.extra)
+        return node
+
+    def apply(self, tree: SceneTree) -> SceneTree:
+        if self.replace is not None:
+            return from_dsl(self.replace)
+        if type(tree) is list:
+            return self.apply_children(tree, ())
+        return self.apply_node(tree, ())
+
+
+def is_ops_diff(diff) -> bool:
+    """Tells the op-list format apart from jsondiff's nested dicts (still found in older prefixes)"""
+    return type(diff) is list
+
+
+def dump_ops(ops: List[Op]) -> str:
+    return yaml.dump(ops, sort_keys=False, default_flow_style=None, width=float('inf'))
@@ -0,0 +1,61 @@
+"""
+Edit sessions: the last scene the server produced (or was sent) for each plugin session, under its content hash,
+so that follow-up edits only need to send the hash plus whatever the user changed by hand since.
+"""
+import os
+import json
+from typing import List, Optional
+from app.cache import CompletionCache
+from app.conversion import patch_figma
+from app.prefix_store import frame_hash
+from app.repair import OP_KEYS, valid_op
+from app.scene_diff import Op
+from app.types import FigmaNode
+
+SESSION_STORE_SIZE = int(os.environ.get('SESSION_STORE_SIZE', 256))  # sessions kept in memory per process
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 3600))  # seconds since the session's last edit
+SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH')  # SQLite file shared by workers; unset = memory only
+
+
+def scene_hash(scene: FigmaNode) -> str:
+    return frame_hash(scene)
+
+
+class StaleSession(LookupError):
+    """The session is unknown, expired, or its scene isn't the one the client based its edit on"""
+
+
+class SceneSessions(object):
+    """Session id -> (scene hash, scene), in an LRU / SQLite store like the completion cache's"""
+
+    def __init__(self, max_entries: int = SESSION_STORE_SIZE, ttl: float = SESSION_TTL,
+                 db_path: Optional[str] = SESSION_STORE_PATH):
+        self.store = CompletionCache(max_entries=max_entries, ttl=ttl, db_path=db_path, table='sessions')
+
+    def put(self, session: str, scene: FigmaNode) -> str:
+        """Records `scene` as the session's current scene; returns its hash"""
+        key = scene_hash(scene)
+        self.store.set(session, json.dumps({'hash': key, 'scene': scene}))
+        return key
+
+    async def aput(self, session: str, scene: FigmaNode) -> str:
+        """`put` for the event loop"""
+        key = scene_hash(scene)
+        await self.store.aset(session, json.dumps({'hash': key, 'scene': scene}))
+        return key
+
+    def get(self, session: str, base: str) -> FigmaNode:
+        """The session's scene, provided it's still the one hashed `base`"""
+        raw = self.store.get(session)
+        entry = json.loads(raw) if raw is not None else None
+        if entry is None or entry['hash'] != base:
+            raise StaleSession(f'Session {session} has no scene {base[:12]}; send the full scene')
+        return entry['scene']
+
+    def resolve(self, session: str, base: str, changes: List[Op]) -> FigmaNode:
+        """The scene the client has now: the stored one with the client's own `changes` applied"""
+        scene = self.get(session, base)
+        for op in changes:
+            if type(op) is not dict or sum(k in op for k in OP_KEYS) != 1 or not valid_op(op):
+                raise ValueError(f'Malformed change: {op!r}')
+        return patch_figma(scene, changes) if changes else scene
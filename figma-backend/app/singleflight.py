@@ -0,0 +1,41 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls that share a key onto a single in-flight task; every caller gets its result.
+    The shared task is shielded, so a caller that gets cancelled (e.g. the client disconnected) only stops
+    waiting - the call carries on for everyone else.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.upstream_calls = 0
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved, in case every waiter was cancelled
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'upstream_calls': self.upstream_calls,
+            'saved_upstream_calls': self.calls - self.upstream_calls,
+            'in_flight': len(self._in_flight),
+        }
@@ -0,0 +1,72 @@
+import re
+from typing import List, Optional
+from app.types import Coord, DSLNode, Scene
+from app.conversion import json_dsl_to_placed_figma
+from app.repair import parse_dsl_yaml
+
+ITEM_KEY = re.compile(r'^( *)(\d+):\s*$')  # `lists_to_dicts` turns children into `0:`, `1:`, ... keys
+
+
+class IncrementalSceneParser(object):
+    """
+    Consumes the YAML DSL chunk by chunk and returns each top-level child node as soon as it is closed,
+    i.e. as soon as the next sibling (or anything shallower) starts.
+
+    The top-level children are the entries under the first int-keyed mapping in the document - the root
+    group's `children` in a primary completion.
+    """
+
+    def __init__(self):
+        self.partial_line = ''
+        self.item_indent: Optional[int] = None
+        self.item_lines: List[str] = []
+        self.finished = False  # set once we've left the top-level children
+
+    def _close_item(self) -> List[DSLNode]:
+        lines, self.item_lines = self.item_lines, []
+        if not lines:
+            return []
+        parsed = parse_dsl_yaml('\n'.join(lines))  # what gets dropped is reported with the full document
+        if type(parsed) is not dict or len(parsed) != 1:
+            return []
+        return [list(parsed.values())[0]]
+
+    def _feed_line(self, line: str) -> List[DSLNode]:
+        if self.finished or not line.strip():
+            if self.item_lines:
+                self.item_lines.append(line)
+            return []
+        indent = len(line) - len(line.lstrip(' '))
+        match = ITEM_KEY.match(line)
+        if self.item_indent is None:
+            if match:
+                self.item_indent = indent
+                self.item_lines = [line]
+            return []
+        if match and indent == self.item_indent:
+            closed = self._close_item()
+            self.item_lines = [line]
+            return closed
+        if indent <= self.item_indent:
+            self.finished = True
+            return self._close_item()
+        self.item_lines.append(line)
+        return []
+
+    def feed(self, text: str) -> List[DSLNode]:
+        """Adds generated text; returns the DSL nodes that were completed by it"""
+        lines = (self.partial_line + text).split('\n')
+        self.partial_line = lines.pop()
+        return [node for line in lines for node in self._feed_line(line)]
+
+    def close(self) -> List[DSLNode]:
+        """End of the document; returns the last node if it parses"""
+        nodes = self._feed_line(self.partial_line) if self.partial_line else []
+        self.partial_line = ''
+        self.finished = True
+        return nodes + self._close_item()
+
+
+def dsl_node_to_figma(node: DSLNode, tl: Coord, w: int) -> Scene:
+    """Same treatment `yaml_to_figma` gives the whole scene, applied to a single node"""
+    return json_dsl_to_placed_figma(node, tl, w)
@@ -0,0 +1,172 @@
+import os
+import numpy as np
+from copy import deepcopy
+from typing import List, Optional, Tuple, Sequence
+from app.types import Coord, Scene
+
+Affine = Tuple[float, float, float]  # (x, y, scale): x_orig = (x_orig + x) * scale
+Columns = Tuple[List[list], 'np.ndarray']  # (x, y, width, height, fontSize) as lists, and as float64 rows
+
+# scenes with fewer leaves than this use the loops: numpy's per-call overhead doesn't pay off below it
+VECTORIZE_MIN_LEAVES = int(os.environ.get('VECTORIZE_MIN_LEAVES', 128))
+EXACT_FLOAT = 2.0 ** 52  # below this, float64 sums of ints are exact, so the vectorized results match Python's
+
+
+def collect_leaves(scene: Scene) -> List[dict]:
+    """Every non-group node in the scene, in document order (each distinct node once)"""
+    leaves, seen, stack = [], set(), [scene]
+    while stack:
+        x = stack.pop()
+        if type(x) is list:
+            stack.extend(reversed(x))
+        elif x.get('type') in ('FRAME', 'GROUP'):
+            stack.extend(reversed(x['node']['children']))
+        elif id(x) not in seen:
+            seen.add(id(x))
+            leaves.append(x)
+    return leaves
+
+
+########################################################################################################################
+# Vectorized geometry
+########################################################################################################################
+
+def gather(nodes: Sequence[dict]) -> Optional[Columns]:
+    """
+    The leaves' geometry as columns, or None (use the loops) if there are few leaves, or some value isn't a plain
+    finite int / float small enough for float64 to reproduce Python's arithmetic
+    """
+    if len(nodes) < VECTORIZE_MIN_LEAVES:
+        return None
+    try:
+        columns = [[node['position']['x'] for node in nodes], [node['position']['y'] for node in nodes],
+                   [node['width'] for node in nodes], [node['height'] for node in nodes],
+                   [node.get('fontSize') or 0 for node in nodes]]
+        rows = np.array(columns)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        return None  # malformed: the loops raise as they always have
+    if rows.dtype.kind not in 'if':  # strings, None, bools, ints beyond int64
+        return None
+    rows = rows.astype(np.float64, copy=False)
+    if not np.isfinite(rows).all() or np.abs(rows).max() >= EXACT_FLOAT:
+        return None
+    return columns, rows
+
+
+def columns_tlbr(columns: Columns) -> Tuple[Coord, Coord]:
+    """`leaves_tlbr` over gathered columns; picks the same (first) extreme node, so types match too"""
+    (xs, ys, widths, heights, _), rows = columns
+    i, j = int(rows[0].argmin()), int(rows[1].argmin())
+    k, l = int((rows[0] + rows[2]).argmax()), int((rows[1] + rows[3]).argmax())
+    return (xs[i], ys[j]), (xs[k] + widths[k], ys[l] + heights[l])
+
+
+def columns_affines(rows: 'np.ndarray', affines: Sequence[Affine]) -> Optional['np.ndarray']:
+    """The affines applied to gathered rows with `apply_affines`' truncation; None if a value leaves exact range"""
+    px, py, width, height, font_size = rows
+    for x, y, scale in affines:
+        px, py = np.trunc((px + x) * scale), np.trunc((py + y) * scale)
+        font_size = np.trunc(scale * font_size)  # (falsy font sizes stay 0, as the loop skips them)
+        width, height = np.trunc(scale * width), np.trunc(scale * height)
+        out = np.array([px, py, width, height, font_size])
+        if not np.isfinite(out).all() or np.abs(out).max() >= EXACT_FLOAT:
+            return None
+    return np.array([px, py, width, height, font_size])
+
+
+def scatter(nodes: Sequence[dict], rows: 'np.ndarray'):
+    """Writes transformed rows back into the leaves, as `apply_affines` would"""
+    for node, x, y, width, height, font_size in zip(nodes, *rows.astype(np.int64).tolist()):
+        node['position'] = {'x': x, 'y': y}
+        if node.get('fontSize'):
+            node['fontSize'] = font_size
+        node['width'], node['height'] = width, height
+
+
+########################################################################################################################
+# Leaves
+########################################################################################################################
+
+def leaves_tlbr(nodes: Sequence[dict], columns: Optional[Columns] = None) -> Tuple[Coord, Coord]:
+    """Bounding box of the leaves' inner `node` dicts; same as `get_tlbr` on the scene they came from"""
+    if not nodes:
+        raise ValueError('Scene has no leaf nodes')
+    if columns is not None:  # (gathering just for the bbox costs more than the loop)
+        return columns_tlbr(columns)
+    x0 = x1 = nodes[0]['position']['x']
+    y0 = y1 = nodes[0]['position']['y']
+    x1, y1 = x1 + nodes[0]['width'], y1 + nodes[0]['height']
+    for node in nodes:
+        x, y = node['position']['x'], node['position']['y']
+        if x < x0:
+            x0 = x
+        if y < y0:
+            y0 = y
+        if x + node['width'] > x1:
+            x1 = x + node['width']
+        if y + node['height'] > y1:
+            y1 = y + node['height']
+    return (x0, y0), (x1, y1)
+
+
+def apply_affines(nodes: Sequence[dict], affines: Sequence[Affine], columns: Optional[Columns] = None):
+    """
+    Applies the affines to the leaves' inner `node` dicts in place, in order. Equivalent to chaining
+    `affine_trans` once per affine, including its int() truncation after every step.
+    """
+    columns = columns or gather(nodes)
+    rows = columns_affines(columns[1], affines) if columns is not None else None
+    if rows is not None:
+        scatter(nodes, rows)
+        return
+    for node in nodes:
+        px, py = node['position']['x'], node['position']['y']
+        font_size = node.get('fontSize')
+        width, height = node['width'], node['height']
+        for x, y, scale in affines:
+            px, py = int((px + x) * scale), int((py + y) * scale)
+            if font_size:
+                font_size = int(scale * font_size)
+            width, height = int(scale * width), int(scale * height)
+        node['position'] = {'x': px, 'y': py}
+        if node.get('fontSize'):
+            node['fontSize'] = font_size
+        node['width'], node['height'] = width, height
+
+
+def normalize_nodes(nodes: Sequence[dict], output_width: float):
+    """Translates the leaves' bbox to (0, 0) and scales it to `output_width`, in place"""
+    columns = gather(nodes)
+    tl, br = leaves_tlbr(nodes, columns)
+    scale = output_width / float(br[0] - tl[0])
+    apply_affines(nodes, [(-tl[0], -tl[1], 1.0), (0, 0, scale)], columns)
+
+
+def denormalize_nodes(nodes: Sequence[dict], tl: Coord, w: int, output_width: float):
+    """Inverse of `normalize_nodes` given the original top-left and width, in place"""
+    scale = float(w) / output_width
+    apply_affines(nodes, [(0.0, 0.0, scale), (tl[0], tl[1], 1.0)])
+
+
+def transform_scene(scene: Scene, affines: Sequence[Affine], inplace: bool = False) -> Scene:
+    """Applies a chain of affines in one pass; copies the scene once up front unless `inplace`"""
+    if not inplace:
+        scene = deepcopy(scene)
+    apply_affines([leaf['node'] for leaf in collect_leaves(scene)], affines)
+    return scene
+
+
+def normalize_scene(scene: Scene, output_width: float, inplace: bool = False) -> Scene:
+    """Translates the scene's bbox to (0, 0) and scales it to `output_width`, with a single traversal"""
+    if not inplace:
+        scene = deepcopy(scene)
+    normalize_nodes([leaf['node'] for leaf in collect_leaves(scene)], output_width)
+    return scene
+
+
+def denormalize_scene(scene: Scene, tl: Coord, w: int, output_width: float, inplace: bool = False) -> Scene:
+    """Inverse of `normalize_scene` given the original top-left and width"""
+    if not inplace:
+        scene = deepcopy(scene)
+    denormalize_nodes([leaf['node'] for leaf in collect_leaves(scene)], tl, w, output_width)
+    return scene
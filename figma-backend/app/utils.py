@@ -3,6 +3,7 @@ from copy import deepcopy
 from jsondiff import diff
 from typing import List, Tuple
 from app.types import Coord, Scene, FigmaNode, FigmaFrame
+from app.transform import transform_scene, normalize_scene, denormalize_scene, collect_leaves, leaves_tlbr
 
 OUTPUT_WIDTH = 100.0
 
@@ -17,19 +18,8 @@ def coord_minmax(tlbrs: List[Tuple[Coord, Coord]]):
 
 
 def get_tlbr(x: Scene):
-    if type(x) is list:
-        return coord_minmax([get_tlbr(y) for y in x])
-    elif x['type'] == 'FRAME':
-        return coord_minmax([get_tlbr(y) for y in x['node']['children']])
-    elif x['type'] == 'GROUP':
-        return coord_minmax([get_tlbr(y) for y in x['node']['children']])
-    else:
-        pos = x['node']['position']
-        tl, br = (
-            (pos['x'], pos['y']),
-            (pos['x'] + x['node']['width'], pos['y'] + x['node']['height'])
-        )
-        return tl, br
+    """Bounding box of the scene's leaves, as ((x0, y0), (x1, y1))"""
+    return leaves_tlbr([leaf['node'] for leaf in collect_leaves(x)])
 
 
 def get_tl_br_w_h(scene: Scene):
@@ -41,40 +31,17 @@ def get_tl_br_w_h(scene: Scene):
 
 def affine_trans(scene: Scene, x=0.0, y=0.0, scale: float = 1.0):
     """translates all coords and dimensions by x_orig = (x_orig + x) * scale"""
-    scene = deepcopy(scene)
-    if type(scene) is list:
-        return [affine_trans(node, x=x, y=y, scale=scale) for node in scene]
-    elif scene.get('type') in ('FRAME', 'GROUP'):
-        scene['node']['children'] = [affine_trans(child, x=x, y=y, scale=scale) for child in scene['node']['children']]
-        return scene
-    else:
-        position = scene['node']['position']
-        scene['node']['position'] = {
-            'x': int((position['x'] + x) * scale),
-            'y': int((position['y'] + y) * scale)
-        }
-        if scene['node'].get('fontSize'):
-            scene['node']['fontSize'] = int(scale * scene['node']['fontSize'])
-        scene['node']['width'] = int(scale * scene['node']['width'])
-        scene['node']['height'] = int(scale * scene['node']['height'])
-        return scene
-
-
-def normalize_dims(scene):
+    return transform_scene(scene, [(x, y, scale)])
+
+
+def normalize_dims(scene, inplace: bool = False):
     """Scales everything to (100, 100) and translates to (0, 0)"""
-    tl, br, w, h = get_tl_br_w_h(scene)
-    scale = OUTPUT_WIDTH / float(w)
-    scene_ = affine_trans(scene, x=-tl[0], y=-tl[1])  # translate to (0, 0)
-    scene_ = affine_trans(scene_, x=0, y=0, scale=scale)  # scale to width = 100
-    return scene_
+    return normalize_scene(scene, OUTPUT_WIDTH, inplace=inplace)
 
 
-def denormalize_dims(scene: Scene, tl: Coord, w: int):
+def denormalize_dims(scene: Scene, tl: Coord, w: int, inplace: bool = False):
     """Scales everything back to original dimensions and translates back to original position"""
-    scale = float(w) / OUTPUT_WIDTH
-    scene_ = affine_trans(scene, scale=scale)
-    scene_ = affine_trans(scene_, x=tl[0], y=tl[1])
-    return scene_
+    return denormalize_scene(scene, tl, w, OUTPUT_WIDTH, inplace=inplace)
 
 
 def get_primary_and_edit_example(frame: FigmaFrame) -> Tuple[FigmaNode, FigmaNode]:
@@ -0,0 +1,95 @@
+"""
+Startup warm-up: loads the prompt prefixes and runs the conversion pipeline once, on a background thread, so that
+the first requests after a deploy don't pay for it. /healthcheck reports `warming` until it's done.
+
+Warm-up is bounded: past WARMUP_TIMEOUT seconds the server reports ready anyway (cold) while warm-up finishes.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from app.format_query import QueryCreator
+from app.conversion import figma_to_yaml, get_scene_diff
+from app.scene_diff import dump_ops
+from app.batch import primary_result, edit_result
+from app.utils import get_primary_and_edit_example
+from app.example_data import example_data
+from app.metrics import WARMUP_SECONDS
+
+WARMUP_ENABLED = os.environ.get('WARMUP', '1') != '0'
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', 30))  # seconds until ready regardless
+
+logger = logging.getLogger('text2figma.warmup')
+
+Step = Tuple[str, Callable[[], object]]
+
+
+def warmup_steps(query_creator: QueryCreator) -> List[Step]:
+    """Prefixes first (everything else formats prompts with them), then one pass through each endpoint's work"""
+
+    def sample():
+        """An edit input like the training examples' (or the bundled example data, before any /save-scene)"""
+        if query_creator.training_scene:
+            return get_primary_and_edit_example(query_creator.training_scene[0])[0]
+        return example_data[0]
+
+    def pipeline():
+        scene = sample()
+        primary_result(figma_to_yaml(scene), (0, 0), 400)
+        edit_result(dump_ops(get_scene_diff(scene, scene)), scene)
+
+    def prompts():
+        query_creator.format_query_primary('warm-up')
+        query_creator.format_query_edit('warm-up', sample())
+
+    return [('prefixes', query_creator.refresh), ('pipeline', pipeline), ('prompts', prompts)]
+
+
+class WarmUp(object):
+    """Runs the warm-up steps once, in order, on a daemon thread; failed steps are logged and skipped"""
+
+    def __init__(self, steps: List[Step], timeout: float = WARMUP_TIMEOUT):
+        self.steps = steps
+        self.timeout = timeout
+        self.started: Optional[float] = None
+        self.seconds: Optional[float] = None  # start to finish, once finished
+        self.step_seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.done = threading.Event()
+
+    def start(self):
+        self.started = time.perf_counter()
+        threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def run(self):
+        for name, step in self.steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                logger.exception(f'Warm-up step {name} failed')
+                self.errors[name] = repr(e)
+            self.step_seconds[name] = time.perf_counter() - start
+            WARMUP_SECONDS.inc(self.step_seconds[name], name)
+        self.seconds = time.perf_counter() - self.started
+        self.done.set()
+        logger.info(f'Warm-up done in {self.seconds:.2f}s')
+
+    @property
+    def ready(self) -> bool:
+        if self.started is None or self.done.is_set():
+            return True  # warm, or warm-up disabled
+        return time.perf_counter() - self.started > self.timeout
+
+    def status(self) -> dict:
+        status = {
+            'status': 'ok' if self.ready else 'warming',
+            'warm': self.done.is_set(),
+            'steps_ms': {k: round(v * 1000, 1) for k, v in self.step_seconds.items()},
+        }
+        if self.seconds is not None:
+            status['warmup_ms'] = round(self.seconds * 1000, 1)
+        if self.errors:
+            status['errors'] = self.errors
+        return status
@@ -0,0 +1,197 @@
+"""
+YAML codec for the DSL: PyYAML's pure-Python implementation, or a fast path (libyaml's loader plus an emitter
+specialized for the DSL's shape) that produces byte-identical output.
+"""
+import os
+import yaml
+from functools import lru_cache
+from typing import Any, List
+
+# `fast` (libyaml + the DSL emitter, when available) or `pyyaml` (the pure-Python reference implementation)
+YAML_CODEC = os.environ.get('YAML_CODEC', 'fast')
+
+
+try:
+    from yaml import CSafeLoader as FastLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as FastLoader
+
+_RESOLVER = yaml.resolver.Resolver()
+_STR_TAG = 'tag:yaml.org,2002:str'
+_INDICATORS = set('#,[]{}&*!|>\'"%@`')
+
+
+class DSLDumper(yaml.Dumper):
+    """PyYAML's Dumper, except that lists of numbers are written inline (`b: [0, 0, 57, 39]`, see app.dsl_format)"""
+
+    def represent_list(self, data):
+        flow = bool(data) and all(type(x) in (int, float) for x in data)
+        return self.represent_sequence('tag:yaml.org,2002:seq', data, flow_style=True if flow else None)
+
+
+DSLDumper.add_representer(list, DSLDumper.represent_list)
+
+
+class DSLEmitter(object):
+    """
+    Writes the DSL's shape (nested mappings of scalars) straight to text, skipping PyYAML's representer /
+    serializer / emitter stack. Output is byte-identical to `yaml.dump(data, Dumper=DSLDumper, sort_keys=False)`,
+    including its line folding at 80 columns; `dump` returns None for anything outside that shape (lists other
+    than short lists of numbers, non-ASCII text, line breaks, unusual keys) so the caller can fall back to PyYAML.
+    """
+    WIDTH = 80  # PyYAML's best_width
+
+    class Unsupported(Exception):
+        pass
+
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def scalar_style(text: str) -> str:
+        """'' (plain), "'" (single-quoted), or None if PyYAML would pick a style we don't emit"""
+        if any(not ' ' <= ch <= '~' for ch in text):
+            return None
+        if _RESOLVER.resolve(yaml.ScalarNode, text, (True, False)) != _STR_TAG:
+            return "'"
+        if text[0] == ' ' or text[-1] == ' ' or text.startswith(('---', '...')):
+            return "'"
+        for ix, ch in enumerate(text):
+            followed_by_space = ix + 1 == len(text) or text[ix + 1] == ' '
+            if ix == 0:
+                if ch in _INDICATORS or (ch in '?:-' and followed_by_space):
+                    return "'"
+            elif (ch == ':' and followed_by_space) or (ch == '#' and text[ix - 1] == ' '):
+                return "'"
+        return ''
+
+    @staticmethod
+    def scalar(value) -> str:
+        if value is None:
+            return 'null'
+        if value is True or value is False:
+            return 'true' if value else 'false'
+        if type(value) is int:
+            return str(value)
+        if type(value) is float:
+            if value != value:
+                return '.nan'
+            if value in (float('inf'), float('-inf')):
+                return '.inf' if value > 0 else '-.inf'
+            text = repr(value).lower()
+            return text.replace('e', '.0e', 1) if '.' not in text and 'e' in text else text
+        raise DSLEmitter.Unsupported()
+
+    def write_text(self, out: List[str], text: str, column: int, indent: int, quoted: bool):
+        """PyYAML's write_plain / write_single_quoted for single-line ASCII, folding lone spaces past WIDTH"""
+        out.append(" '" if quoted else ' ')
+        column += len(out[-1])
+        spaces, start, end = False, 0, 0
+        while end <= len(text):
+            ch = text[end] if end < len(text) else None
+            if spaces:
+                if ch != ' ':
+                    if start + 1 == end and column > self.WIDTH and (not quoted or (start != 0 and end != len(text))):
+                        out.append('\n' + ' ' * indent)
+                        column = indent
+                    else:
+                        out.append(text[start:end])
+                        column += end - start
+                    start = end
+            elif ch is None or ch == ' ' or (quoted and ch == "'"):
+                if start < end:
+                    out.append(text[start:end])
+                    column += end - start
+                    start = end
+            if quoted and ch == "'":
+                out.append("''")
+                column += 2
+                start = end + 1
+            if ch is not None:
+                spaces = ch == ' '
+            end += 1
+        if quoted:
+            out.append("'")
+
+    def flow_list(self, items: list, column: int) -> str:
+        """`[1, 2, 3]`, for lists of numbers that fit on the line (PyYAML would fold longer ones)"""
+        if not items or any(type(x) not in (int, float) for x in items):
+            raise self.Unsupported()
+        text = '[' + ', '.join(self.scalar(x) for x in items) + ']'
+        if column + len(text) > self.WIDTH:
+            raise self.Unsupported()
+        return text
+
+    def write_mapping(self, out: List[str], data: dict, indent: int):
+        for key, value in data.items():
+            if type(key) is int:
+                key_text = str(key)
+            elif type(key) is str and key and self.scalar_style(key) == '' and ' ' not in key and len(key) < 128:
+                key_text = key
+            else:
+                raise self.Unsupported()
+            out.append(' ' * indent + key_text + ':')
+            if type(value) is dict:
+                if value:
+                    out.append('\n')
+                    self.write_mapping(out, value, indent + 2)
+                else:
+                    out.append(' {}\n')
+                continue
+            if type(value) is list:
+                out.append(' ' + self.flow_list(value, indent + len(key_text) + 2))
+                out.append('\n')
+                continue
+            if type(value) is str:
+                style = self.scalar_style(value) if value else "'"
+                if style is None:
+                    raise self.Unsupported()
+                self.write_text(out, value, indent + len(key_text) + 1, indent + 2, quoted=bool(style))
+            else:
+                out.append(' ' + self.scalar(value))
+            out.append('\n')
+
+    def dump(self, data: Any) -> str:
+        if type(data) is not dict or not data:
+            return None
+        out = []
+        try:
+            self.write_mapping(out, data, 0)
+        except self.Unsupported:
+            return None
+        return ''.join(out)
+
+
+class YamlCodec(object):
+    """
+    Loads and dumps DSL YAML. Dumping always falls back to PyYAML's pure-Python Dumper: libyaml folds some
+    double-quoted strings differently, and prompts must stay byte-identical for the completion cache.
+    """
+
+    def __init__(self, loader=yaml.SafeLoader, dumper=DSLDumper, emitter: DSLEmitter = None):
+        self.loader = loader
+        self.dumper = dumper
+        self.emitter = emitter
+
+    def load(self, text: str) -> Any:
+        return yaml.load(text, Loader=self.loader)
+
+    def dump(self, data: Any) -> str:
+        if self.emitter is not None:
+            text = self.emitter.dump(data)
+            if text is not None:
+                return text
+        return yaml.dump(data, Dumper=self.dumper, sort_keys=False)
+
+
+CODECS = {
+    'fast': YamlCodec(FastLoader, DSLDumper, DSLEmitter()),
+    'pyyaml': YamlCodec(),
+}
+codec = CODECS[YAML_CODEC]
+
+
+def load_yaml(text: str) -> Any:
+    return codec.load(text)
+
+
+def dump_yaml(data: Any) -> str:
+    return codec.dump(data)
@@ -0,0 +1,77 @@
+"""
+The server's own throughput ceiling: requests/second through /convert/primary and /convert/primary/stream with
+zero model latency, completions coming from the in-process synthetic backend vs. the fake completion server over
+HTTP (the network hop the synthetic backend removes). Also checks that recorded completions replay identically.
+
+    python -m benchmarks.bench_backends --clients 16 --requests 8
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+import httpx
+from app import main as app_main
+from app.gpt3 import GPT3
+from app.backends import OpenAIBackend, SyntheticBackend, ReplayBackend, RecordingBackend
+from benchmarks.common import load, serve_in_thread, wait_for_port
+
+FAKE_PORT = 8090
+SERVER_PORT = 8095
+
+
+async def throughput(path: str, clients: int, requests_per_client: int, tag: str) -> float:
+    """Returns requests/second; prompts are unique so the completion cache never answers"""
+    async def request(client: httpx.AsyncClient, ix: int):
+        response = await client.post(path, json={'prompt': f'a login form {tag} {path} #{ix}'})
+        response.raise_for_status()
+        await response.aread()
+
+    n_requests = clients * requests_per_client
+    return n_requests / await load(SERVER_PORT, clients, n_requests, request)
+
+
+def check_replay(record_path: str):
+    prompt = 'a login form (replay check)'
+    GPT3.backend = RecordingBackend(SyntheticBackend(latency=0.0), record_path)
+    recorded = GPT3.backend.complete_sync(prompt)
+    GPT3.backend = ReplayBackend(record_path)
+    assert GPT3.backend.complete_sync(prompt) == recorded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=8, help='per client')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # request traces
+
+    fake = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_completion_server',
+                             '--port', str(FAKE_PORT), '--latency', '0'])
+    try:
+        wait_for_port(FAKE_PORT)
+        serve_in_thread(app_main.app, SERVER_PORT)
+        backends = {
+            'fake server over HTTP': OpenAIBackend(f'http://127.0.0.1:{FAKE_PORT}/v1', api_key='fake'),
+            'synthetic (in-process)': SyntheticBackend(latency=0.0),
+        }
+        print(f'{args.clients} clients, zero model latency')
+        print(f'{"backend":<26} {"primary req/s":>14} {"stream req/s":>14}')
+        for name, backend in backends.items():
+            GPT3.backend = backend
+            asyncio.run(throughput('/convert/primary', args.clients, 1, f'warm-up {name}'))
+            rps = [asyncio.run(throughput(path, args.clients, args.requests, name))
+                   for path in ('/convert/primary', '/convert/primary/stream')]
+            print(f'{name:<26} {rps[0]:>14.1f} {rps[1]:>14.1f}')
+        with tempfile.TemporaryDirectory() as tmp:
+            check_replay(os.path.join(tmp, 'recorded.jsonl'))
+        print('replay: recorded completion served back unchanged')
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Wall time for N prompts as sequential /convert/primary round trips against one /convert/batch request, with
+the local fake completion server standing in for the model. Prompts are unique so nothing is served from cache.
+
+    python -m benchmarks.bench_batch --items 50 --latency 0.5
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+import httpx
+from app import main as app_main
+from app.gpt3 import GPT3
+from benchmarks.common import serve_in_thread, wait_for_port
+
+FAKE_PORT = 8090
+SERVER_PORT = 8094
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per fake completion')
+    args = parser.parse_args()
+
+    fake = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_completion_server',
+                             '--port', str(FAKE_PORT), '--latency', str(args.latency)])
+    try:
+        wait_for_port(FAKE_PORT)
+        GPT3.backend.api_base = f'http://127.0.0.1:{FAKE_PORT}/v1'
+        serve_in_thread(app_main.app, SERVER_PORT)
+        with httpx.Client(base_url=f'http://127.0.0.1:{SERVER_PORT}', timeout=600.0) as client:
+            start = time.perf_counter()
+            for i in range(args.items):
+                client.post('/convert/primary', json={'prompt': f'variant {i} (sequential)'}).raise_for_status()
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            first, n_results = None, 0
+            items = [{'prompt': f'variant {i} (batch)'} for i in range(args.items)]
+            with client.stream('POST', '/convert/batch', json={'items': items}) as response:
+                for line in response.iter_lines():
+                    event = json.loads(line)
+                    if event['event'] == 'result':
+                        n_results += 1
+                        first = first or time.perf_counter() - start
+                    elif event['event'] == 'error':
+                        raise RuntimeError(event['detail'])
+            batch = time.perf_counter() - start
+            assert n_results == args.items
+        print(f'{args.items} prompts, {args.latency}s per completion')
+        print(f'  sequential /convert/primary: {sequential:6.2f}s')
+        print(f'  /convert/batch:              {batch:6.2f}s  (first result after {first:.2f}s)')
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == '__main__':
+    main()
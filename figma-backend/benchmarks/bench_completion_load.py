@@ -0,0 +1,77 @@
+"""
+Requests/second through /convert/primary with N concurrent clients, against the local fake completion server.
+
+Compares the old handler (blocking `GPT3.generate_yaml` inside an async def) with the current one (`await`ing
+the pooled async client):
+
+    python -m benchmarks.bench_completion_load --clients 1 8 32 --latency 0.5
+"""
+import sys
+import pickle
+import asyncio
+import argparse
+import subprocess
+import httpx
+from fastapi import FastAPI
+from app import main as app_main
+from app.gpt3 import GPT3
+from app.conversion import yaml_to_figma
+from benchmarks.common import load, serve_in_thread, wait_for_port
+
+FAKE_PORT = 8090
+DATA_PATH = 'app/data.pkl'
+
+
+def blocking_app() -> FastAPI:
+    """The /convert/primary handler as it was before the async client"""
+    legacy = FastAPI()
+
+    @legacy.post('/convert/primary')
+    async def convert_primary(request: app_main.PrimaryQuery):
+        primary_prompt = app_main.query_creator.format_query_primary(request.prompt)
+        yaml_str = GPT3.generate_yaml(primary_prompt)
+        return {'outputScene': yaml_to_figma(yaml_str, (200, 200), 400)}
+
+    return legacy
+
+
+async def throughput(port: int, clients: int, requests_per_client: int) -> float:
+    """Returns requests/second"""
+    async def request(client: httpx.AsyncClient, ix: int):
+        response = await client.post('/convert/primary', json={'prompt': 'a white modal window'})
+        response.raise_for_status()
+
+    n_requests = clients * requests_per_client
+    return n_requests / await load(port, clients, n_requests, request)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests-per-client', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.5)
+    args = parser.parse_args()
+
+    fake = subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.fake_completion_server',
+        '--port', str(FAKE_PORT), '--latency', str(args.latency)
+    ])
+    try:
+        wait_for_port(FAKE_PORT)
+        GPT3.backend.api_base = f'http://127.0.0.1:{FAKE_PORT}/v1'
+        app_main.query_creator.primary_prefix = pickle.load(open(DATA_PATH, 'rb'))['primary_prefix']
+
+        servers = {'blocking': serve_in_thread(blocking_app(), 8091), 'async': serve_in_thread(app_main.app, 8092)}
+        ports = {'blocking': 8091, 'async': 8092}
+        print(f'{"clients":>8} {"blocking req/s":>15} {"async req/s":>12}')
+        for n in args.clients:
+            rps = {mode: asyncio.run(throughput(port, n, args.requests_per_client)) for mode, port in ports.items()}
+            print(f'{n:>8} {rps["blocking"]:>15.2f} {rps["async"]:>12.2f}')
+        for server in servers.values():
+            server.should_exit = True
+    finally:
+        fake.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Size of the edit prompt with selection-scoped context (app.context_pruning) against the whole scene, on large
+synthetic frames, for instructions about a single leaf (by name and by its text), a group, and one that names
+nothing in the scene. Also checks that a diff written against the pruned scene (recolor the node and insert one
+before it) comes out of `edit_result` the same as the exact diff of the whole scene.
+
+    python -m benchmarks.bench_context_pruning
+"""
+import time
+import random
+from copy import deepcopy
+from typing import List, Tuple
+from app.batch import edit_result
+from app.context_pruning import edit_context
+from app.conversion import figma_to_yaml, get_scene_diff
+from app.example_selection import estimate_tokens
+from app.format_query import QueryCreator
+from app.scene_diff import dump_ops
+from app.types import Scene
+from benchmarks.scenes import mixed_scene, shape_leaf
+from benchmarks.suite import MIXED, TEXT_HEAVY
+
+SCENES = {
+    '500 leaves, depth 4, mixed': (500, 4, MIXED),
+    '2000 leaves, depth 6, mixed': (2000, 6, MIXED),
+    '5000 leaves, depth 3, text-heavy': (5000, 3, TEXT_HEAVY),
+}
+REPEAT = 5
+
+
+def nodes_by_path(scene: Scene, path: Tuple[int, ...] = ()) -> List[Tuple[Tuple[int, ...], dict]]:
+    found = [(path, scene)]
+    for ix, child in enumerate(scene['node'].get('children') or []):
+        found.extend(nodes_by_path(child, (*path, ix)))
+    return found
+
+
+def instructions(scene: Scene, rng: random.Random) -> dict:
+    nodes = nodes_by_path(scene)
+    shape = rng.choice([node for _, node in nodes if node['name'].startswith('Shape')])
+    text = rng.choice([node for _, node in nodes if node['type'] == 'TEXT'])
+    group = rng.choice([node for path, node in nodes if path and node['type'] in ('GROUP', 'FRAME')])
+    return {
+        'leaf': f'make {shape["name"]} red',
+        'text': f'change "{text["node"]["characters"]}" to say Sign in',
+        'group': f'move {group["name"]} down a bit',
+        'no match': 'add a footer with a copyright notice',
+    }
+
+
+def round_trip(scene: Scene, rng: random.Random) -> bool:
+    """A diff written against the pruned scene, restored, gives the same scene as the exact diff of the whole one"""
+    nodes = nodes_by_path(scene)
+    path, target = rng.choice([(path, node) for path, node in nodes if len(path) and node['name'].startswith('Shape')])
+    yaml_str, pruning = edit_context(f'make {target["name"]} red and add a badge before it', scene)
+
+    # =====[ The edit, made on the Figma scene ]=====
+    after = deepcopy(scene)
+    parent = dict(nodes_by_path(after))[path[:-1]]['node']['children']
+    node = parent[path[-1]]
+    node['node']['color'] = {'r': 1.0, 'g': 0.0, 'b': 0.0}
+    parent.insert(path[-1], shape_leaf(rng, 10 ** 6, 'RECTANGLE'))
+    exact = get_scene_diff(scene, after)
+
+    # =====[ The same edit as the model would write it, seeing only the pruned scene ]=====
+    ops = [{'update': list(path), 'set': {'color': '#ff0000'}},
+           {'insert': list(path[:-1]), 'at': path[-1], 'node': next(op['node'] for op in exact if 'insert' in op)}]
+    pruned = edit_result(dump_ops(ops), scene, pruning)['outputScene']
+    return pruning is not None and pruned == edit_result(dump_ops(exact), scene)['outputScene']
+
+
+def main():
+    query_creator = QueryCreator()
+    rng = random.Random(0)
+    print(f'{"scene":<34} {"instruction":<11} {"scene tok":>10} {"pruned tok":>11} {"prompt tok":>11} '
+          f'{"pruned prompt":>14} {"shown":>7} {"prune ms":>9}')
+    for name, (n_leaves, depth, mix) in SCENES.items():
+        scene = mixed_scene(n_leaves, depth, mix)
+        full_yaml = figma_to_yaml(scene)
+        for kind, instruction in instructions(scene, rng).items():
+            timings = []
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                yaml_str, pruning = edit_context(instruction, scene)
+                timings.append((time.perf_counter() - start) * 1000)
+            full_prompt = query_creator.format_query_edit(instruction, scene, full_yaml)
+            pruned_prompt = query_creator.format_query_edit(instruction, scene, yaml_str)
+            shown = f'{pruning.shown}/{pruning.total}' if pruning else 'all'
+            print(f'{name:<34} {kind:<11} {estimate_tokens(full_yaml):>10,} {estimate_tokens(yaml_str):>11,} '
+                  f'{estimate_tokens(full_prompt):>11,} {estimate_tokens(pruned_prompt):>14,} {shown:>7} '
+                  f'{sorted(timings)[REPEAT // 2]:>9.1f}')
+        same = sum(round_trip(scene, random.Random(seed)) for seed in range(10))
+        print(f'{name:<34} restored diffs matching the exact diff: {same}/10')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+The text-to-dashboard pipeline (/dashboard) against the fake ToolJet server: latency of one request and
+throughput under concurrent clients, for the pooled async client vs. the previous chain of blocking `requests`
+calls; then the success rate with a fraction of ToolJet requests failing (retries). The model is the synthetic
+backend answering with one of the prompt's example apps after LLM_LATENCY seconds.
+
+    python -m benchmarks.bench_dashboard --clients 16
+"""
+import asyncio
+import logging
+import argparse
+import requests
+import httpx
+from fastapi import FastAPI
+from app import main as app_main
+from app.gpt3 import GPT3
+from app.backends import SyntheticBackend
+from app.modification import mod_prompt
+from app.dashboard import DATA_SOURCE, dashboard_prompt, parse_app_yaml, tooljet_import
+from benchmarks import fake_tooljet_server
+from benchmarks.common import load, serve_in_thread
+
+TOOLJET_PORT, SERVER_PORT, LEGACY_PORT = 8091, 8099, 8100
+TOOLJET_API = f'http://127.0.0.1:{TOOLJET_PORT}/api'
+LLM_LATENCY = 0.5
+TOOLJET_LATENCY = 0.05
+EXAMPLE_APP = mod_prompt.split('```')[1]  # the first example's app, as the model would write it
+
+
+def legacy_app() -> FastAPI:
+    """The pipeline chained by hand from the previous module: blocking `requests` calls, a connection apiece"""
+    legacy = FastAPI()
+
+    @legacy.post('/dashboard')
+    async def dashboard(request: app_main.DashboardQuery):
+        yaml_str = GPT3.generate_yaml(dashboard_prompt(request.prompt))
+        app = requests.post(f'{TOOLJET_API}/apps/import', json=tooljet_import(parse_app_yaml(yaml_str))).json()
+        params = {'app_id': app['id'], 'app_version_id': app['editing_version']['id']}
+        sources = requests.get(f'{TOOLJET_API}/data_sources', params=params).json()['data_sources']
+        for source in sources:
+            if source['name'] == DATA_SOURCE:
+                requests.put(f'{TOOLJET_API}/data_sources/{source["id"]}', json={'app_id': app['id']}).json()
+        return {'url': app['slug']}
+
+    return legacy
+
+
+async def run_load(port: int, clients: int, requests_per_client: int, tag: str) -> tuple:
+    """(requests/second, succeeded, failed); prompts are unique so the completion cache never answers"""
+    results = []
+
+    async def request(client: httpx.AsyncClient, ix: int):
+        response = await client.post('/dashboard', json={'prompt': f'films and actors {tag} #{ix}'})
+        results.append(response.status_code == 200)
+
+    elapsed = await load(port, clients, clients * requests_per_client, request)
+    return len(results) / elapsed, sum(results), len(results) - sum(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)  # request traces, missing-token warnings
+    fake_tooljet_server.LATENCY = TOOLJET_LATENCY
+    serve_in_thread(fake_tooljet_server.app, TOOLJET_PORT)
+    GPT3.backend = SyntheticBackend(text=EXAMPLE_APP + '```\n', latency=LLM_LATENCY)
+    app_main.tooljet.api_base = TOOLJET_API
+    app_main.tooljet.backoff = 0.01
+    serve_in_thread(app_main.app, SERVER_PORT)
+    serve_in_thread(legacy_app(), LEGACY_PORT)
+
+    print(f'model {LLM_LATENCY * 1000:.0f}ms, ToolJet {TOOLJET_LATENCY * 1000:.0f}ms per request')
+    print(f'{"pipeline":<10} {"1 client ms":>13} {f"{args.clients} clients req/s":>18}')
+    for name, port in (('blocking', LEGACY_PORT), ('async', SERVER_PORT)):
+        single = asyncio.run(run_load(port, 1, 5, f'{name} single'))[0]
+        throughput = asyncio.run(run_load(port, args.clients, args.requests, name))[0]
+        print(f'{name:<10} {1000 / single:>13.0f} {throughput:>18.1f}')
+
+    for fail_rate in (0.1, 0.3):
+        fake_tooljet_server.FAIL_RATE = fail_rate
+        app_main.tooljet.retried = 0
+        _, succeeded, failed = asyncio.run(run_load(SERVER_PORT, args.clients, args.requests, f'fail {fail_rate}'))
+        print(f'{fail_rate:.0%} of ToolJet requests rejected: {succeeded} succeeded, {failed} failed, '
+              f'{app_main.tooljet.retried} retries')
+    assert fake_tooljet_server.stats['imports'] > 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Prompt and completion size of the compact DSL (app.dsl_format) against the verbose one, and what that does to
+end-to-end latency:
+
+    - tokens in the primary / edit prefixes compiled from the stored training frames
+    - tokens in the completions the model has to generate (a whole scene, and an edit's diff)
+    - latency of the primary / edit endpoints: the non-model work (measured, as in benchmarks.suite) plus a
+      modelled completion time, prefill on the prompt tokens and generation on the completion tokens
+
+Before measuring, every case is checked to round-trip exactly through the compact encoding (at grid 1).
+
+    python -m benchmarks.bench_dsl_format
+"""
+import os
+import pickle
+import tempfile
+from copy import deepcopy
+from app import dsl_format
+from app.dsl_format import VerboseDSL, CompactDSL
+from app.scene import to_dsl
+from app.conversion import figma_to_dsl_tree, figma_to_yaml, get_scene_diff
+from app.scene_diff import dump_ops
+from app.yaml_codec import load_yaml, dump_yaml
+from app.format_query import QueryCreator
+from app.example_selection import estimate_tokens
+from app.example_data import example_data
+from benchmarks.scenes import DATA_PATH, mixed_scene
+from benchmarks.suite import scene_operations, measure, count_nodes, edited, MIXED
+from benchmarks.bench_prompt_selection import GENERATION_SECONDS, PREFILL_SECONDS_PER_1K_TOKENS
+
+FORMATS = {
+    'verbose': VerboseDSL(),
+    'compact': CompactDSL(grid=1),
+    'compact, grid 2': CompactDSL(grid=2),
+    'compact, grid 5': CompactDSL(grid=5),
+}
+GENERATION_SECONDS_PER_TOKEN = GENERATION_SECONDS / 200
+PRIMARY_QUERY = 'a login form with a title and two buttons'
+EDIT_QUERY = 'make a few of the shapes red'
+
+
+def cases() -> dict:
+    return {
+        'example_data': example_data,
+        'medium (200 leaves, depth 4, mixed)': [mixed_scene(200, 4, MIXED)],
+    }
+
+
+def check_round_trip(scenes: list):
+    codec = CompactDSL(grid=1)
+    for scene in scenes:
+        verbose = to_dsl(figma_to_dsl_tree(scene))
+        encoded = codec.encode_scene(deepcopy(verbose))
+        assert codec.decode_scene(load_yaml(dump_yaml(encoded))) == verbose
+
+
+def modelled_seconds(prompt_tokens: int, completion_tokens: int) -> float:
+    return PREFILL_SECONDS_PER_1K_TOKENS * prompt_tokens / 1000 + GENERATION_SECONDS_PER_TOKEN * completion_tokens
+
+
+def pct(value: float, base: float) -> str:
+    return f'{(value - base) / base * 100:+.0f}%' if base else ''
+
+
+def main():
+    training = pickle.load(open(DATA_PATH, 'rb'))['scene']
+    check_round_trip([*training, *cases().values()])
+    print(f'round trip: exact on {len(training)} training frames and {len(cases())} cases\n')
+
+    rows = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, codec in FORMATS.items():
+            dsl_format.codec = codec
+            query_creator = QueryCreator(os.path.join(tmp, f'{name}.pkl'))
+            query_creator.set_prefixes(training)
+            row = {'primary prefix': estimate_tokens(query_creator.primary_prefix),
+                   'edit prefix': estimate_tokens(query_creator.edit_prefix)}
+            for case, scene in cases().items():
+                root = scene[0] if len(scene) == 1 else scene
+                scene_tokens = estimate_tokens(figma_to_yaml(scene))
+                diff_tokens = estimate_tokens(dump_ops(get_scene_diff(scene, edited(scene))))
+                ops = scene_operations(scene, query_creator)
+                primary_ms = measure(ops['primary_e2e'], count_nodes(scene), 5, 0.3)['median_ms']
+                edit_ms = measure(ops['edit_e2e'], count_nodes(scene), 5, 0.3)['median_ms']
+                primary_prompt = estimate_tokens(query_creator.format_query_primary(PRIMARY_QUERY))
+                edit_prompt = estimate_tokens(query_creator.format_query_edit(EDIT_QUERY, root))
+                row[f'{case}: scene completion'] = scene_tokens
+                row[f'{case}: diff completion'] = diff_tokens
+                row[f'{case}: primary e2e (s)'] = primary_ms / 1000 + modelled_seconds(primary_prompt, scene_tokens)
+                row[f'{case}: edit e2e (s)'] = edit_ms / 1000 + modelled_seconds(edit_prompt, diff_tokens)
+                row[f'{case}: primary non-model (ms)'] = primary_ms
+                row[f'{case}: edit non-model (ms)'] = edit_ms
+            rows[name] = row
+        dsl_format.codec = dsl_format.FORMATS[dsl_format.DSL_FORMAT]
+
+    base = rows['verbose']
+    print(f'{"":<58}' + ''.join(f'{name:>20}' for name in FORMATS))
+    for metric, value in base.items():
+        cells = [f'{value:>20,.2f}' if type(value) is float else f'{value:>20,}']
+        for name in list(FORMATS)[1:]:
+            other = rows[name][metric]
+            text = f'{other:,.2f}' if type(other) is float else f'{other:,}'
+            cells.append(f'{text + " (" + pct(other, value) + ")":>20}')
+        print(f'{metric:<58}' + ''.join(cells))
+
+
+if __name__ == '__main__':
+    main()
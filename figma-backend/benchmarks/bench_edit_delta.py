@@ -0,0 +1,47 @@
+"""
+Non-model cost of an edit: a full /convert/edit (whole scene in, whole scene out) against a session edit through
+/convert/edit/delta (scene hash in, node-level patch out), on scenes of several sizes. The model is the synthetic
+backend answering with a fixed diff, at zero latency.
+
+    python -m benchmarks.bench_edit_delta
+"""
+import logging
+import httpx
+from app import main as app_main
+from app.gpt3 import GPT3
+from app.backends import SyntheticBackend
+from app.conversion import get_scene_diff
+from app.scene_diff import dump_ops
+from benchmarks.common import serve_in_thread, timed_post
+from benchmarks.scenes import mixed_scene
+from benchmarks.suite import edited, MIXED
+
+SERVER_PORT = 8096
+SIZES = (50, 500, 3000)  # leaves
+REPEAT = 10
+
+
+def main():
+    logging.disable(logging.INFO)  # request traces
+    serve_in_thread(app_main.app, SERVER_PORT)
+    print(f'{"leaves":>7} {"":>6} {"ms":>8} {"request":>11} {"response":>11}')
+    with httpx.Client(base_url=f'http://127.0.0.1:{SERVER_PORT}', timeout=600.0) as client:
+        for n_leaves in SIZES:
+            scene = mixed_scene(n_leaves, 4, MIXED)
+            GPT3.backend = SyntheticBackend(text=dump_ops(get_scene_diff(scene, edited([scene])[0])) + '```\n',
+                                            latency=0.0)
+            session = f'bench-{n_leaves}'
+            full, delta = [], []
+            for i in range(REPEAT):  # unique prompts, so the completion cache never answers
+                full.append(timed_post(client, '/convert/edit', {'prompt': f'make it red {i}', 'scene': [scene]}))
+                base = timed_post(client, '/convert/edit', {'prompt': f'seed {i}', 'scene': [scene],
+                                                            'session': session})[3]['sceneHash']
+                delta.append(timed_post(client, '/convert/edit/delta', {'prompt': f'make it red {i}',
+                                                                        'session': session, 'base': base}))
+            for name, runs in (('full', full), ('delta', delta)):
+                ms = sorted(run[0] for run in runs)[len(runs) // 2]
+                print(f'{n_leaves:>7} {name:>6} {ms:>8.1f} {runs[0][1]:>9,} B {runs[0][2]:>9,} B')
+
+
+if __name__ == '__main__':
+    main()
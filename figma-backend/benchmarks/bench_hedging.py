@@ -0,0 +1,105 @@
+"""
+Tail latency and bad-output rate of /convert/primary with hedged generation (app.hedging), against an in-process
+backend with a heavy tail: most completions take LATENCY (+/- JITTER), a few are very slow, fail, or come back as
+YAML that doesn't convert. Reports latency percentiles, the share of responses that weren't clean, completion
+calls per request and which call won.
+
+    python -m benchmarks.bench_hedging --clients 16 --requests 25
+"""
+import time
+import asyncio
+import logging
+import argparse
+import httpx
+from app import main as app_main
+from app.gpt3 import GPT3
+from app.hedging import Hedger, HedgeBudget
+from app.backends import CannedBackend, synthetic_completion
+from benchmarks.common import load, percentile, serve_in_thread
+
+SERVER_PORT = 8101
+LATENCY, JITTER = 0.3, 0.3
+SLOW_RATE, SLOW_LATENCY = 0.05, 3.0
+FAIL_RATE = 0.02
+BAD_RATE = 0.05
+BAD_COMPLETION = '- name: Rectangle\n  type: RECT\n  node: [not, a, node\n```'
+
+CONFIGS = {
+    'off': dict(candidates=1, percentile=0),
+    'hedge at p95': dict(candidates=1, percentile=95),
+    'hedge at p95, budget 0.3': dict(candidates=1, percentile=95, budget=HedgeBudget(0.3)),
+    'hedge at p90, budget 0.1': dict(candidates=1, percentile=90, budget=HedgeBudget(0.1)),
+    '2 candidates': dict(candidates=2, percentile=0, budget=HedgeBudget(1.0)),
+}
+
+
+class FlakyBackend(CannedBackend):
+    """The synthetic completion, with a slow / failed / unusable one now and then"""
+
+    def __init__(self, seed: int = 0):
+        super().__init__(LATENCY, JITTER, seed=seed)
+        self.text = synthetic_completion()
+        self.calls = 0
+
+    def lookup(self, prompt: str) -> str:
+        return self.text
+
+    async def _complete(self, prompt: str, **params) -> str:
+        self.calls += 1
+        roll = self._rng.random()
+        if roll < SLOW_RATE:
+            await asyncio.sleep(SLOW_LATENCY)
+            return self.text
+        await asyncio.sleep(self.delay())
+        if roll < SLOW_RATE + FAIL_RATE:
+            raise RuntimeError('upstream error')
+        if roll < SLOW_RATE + FAIL_RATE + BAD_RATE:
+            return BAD_COMPLETION
+        return self.text
+
+
+async def run_load(clients: int, requests_per_client: int, tag: str) -> tuple:
+    """(latencies in seconds, clean responses, errors); prompts are unique so the completion cache never answers"""
+    latencies, clean, errors = [], [0], [0]
+
+    async def request(client: httpx.AsyncClient, ix: int):
+        start = time.perf_counter()
+        try:
+            response = await client.post('/convert/primary', json={'prompt': f'a login form {tag} #{ix}'})
+        except httpx.TransportError:  # an unhandled upstream error: the server drops the connection
+            response = None
+        latencies.append(time.perf_counter() - start)
+        if response is None or response.status_code != 200:
+            errors[0] += 1
+        elif app_main.is_clean(response.json()):
+            clean[0] += 1
+
+    await load(SERVER_PORT, clients, clients * requests_per_client, request)
+    return sorted(latencies), clean[0], errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=25, help='per client')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)  # request traces, missing-token warnings, upstream errors without hedging
+    serve_in_thread(app_main.app, SERVER_PORT)
+
+    print(f'model {LATENCY * 1000:.0f}ms +/- {JITTER:.0%}; {SLOW_RATE:.0%} take {SLOW_LATENCY:.0f}s, '
+          f'{FAIL_RATE:.0%} fail, {BAD_RATE:.0%} unusable')
+    print(f'{"":<26} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7} {"not clean":>10} {"errors":>7} '
+          f'{"calls/req":>10} {"hedge wins":>11}')
+    for name, config in CONFIGS.items():
+        GPT3.backend = FlakyBackend()
+        GPT3.hedger = Hedger(delay=LATENCY * 2, **config)
+        latencies, clean, errors = asyncio.run(run_load(args.clients, args.requests, name))
+        n = len(latencies)
+        stats = GPT3.hedger.stats()
+        print(f'{name:<26} {percentile(latencies, 50) * 1000:>7.0f} {percentile(latencies, 95) * 1000:>7.0f} '
+              f'{percentile(latencies, 99) * 1000:>7.0f} {(n - clean - errors) / n:>10.1%} {errors / n:>7.1%} '
+              f'{GPT3.backend.calls / n:>10.2f} {stats["hedge_win_rate"]:>11.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Cost of the instrumentation: a bare `stage()` block, and an edit-style conversion round trip (which passes
+through several stages) with metrics on and off.
+
+    python -m benchmarks.bench_metrics
+"""
+import time
+from app import metrics
+from app.metrics import stage, Trace, TRACE
+from app.conversion import figma_to_yaml, yaml_to_figma
+from benchmarks.scenes import training_scene
+
+N_STAGES = 100000
+REPEAT = 200
+
+
+def per_call_ns(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def empty_stage():
+    with stage('bench'):
+        pass
+
+
+def main():
+    frame = training_scene(1)[0]
+    TRACE.set(Trace('/bench'))  # as inside a request
+    print(f'{"":<34} {"metrics on":>12} {"metrics off":>12}')
+    for name, fn, n in (('empty stage() block (ns)', empty_stage, N_STAGES),
+                        ('yaml round trip (us)', lambda: yaml_to_figma(figma_to_yaml(frame), (200, 200), 400), REPEAT)):
+        results = []
+        for enabled in (True, False):
+            metrics.METRICS_ENABLED = enabled
+            results.append(min(per_call_ns(fn, n) for _ in range(3)))
+        scale = 1 if 'ns' in name else 1e-3
+        print(f'{name:<34} {results[0] * scale:>12.1f} {results[1] * scale:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+ToolJet app modifications in patch mode against re-writing the whole app (app.modification), on the before/after
+pairs bundled as mod_prompt's examples:
+
+    - tokens the model has to generate (the whole `after` app, or the patch from `before` to it)
+    - prompt tokens, with the example's `before` app as the app to modify
+    - latency: the non-model work of turning the completion into the app (measured) plus a modelled completion
+      time, prefill on the prompt tokens and generation on the completion tokens (as in benchmarks.bench_dsl_format)
+
+Before measuring, every patch is checked to reproduce its example's `after` app.
+
+    python -m benchmarks.bench_modification
+"""
+import timeit
+from app import modification
+from app.modification import mod_examples, diff_apps, dump_app, format_modification, format_patch_modification
+from app.dashboard import completed_app, parse_app_yaml
+from app.example_selection import estimate_tokens
+from benchmarks.bench_dsl_format import modelled_seconds
+
+FORMATS = ('full', 'patch')
+
+
+def completions(example) -> dict:
+    """format -> (prompt, the completion the model should write)"""
+    patch = diff_apps(parse_app_yaml(example.before), parse_app_yaml(example.after))
+    return {
+        'full': (format_modification(None, example.before, example.modification), example.after),
+        'patch': (format_patch_modification(None, example.before, example.modification), '\n' + dump_app(patch)),
+    }
+
+
+def post_process_ms(completion: str, app_yaml: str) -> float:
+    return min(timeit.repeat(lambda: completed_app(completion, app_yaml), number=100, repeat=5)) * 10
+
+
+def main():
+    print(f'{"example":<10} {"format":<7} {"completion tok":>15} {"prompt tok":>11} {"post ms":>8} '
+          f'{"modelled s":>11} {"saved":>7}')
+    totals = {name: [0, 0.0] for name in FORMATS}
+    configured = modification.MODIFICATION_FORMAT
+    for ix, example in enumerate(mod_examples()):
+        expected = parse_app_yaml(example.after)
+        base = None
+        for name, (prompt, completion) in completions(example).items():
+            modification.MODIFICATION_FORMAT = name
+            assert completed_app(completion, example.before)[1] == expected, f'example {ix}: {name} mismatch'
+            completion_tokens = estimate_tokens(completion)
+            post_ms = post_process_ms(completion, example.before)
+            seconds = post_ms / 1000 + modelled_seconds(estimate_tokens(prompt), completion_tokens)
+            base = seconds if base is None else base
+            totals[name][0] += completion_tokens
+            totals[name][1] += seconds
+            print(f'{ix:<10} {name:<7} {completion_tokens:>15,} {estimate_tokens(prompt):>11,} {post_ms:>8.2f} '
+                  f'{seconds:>11.2f} {(base - seconds) / base:>7.0%}')
+    modification.MODIFICATION_FORMAT = configured
+    (full_tokens, full_s), (patch_tokens, patch_s) = totals['full'], totals['patch']
+    print(f'\ntotal: {full_tokens:,} -> {patch_tokens:,} completion tokens '
+          f'({1 - patch_tokens / full_tokens:.0%} fewer), '
+          f'{full_s:.2f}s -> {patch_s:.2f}s modelled ({1 - patch_s / full_s:.0%} faster)')
+
+
+if __name__ == '__main__':
+    main()
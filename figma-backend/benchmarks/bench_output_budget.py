@@ -0,0 +1,103 @@
+"""
+What the model is asked for and spends generating: /convert/primary and /convert/edit against the fake completion
+server, which (like the real endpoint) writes until a stop sequence or max_tokens at TOKEN_LATENCY per token.
+
+    - before: max_tokens 1000 and no stop sequence, so the model keeps writing past the closing fence
+    - stop sequence: the completion ends at the closing fence
+    - stop + learned budget: also max_tokens predicted from earlier completions (app.output_budget), after
+      LEARN_REQUESTS requests of each kind to learn from
+
+Reports median latency, completion tokens generated and max_tokens requested per request, and how many
+completions ran into their budget and had to be continued.
+
+    python -m benchmarks.bench_output_budget
+"""
+import time
+import asyncio
+import logging
+import argparse
+import statistics
+import httpx
+from app import main as app_main
+from app.gpt3 import GPT3
+from app.backends import OpenAIBackend, synthetic_completion, COMPLETION_PARAMS
+from app.conversion import get_scene_diff
+from app.scene_diff import dump_ops
+from app.example_data import example_data
+from app.metrics import COMPLETION_TRUNCATED
+from benchmarks import fake_completion_server as fake
+from benchmarks.suite import edited
+from benchmarks.common import load, serve_in_thread
+
+FAKE_PORT, SERVER_PORT = 8090, 8102
+LATENCY, TOKEN_LATENCY = 0.05, 0.005  # seconds; a quarter of code-davinci-002's ~20ms per token
+LEARN_REQUESTS = 25
+SCENE = example_data[0]
+COMPLETIONS = {
+    'primary': synthetic_completion(),
+    # the scene's diff, then what the model writes after it without a stop sequence
+    'edit': '\n' + dump_ops(get_scene_diff(SCENE, edited(SCENE))) + '```\n---\n\n' + synthetic_completion(),
+}
+
+
+def request_body(kind: str, ix: int) -> dict:
+    if kind == 'edit':
+        return {'prompt': f'make a few of the shapes red #{ix}', 'scene': [SCENE]}
+    return {'prompt': f'a login form with a title and two buttons #{ix}'}
+
+
+async def run_load(kind: str, n_requests: int, clients: int, tag: str) -> list:
+    """Latencies in seconds; prompts are unique so the completion cache never answers"""
+    latencies = []
+
+    async def request(client: httpx.AsyncClient, ix: int):
+        start = time.perf_counter()
+        body = request_body(kind, ix)
+        body['prompt'] += f' {tag}'
+        response = await client.post(f'/convert/{kind}', json=body)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+    await load(SERVER_PORT, clients, n_requests, request)
+    return latencies
+
+
+def truncated_total() -> float:
+    return sum(COMPLETION_TRUNCATED._values.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=40, help='timed, per kind and configuration')
+    parser.add_argument('--clients', type=int, default=8)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # request traces
+
+    fake.LATENCY, fake.TOKEN_LATENCY = LATENCY, TOKEN_LATENCY
+    serve_in_thread(fake.app, FAKE_PORT)
+    GPT3.backend = OpenAIBackend(api_base=f'http://127.0.0.1:{FAKE_PORT}/v1', api_key='fake')
+    serve_in_thread(app_main.app, SERVER_PORT)
+    stop = COMPLETION_PARAMS.pop('stop')
+
+    print(f'model {LATENCY * 1000:.0f}ms + {TOKEN_LATENCY * 1000:.0f}ms per token')
+    print(f'{"":<8} {"":<24} {"p50 ms":>8} {"tokens/req":>11} {"max_tokens/req":>15} {"continued":>10}')
+    for name, with_stop, budget in (('before', False, False), ('stop sequence', True, False),
+                                    ('stop + learned budget', True, True)):
+        if with_stop:
+            COMPLETION_PARAMS['stop'] = stop
+        GPT3.budget.enabled = budget
+        for kind, text in COMPLETIONS.items():
+            fake.COMPLETION_TEXT = text
+            if budget:
+                asyncio.run(run_load(kind, LEARN_REQUESTS, args.clients, f'learn {name}'))
+            before, truncated = dict(fake.stats), truncated_total()
+            latencies = asyncio.run(run_load(kind, args.requests, args.clients, name))
+            n = fake.stats['requests'] - before['requests']
+            print(f'{kind:<8} {name:<24} {statistics.median(latencies) * 1000:>8.0f} '
+                  f'{(fake.stats["completion_tokens"] - before["completion_tokens"]) / args.requests:>11.0f} '
+                  f'{(fake.stats["max_tokens"] - before["max_tokens"]) / n:>15.0f} '
+                  f'{int(truncated_total() - truncated):>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Cost of /save-scene's prefix compilation on a 50-frame training scene: a cold save, a re-save with one frame
+changed, and the previous always-rebuild behaviour.
+
+    python -m benchmarks.bench_prefix_store
+"""
+import os
+import tempfile
+from copy import deepcopy
+from app.format_query import QueryCreator, get_primary_prompt, get_edit_prompt
+from app.transform import collect_leaves
+from benchmarks.common import timed
+from benchmarks.scenes import training_scene
+
+N_FRAMES = 50
+
+
+def main():
+    scene = training_scene(N_FRAMES)
+    changed = deepcopy(scene)
+    collect_leaves(changed[17])[0]['node']['width'] += 10
+
+    with tempfile.TemporaryDirectory() as tmp:
+        query_creator = QueryCreator(os.path.join(tmp, 'prefixes.pkl'))
+        rebuild = timed(lambda: (get_primary_prompt(scene), get_edit_prompt(scene)))
+        cold = timed(lambda: query_creator.set_prefixes(scene))
+        resave = timed(lambda: query_creator.set_prefixes(changed))
+        query_creator.store.flush()
+
+        restarted = QueryCreator(os.path.join(tmp, 'prefixes.pkl'))
+        restart = timed(lambda: restarted.set_prefixes(changed))
+        assert restarted.primary_prefix == get_primary_prompt(changed)
+        assert restarted.edit_prefix == get_edit_prompt(changed)
+
+    print(f'{N_FRAMES} frames, 1 changed')
+    print(f'  full rebuild (previous behaviour): {rebuild:8.1f} ms')
+    print(f'  cold save:                         {cold:8.1f} ms')
+    print(f'  re-save, one frame changed:        {resave:8.1f} ms')
+    print(f'  re-save after restart:             {restart:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
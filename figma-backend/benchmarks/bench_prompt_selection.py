@@ -0,0 +1,76 @@
+"""
+Prompt size and latency of token-budgeted example selection against sending every training example, on a
+50-frame training scene.
+
+Latency is prompt formatting time (measured) plus a modelled completion time that grows with prompt length
+(prefill) on top of a fixed generation cost; adjust the constants to match what you observe upstream.
+
+    python -m benchmarks.bench_prompt_selection --budget 2000
+"""
+import os
+import time
+import argparse
+import tempfile
+from statistics import mean
+from typing import Tuple
+from app.format_query import QueryCreator
+from app.example_selection import estimate_tokens
+from app.utils import get_primary_and_edit_example
+from benchmarks.scenes import training_scene
+
+N_FRAMES = 50
+GENERATION_SECONDS = 4.0  # ~200 completion tokens
+PREFILL_SECONDS_PER_1K_TOKENS = 0.35
+
+PRIMARY_QUERIES = [
+    'a white modal window with a green submit button',
+    'a red square next to a blue circle',
+    'a gray window with an image of a penguin',
+    'a login form with a username field, a password field and a blue button',
+]
+EDIT_QUERIES = [
+    'make the submit button round',
+    'add a red cancel button in the bottom right',
+    'put a dropshadow on the window',
+]
+
+
+def modelled_latency(prompt_tokens: int, format_seconds: float) -> float:
+    return format_seconds + GENERATION_SECONDS + PREFILL_SECONDS_PER_1K_TOKENS * prompt_tokens / 1000
+
+
+def measure(format_query) -> Tuple[float, float]:
+    """Mean prompt tokens and mean modelled latency over the calls in `format_query`"""
+    tokens, latencies = [], []
+    for call in format_query:
+        start = time.perf_counter()
+        prompt = call()
+        elapsed = time.perf_counter() - start
+        tokens.append(estimate_tokens(prompt))
+        latencies.append(modelled_latency(tokens[-1], elapsed))
+    return mean(tokens), mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=int, default=2000)
+    args = parser.parse_args()
+
+    scene = training_scene(N_FRAMES)
+    edit_inputs = [get_primary_and_edit_example(frame)[0] for frame in scene[:3]]
+    with tempfile.TemporaryDirectory() as tmp:
+        query_creator = QueryCreator(os.path.join(tmp, 'prefixes.pkl'))
+        query_creator.set_prefixes(scene)
+        print(f'{N_FRAMES} training frames, budget {args.budget} tokens')
+        print(f'{"":<10} {"mode":<14} {"prompt tokens":>14} {"latency s":>10}')
+        for budget, mode in [(0, 'all examples'), (args.budget, 'selected')]:
+            query_creator.token_budget = budget
+            primary = [lambda q=q: query_creator.format_query_primary(q) for q in PRIMARY_QUERIES]
+            edit = [lambda q=q, s=s: query_creator.format_query_edit(q, s) for q in EDIT_QUERIES for s in edit_inputs]
+            for kind, calls in [('primary', primary), ('edit', edit)]:
+                tokens, latency = measure(calls)
+                print(f'{kind:<10} {mode:<14} {tokens:>14.0f} {latency:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
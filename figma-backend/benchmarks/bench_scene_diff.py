@@ -0,0 +1,107 @@
+"""
+Size (YAML characters / estimated tokens) and runtime of the scene-aware diff against jsondiff, on the stored
+training edits and on synthetic edits to a large scene (insertions and reorders are where an index-keyed diff
+falls apart). Every diff is checked to round-trip through YAML back to the edited scene.
+
+    python -m benchmarks.bench_scene_diff
+"""
+import yaml
+import random
+import pickle
+from copy import deepcopy
+from jsondiff import diff, patch
+from app.utils import get_primary_and_edit_example
+from app.conversion import figma_to_json_dsl, json_dsl_to_figma, get_scene_diff, apply_scene_diff
+from app.scene_diff import dump_ops
+from app.example_selection import estimate_tokens
+from benchmarks.common import timed
+from benchmarks.scenes import DATA_PATH, synthetic_scene, synthetic_leaf
+
+REPEAT = 5
+
+
+########################################################################################################################
+# Cases
+########################################################################################################################
+
+def training_edits() -> dict:
+    cases = {}
+    for frame in pickle.load(open(DATA_PATH, 'rb'))['scene']:
+        if '(Primary Only)' in frame['name']:
+            continue
+        before, after = get_primary_and_edit_example(deepcopy(frame))
+        before['name'] = after['name'] = 'Input'
+        cases[f'training: {frame["name"]}'] = (before, after)
+    return cases
+
+
+def synthetic_edits() -> dict:
+    rng = random.Random(1)
+    before = synthetic_scene(3, 60)
+    children = before['node']['children']
+
+    def edited(fn):
+        after = deepcopy(before)
+        fn(after['node']['children'])
+        return before, after
+
+    def insert_front(c):
+        c.insert(1, synthetic_leaf(rng, 10 ** 6))
+
+    def swap(c):
+        c[5], c[40] = c[40], c[5]
+
+    def delete_some(c):
+        del c[10:13]
+
+    def recolor(c):
+        for node in c[1:]:
+            if 'color' in node['node'] and 'characters' not in node['node']:
+                node['node']['color'] = {'r': 1, 'g': 0, 'b': 0}
+                break
+
+    def anchor_nodes(c):
+        # keeps the scene's bbox fixed so that edits don't renormalize every position
+        c.append({'name': 'Anchor TL', 'type': 'RECTANGLE', 'node': {'color': {'r': 0, 'g': 0, 'b': 0}, 'position': {'x': -10, 'y': -10}, 'width': 1, 'height': 1}})
+        c.append({'name': 'Anchor BR', 'type': 'RECTANGLE', 'node': {'color': {'r': 0, 'g': 0, 'b': 0}, 'position': {'x': 3000, 'y': 3000}, 'width': 1, 'height': 1}})
+
+    anchor_nodes(children)
+    return {
+        f'synthetic ({len(children)} children): insert near front': edited(insert_front),
+        f'synthetic ({len(children)} children): swap two nodes': edited(swap),
+        f'synthetic ({len(children)} children): delete three nodes': edited(delete_some),
+        f'synthetic ({len(children)} children): recolor one node': edited(recolor),
+    }
+
+
+########################################################################################################################
+# Benchmark
+########################################################################################################################
+
+def main():
+    print(f'{"case":<52} {"engine":<9} {"chars":>7} {"~tokens":>8} {"diff ms":>8} {"apply ms":>9}')
+    for name, (before, after) in {**training_edits(), **synthetic_edits()}.items():
+        expected = json_dsl_to_figma(figma_to_json_dsl(after))
+
+        # =====[ jsondiff over the int-keyed DSL ]=====
+        a_dslj, b_dslj = figma_to_json_dsl(before), figma_to_json_dsl(after)
+        js_diff = diff(a_dslj, b_dslj)
+        js_yaml = yaml.dump(js_diff, sort_keys=False)
+        assert json_dsl_to_figma(patch(a_dslj, js_diff)) == expected
+        js_diff_ms = timed(lambda: diff(figma_to_json_dsl(before), figma_to_json_dsl(after)), REPEAT)
+        js_apply_ms = timed(lambda: json_dsl_to_figma(patch(figma_to_json_dsl(before), js_diff)), REPEAT)
+
+        # =====[ Scene-aware ops ]=====
+        ops_yaml = dump_ops(get_scene_diff(before, after))
+        ops = yaml.safe_load(ops_yaml)
+        assert apply_scene_diff(before, ops) == expected
+        ops_diff_ms = timed(lambda: get_scene_diff(before, after), REPEAT)
+        ops_apply_ms = timed(lambda: apply_scene_diff(before, ops), REPEAT)
+
+        for engine, text, diff_ms, apply_ms in (('jsondiff', js_yaml, js_diff_ms, js_apply_ms),
+                                                 ('ops', ops_yaml, ops_diff_ms, ops_apply_ms)):
+            print(f'{name:<52} {engine:<9} {len(text):>7} {estimate_tokens(text):>8} {diff_ms:>8.2f} {apply_ms:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
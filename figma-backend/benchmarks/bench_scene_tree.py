@@ -0,0 +1,116 @@
+"""
+Per-request conversion time and peak memory of the scene-tree pipeline against the previous nested-dict
+pipeline, on large synthetic frames. Each variant runs in its own process so peak RSS is comparable.
+
+    python -m benchmarks.bench_scene_tree
+"""
+import sys
+import json
+import time
+import resource
+import tracemalloc
+import subprocess
+from copy import deepcopy
+from app.types import Scene, DSLJson, Coord
+from app.utils import normalize_dims, denormalize_dims, rgb_to_hex, hex_to_rgb
+from app.utils import lists_to_dicts, dicts_to_lists, extract_children
+from app.conversion import figma_to_json_dsl, json_dsl_to_placed_figma
+from benchmarks.scenes import synthetic_scene
+
+SCENES = {
+    '2k nodes (depth=10, fanout=200)': (10, 200),
+    '5k nodes (depth=25, fanout=200)': (25, 200),
+}
+REPEAT = 5
+
+
+########################################################################################################################
+# Previous dict pipeline, for reference
+########################################################################################################################
+
+def legacy_figma_to_json_dsl_inner(scene_norm: Scene):
+    if type(scene_norm) is list:
+        return [legacy_figma_to_json_dsl_inner(node) for node in scene_norm]
+    elif scene_norm.get('type') in ('FRAME', 'GROUP'):
+        scene_norm['node']['children'] = [legacy_figma_to_json_dsl_inner(c) for c in scene_norm['node']['children']]
+        return scene_norm
+    output_node = deepcopy(scene_norm)
+    if scene_norm['node'].get('color'):
+        output_node['node']['color'] = rgb_to_hex(scene_norm['node']['color'])
+    return output_node
+
+
+def legacy_json_dsl_to_figma_inner(scene):
+    if type(scene) is list:
+        return [legacy_json_dsl_to_figma_inner(node) for node in scene]
+    elif scene.get('type') in ('FRAME', 'GROUP'):
+        scene['node']['children'] = [legacy_json_dsl_to_figma_inner(c) for c in scene['node']['children']]
+        return scene
+    output_node = deepcopy(scene)
+    if scene['node'].get('color'):
+        output_node['node']['color'] = hex_to_rgb(scene['node']['color'])
+    return output_node
+
+
+def legacy_figma_to_json_dsl(scene_raw: Scene) -> DSLJson:
+    return lists_to_dicts(legacy_figma_to_json_dsl_inner(normalize_dims(scene_raw)))
+
+
+def legacy_json_dsl_to_placed_figma(scene: DSLJson, tl: Coord, w: int) -> Scene:
+    scene = extract_children(legacy_json_dsl_to_figma_inner(dicts_to_lists(scene)))
+    return denormalize_dims(scene, tl, w, inplace=True)
+
+
+PIPELINES = {
+    'dicts': (legacy_figma_to_json_dsl, legacy_json_dsl_to_placed_figma),
+    'tree': (figma_to_json_dsl, json_dsl_to_placed_figma),
+}
+
+
+########################################################################################################################
+# Benchmark
+########################################################################################################################
+
+def run_variant(pipeline: str, depth: int, fanout: int) -> dict:
+    """One edit-style request: Figma scene -> DSL (for the prompt) -> back to a placed Figma scene"""
+    to_dsl, to_figma = PIPELINES[pipeline]
+    scene = synthetic_scene(depth, fanout)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        to_figma(to_dsl(scene), (200, 200), 400)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()  # separate run; tracing skews the timings
+    to_figma(to_dsl(scene), (200, 200), 400)
+    _, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'ms': min(times) * 1000,
+        'peak_heap_mb': peak_heap / 2 ** 20,
+        'peak_rss_delta_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+    }
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--variant':
+        print(json.dumps(run_variant(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+        return
+
+    for name, (depth, fanout) in SCENES.items():
+        assert json.dumps(legacy_figma_to_json_dsl(synthetic_scene(depth, fanout))) == \
+               json.dumps(figma_to_json_dsl(synthetic_scene(depth, fanout)))
+
+    print(f'{"scene":<34} {"pipeline":<9} {"ms/request":>11} {"peak heap MB":>13} {"peak RSS +MB":>13}')
+    for name, (depth, fanout) in SCENES.items():
+        for pipeline in PIPELINES:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_scene_tree', '--variant', pipeline, str(depth), str(fanout)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            print(f'{name:<34} {pipeline:<9} {r["ms"]:>11.1f} {r["peak_heap_mb"]:>13.1f} {r["peak_rss_delta_mb"]:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Cold start: time from launching a server process to /healthcheck reporting ready, and the latency of the first
+primary / edit requests after that, with the startup warm-up (app.warmup) on and off. The server runs on the
+synthetic completion backend at zero latency, against a prefix store of N_FRAMES training frames.
+
+    python -m benchmarks.bench_startup
+"""
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import httpx
+from statistics import median
+from app.format_query import QueryCreator
+from app.utils import get_primary_and_edit_example
+from benchmarks.common import timed_post
+from benchmarks.scenes import training_scene
+
+SERVER_PORT = 8097
+N_FRAMES = 50
+RUNS = 3
+READY_TIMEOUT = 60.0
+
+
+def wait_ready(client: httpx.Client, start: float) -> float:
+    """Seconds from `start` until /healthcheck answers 200"""
+    while time.perf_counter() - start < READY_TIMEOUT:
+        try:
+            if client.get('/healthcheck').status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError('Server never became ready')
+
+
+def cold_start(store_path: str, warmup: bool, edit_scene: dict) -> dict:
+    """Milliseconds to ready and for each first request"""
+    env = {**os.environ, 'PREFIX_STORE_PATH': store_path, 'WARMUP': '1' if warmup else '0',
+           'COMPLETION_BACKEND': 'synthetic', 'SYNTHETIC_LATENCY': '0', 'LOG_LEVEL': 'WARNING'}
+    env.pop('COMPLETION_CACHE_PATH', None)
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(SERVER_PORT),
+                               '--log-level', 'warning'], env=env)
+    try:
+        with httpx.Client(base_url=f'http://127.0.0.1:{SERVER_PORT}', timeout=60.0) as client:
+            ready = wait_ready(client, start)
+            return {
+                'ready': ready * 1000,
+                'first primary': timed_post(client, '/convert/primary', {'prompt': 'a red square'})[0],
+                'first edit': timed_post(client, '/convert/edit', {'prompt': 'make it blue', 'scene': [edit_scene]})[0],
+            }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    scene = training_scene(N_FRAMES)
+    edit_scene = get_primary_and_edit_example(scene[1])[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, 'prefixes.pkl')
+        query_creator = QueryCreator(store_path)
+        query_creator.set_prefixes(scene)
+        query_creator.store.flush()
+        print(f'{N_FRAMES} training frames, median of {RUNS} cold starts (ms)')
+        print(f'{"warm-up":<8} {"ready":>8} {"first primary":>14} {"first edit":>11} {"ready + both":>13}')
+        for warmup in (False, True):
+            runs = [cold_start(store_path, warmup, edit_scene) for _ in range(RUNS)]
+            ms = {k: median(run[k] for run in runs) for k in runs[0]}
+            total = ms['ready'] + ms['first primary'] + ms['first edit']
+            print(f'{"on" if warmup else "off":<8} {ms["ready"]:>8.0f} {ms["first primary"]:>14.1f} '
+                  f'{ms["first edit"]:>11.1f} {total:>13.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+normalize_dims / denormalize_dims against the previous chained-deepcopy implementation, on synthetic deep and
+wide scenes; then the in-place normalize / denormalize with the pure-Python loops against the vectorized
+(numpy) path, by number of leaves. Also checks that the outputs are identical.
+
+    python -m benchmarks.bench_transform
+"""
+import timeit
+from copy import deepcopy
+from app import transform
+from app.types import Scene, Coord
+from app.utils import normalize_dims, denormalize_dims, get_tl_br_w_h, get_tlbr, OUTPUT_WIDTH
+from benchmarks.scenes import synthetic_scene
+
+LEAF_COUNTS = (32, 128, 512, 4000, 20000)  # wide scenes, for loops vs numpy
+
+SCENES = {
+    'deep (depth=150, fanout=4)': synthetic_scene(150, 4),
+    'wide (depth=1, fanout=4000)': synthetic_scene(1, 4000),
+    'mixed (depth=20, fanout=200)': synthetic_scene(20, 200),
+}
+
+
+########################################################################################################################
+# Previous implementation, for reference
+########################################################################################################################
+
+def legacy_affine_trans(scene: Scene, x=0.0, y=0.0, scale: float = 1.0):
+    scene = deepcopy(scene)
+    if type(scene) is list:
+        return [legacy_affine_trans(node, x=x, y=y, scale=scale) for node in scene]
+    elif scene.get('type') in ('FRAME', 'GROUP'):
+        scene['node']['children'] = [legacy_affine_trans(child, x=x, y=y, scale=scale)
+                                     for child in scene['node']['children']]
+        return scene
+    else:
+        position = scene['node']['position']
+        scene['node']['position'] = {
+            'x': int((position['x'] + x) * scale),
+            'y': int((position['y'] + y) * scale)
+        }
+        if scene['node'].get('fontSize'):
+            scene['node']['fontSize'] = int(scale * scene['node']['fontSize'])
+        scene['node']['width'] = int(scale * scene['node']['width'])
+        scene['node']['height'] = int(scale * scene['node']['height'])
+        return scene
+
+
+def legacy_normalize_dims(scene: Scene):
+    tl, br, w, h = get_tl_br_w_h(scene)
+    scale = OUTPUT_WIDTH / float(w)
+    scene_ = legacy_affine_trans(scene, x=-tl[0], y=-tl[1])
+    scene_ = legacy_affine_trans(scene_, x=0, y=0, scale=scale)
+    return scene_
+
+
+def legacy_denormalize_dims(scene: Scene, tl: Coord, w: int):
+    scale = float(w) / OUTPUT_WIDTH
+    scene_ = legacy_affine_trans(scene, scale=scale)
+    scene_ = legacy_affine_trans(scene_, x=tl[0], y=tl[1])
+    return scene_
+
+
+########################################################################################################################
+# Benchmark
+########################################################################################################################
+
+def best_of(fn, repeat: int = 3) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+
+def vectorized_rows(scene: Scene, repeat: int) -> dict:
+    """op -> ms, under the current transform settings; checks nothing (see `compare_vectorized`)"""
+    normed = normalize_dims(scene)
+    copies = [deepcopy(scene) for _ in range(repeat)]
+    normed_copies = [deepcopy(normed) for _ in range(repeat)]
+    return {
+        'normalize (inplace)': best_of(lambda: normalize_dims(copies.pop(), inplace=True), repeat),
+        'denormalize (inplace)': best_of(lambda: denormalize_dims(normed_copies.pop(), (37, 91), 733, inplace=True),
+                                         repeat),
+    }
+
+
+def compare_vectorized():
+    print(f'\n{"leaves":>7} {"op":<22} {"loops ms":>9} {"numpy ms":>9} {"speedup":>8}')
+    threshold = transform.VECTORIZE_MIN_LEAVES
+    for n_leaves in LEAF_COUNTS:
+        scene = synthetic_scene(1, n_leaves)
+        transform.VECTORIZE_MIN_LEAVES = float('inf')
+        expected = (get_tlbr(scene), normalize_dims(scene), denormalize_dims(normalize_dims(scene), (37, 91), 733))
+        loops = vectorized_rows(scene, 15)
+        transform.VECTORIZE_MIN_LEAVES = 0
+        got = (get_tlbr(scene), normalize_dims(scene), denormalize_dims(normalize_dims(scene), (37, 91), 733))
+        assert repr(got) == repr(expected), f'vectorized mismatch on {n_leaves} leaves'
+        vectorized = vectorized_rows(scene, 15)
+        for op in loops:
+            speedup = loops[op] / vectorized[op]
+            print(f'{n_leaves:>7} {op:<22} {loops[op]:>9.2f} {vectorized[op]:>9.2f} {speedup:>7.1f}x')
+    transform.VECTORIZE_MIN_LEAVES = threshold
+
+
+def main():
+    print(f'{"scene":<30} {"op":<12} {"legacy ms":>10} {"new ms":>10} {"inplace ms":>11} {"speedup":>8}')
+    for name, scene in SCENES.items():
+        normed = normalize_dims(scene)
+        assert normed == legacy_normalize_dims(scene), f'normalize_dims mismatch on {name}'
+        assert denormalize_dims(normed, (37, 91), 733) == legacy_denormalize_dims(normed, (37, 91), 733), \
+            f'denormalize_dims mismatch on {name}'
+
+        copies = [deepcopy(scene) for _ in range(3)]
+        rows = {
+            'normalize': (
+                best_of(lambda: legacy_normalize_dims(scene)),
+                best_of(lambda: normalize_dims(scene)),
+                best_of(lambda: normalize_dims(copies.pop(), inplace=True)),
+            ),
+        }
+        copies = [deepcopy(normed) for _ in range(3)]
+        rows['denormalize'] = (
+            best_of(lambda: legacy_denormalize_dims(normed, (37, 91), 733)),
+            best_of(lambda: denormalize_dims(normed, (37, 91), 733)),
+            best_of(lambda: denormalize_dims(copies.pop(), (37, 91), 733, inplace=True)),
+        )
+        for op, (legacy, new, inplace) in rows.items():
+            print(f'{name:<30} {op:<12} {legacy:>10.1f} {new:>10.1f} {inplace:>11.1f} {legacy / inplace:>7.1f}x')
+    compare_vectorized()
+
+
+if __name__ == '__main__':
+    main()
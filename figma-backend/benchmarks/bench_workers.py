@@ -0,0 +1,83 @@
+"""
+Requests/second through /convert/edit (YAML and geometry work on a few-hundred-node scene per request) with
+1..N gunicorn workers, against the local fake completion server. Prompts are unique, so every request misses
+the completion cache.
+
+    python -m benchmarks.bench_workers --workers 1 4 --clients 16
+"""
+import os
+import sys
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import httpx
+from benchmarks.common import load, wait_for_port
+from benchmarks.scenes import DATA_PATH, synthetic_scene
+
+FAKE_PORT = 8090
+SERVER_PORT = 8093
+
+
+async def throughput(clients: int, requests_per_client: int) -> float:
+    """Returns requests/second"""
+    scene = synthetic_scene(3, 100)
+
+    async def request(client: httpx.AsyncClient, ix: int):
+        response = await client.post('/convert/edit', json={'prompt': f'make it blue #{ix}', 'scene': [scene]})
+        response.raise_for_status()
+
+    n_requests = clients * requests_per_client
+    return n_requests / await load(SERVER_PORT, clients, n_requests, request)
+
+
+def serve(workers: int, state_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        'WEB_CONCURRENCY': str(workers),
+        'BIND': f'127.0.0.1:{SERVER_PORT}',
+        'OPENAI_API_BASE': f'http://127.0.0.1:{FAKE_PORT}/v1',
+        'OPENAI_API_KEY': 'fake',
+        'PREFIX_STORE_PATH': os.path.join(state_dir, 'data.pkl'),
+        'COMPLETION_CACHE_PATH': os.path.join(state_dir, 'completions.db'),
+    }
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning',
+                               'app.main:app'], env=env)
+    wait_for_port(SERVER_PORT, timeout=30)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, multiprocessing.cpu_count()])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=4, help='per client')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per fake completion')
+    args = parser.parse_args()
+
+    fake = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_completion_server',
+                             '--port', str(FAKE_PORT), '--latency', str(args.latency)])
+    try:
+        wait_for_port(FAKE_PORT)
+        print(f'{"workers":>8} {"clients":>8} {"req/s":>8}')
+        for workers in dict.fromkeys(args.workers):
+            state_dir = tempfile.mkdtemp()
+            shutil.copy(DATA_PATH, os.path.join(state_dir, 'data.pkl'))
+            server = serve(workers, state_dir)
+            try:
+                asyncio.run(throughput(args.clients, 1))  # warm-up: every worker loads its prefixes
+                rps = asyncio.run(throughput(args.clients, args.requests))
+                print(f'{workers:>8} {args.clients:>8} {rps:>8.1f}')
+            finally:
+                server.terminate()
+                server.wait()
+                shutil.rmtree(state_dir)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+DSL YAML dump / load time with the pure-Python PyYAML codec against the fast one (DSL emitter + libyaml loader),
+on the stored training scenes, plus a full prefix rebuild. Outputs are checked to be byte-identical.
+
+    python -m benchmarks.bench_yaml_codec
+"""
+from app import yaml_codec
+from app.yaml_codec import CODECS
+from app.conversion import figma_to_json_dsl
+from app.format_query import get_primary_prompt, get_edit_prompt
+from benchmarks.common import timed
+from benchmarks.scenes import training_scene, synthetic_scene
+
+REPEAT = 5
+
+
+def main():
+    scenes = {
+        'training frames (x4)': [figma_to_json_dsl(frame) for frame in training_scene(4)],
+        'training frames (x40)': [figma_to_json_dsl(frame) for frame in training_scene(40)],
+        'synthetic (2k nodes)': [figma_to_json_dsl(synthetic_scene(10, 200))],
+    }
+    pyyaml, fast = CODECS['pyyaml'], CODECS['fast']
+
+    print(f'{"case":<24} {"op":<16} {"pyyaml ms":>10} {"fast ms":>9} {"speedup":>8}')
+    for name, dsls in scenes.items():
+        texts = [pyyaml.dump(dsl) for dsl in dsls]
+        assert texts == [fast.dump(dsl) for dsl in dsls]
+        assert [pyyaml.load(text) for text in texts] == [fast.load(text) for text in texts]
+        for op, fn in (('dump', lambda codec: [codec.dump(dsl) for dsl in dsls]),
+                       ('load', lambda codec: [codec.load(text) for text in texts])):
+            slow_ms, fast_ms = timed(lambda: fn(pyyaml), REPEAT), timed(lambda: fn(fast), REPEAT)
+            print(f'{name:<24} {op:<16} {slow_ms:>10.2f} {fast_ms:>9.2f} {slow_ms / fast_ms:>7.1f}x')
+
+    # =====[ End to end: rebuilding both prompt prefixes ]=====
+    scene = training_scene(40)
+    results = {}
+    for codec_name in ('pyyaml', 'fast'):
+        yaml_codec.codec = CODECS[codec_name]
+        results[codec_name] = (get_primary_prompt(scene), get_edit_prompt(scene))
+        results[codec_name + ' ms'] = timed(lambda: (get_primary_prompt(scene), get_edit_prompt(scene)), REPEAT)
+    assert results['pyyaml'] == results['fast']
+    slow_ms, fast_ms = results['pyyaml ms'], results['fast ms']
+    print(f'{"training frames (x40)":<24} {"prefix rebuild":<16} {slow_ms:>10.2f} {fast_ms:>9.2f} {slow_ms / fast_ms:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Helpers shared by the benchmarks: timing a call or a request, serving an app in-process, and driving an HTTP
+server with concurrent clients.
+"""
+import json
+import time
+import socket
+import asyncio
+import threading
+import httpx
+import uvicorn
+from typing import Awaitable, Callable
+from fastapi import FastAPI
+
+
+def timed(fn, repeat: int = 1) -> float:
+    """The fastest of `repeat` calls of `fn`, in ms"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def timed_post(client: httpx.Client, path: str, body: dict) -> tuple:
+    """(ms, request bytes, response bytes, response json)"""
+    payload = json.dumps(body)
+    start = time.perf_counter()
+    response = client.post(path, content=payload, headers={'Content-Type': 'application/json'})
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000, len(payload), len(response.content), response.json()
+
+
+def percentile(ordered: list, p: float) -> float:
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+########################################################################################################################
+# Servers
+########################################################################################################################
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f'Nothing listening on port {port}')
+
+
+def serve_in_thread(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    wait_for_port(port)
+    return server
+
+
+async def load(port: int, clients: int, n_requests: int,
+               request: Callable[[httpx.AsyncClient, int], Awaitable[None]]) -> float:
+    """
+    Sends requests 0 .. n_requests - 1, as `request(client, ix)`, from `clients` concurrent clients sharing a
+    connection pool; returns the seconds it took
+    """
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', timeout=600.0) as client:
+        async def worker(worker_ix: int):
+            for ix in range(worker_ix, n_requests, clients):
+                await request(client, ix)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(ix) for ix in range(clients)])
+        return time.perf_counter() - start
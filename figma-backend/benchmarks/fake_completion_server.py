@@ -0,0 +1,86 @@
+"""
+Local stand-in for the OpenAI completions endpoint, for load-testing the backend without the network.
+
+    python -m benchmarks.fake_completion_server --port 8090 --latency 1.0 --token-latency 0.02
+    OPENAI_API_BASE=http://127.0.0.1:8090/v1 python -m app.main
+
+Like the real endpoint, it writes until a stop sequence or max_tokens (past the scene, the model keeps going), and
+takes TOKEN_LATENCY per token it writes on top of LATENCY. (COMPLETION_BACKEND=synthetic serves the same
+completion in-process, without the HTTP hop.)
+"""
+import argparse
+import asyncio
+import json
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from app.backends import synthetic_completion
+from app.example_selection import estimate_tokens, truncate_tokens
+
+LATENCY = 1.0  # seconds per completion
+TOKEN_LATENCY = 0.0  # seconds per generated token
+CHUNK_SIZE = 4  # characters per streamed "token"
+COMPLETION_TEXT = synthetic_completion()
+
+app = FastAPI()
+stats = {'requests': 0, 'max_tokens': 0, 'completion_tokens': 0}  # totals over the requests served
+
+
+def generate(body: dict) -> tuple:
+    """(text, finish_reason, completion tokens) for a request, honouring its stop sequences and max_tokens"""
+    max_tokens = body.get('max_tokens', 16)
+    stop = body.get('stop') or []
+    stop = [stop] if type(stop) is str else stop
+    written = body.get('prompt', '').rsplit('```', 1)[-1]  # the start of the answer, when continuing one
+    text = COMPLETION_TEXT
+    while len(text) <= len(written) or (not any(seq in text[len(written):] for seq in stop)
+                                        and estimate_tokens(text[len(written):]) <= max_tokens):
+        text += COMPLETION_TEXT  # nothing to stop it but max_tokens
+    text = text[len(written):]
+    for seq in stop:
+        text = text.split(seq)[0]
+    finish_reason = 'stop'
+    if estimate_tokens(text) > max_tokens:
+        text, finish_reason = truncate_tokens(text, max_tokens), 'length'
+    n_tokens = estimate_tokens(text)
+    stats['requests'] += 1
+    stats['max_tokens'] += max_tokens
+    stats['completion_tokens'] += n_tokens
+    return text, finish_reason, n_tokens
+
+
+@app.post('/v1/completions')
+async def completions(request: Request):
+    body = await request.json()
+    if body.get('stream'):
+        return StreamingResponse(stream_completion(body), media_type='text/event-stream')
+    text, finish_reason, n_tokens = generate(body)
+    await asyncio.sleep(LATENCY + TOKEN_LATENCY * n_tokens)
+    return {
+        'id': 'cmpl-fake',
+        'object': 'text_completion',
+        'model': body.get('model'),
+        'choices': [{'text': text, 'index': 0, 'logprobs': None, 'finish_reason': finish_reason}],
+        'usage': {'prompt_tokens': estimate_tokens(body.get('prompt', '')), 'completion_tokens': n_tokens},
+    }
+
+
+async def stream_completion(body: dict):
+    text, _, n_tokens = generate(body)
+    chunks = [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+    for chunk in chunks:
+        await asyncio.sleep((LATENCY + TOKEN_LATENCY * n_tokens) / len(chunks))
+        event = {'id': 'cmpl-fake', 'object': 'text_completion', 'model': body.get('model'),
+                 'choices': [{'text': chunk, 'index': 0, 'logprobs': None, 'finish_reason': None}]}
+        yield f'data: {json.dumps(event)}\n\n'
+    yield 'data: [DONE]\n\n'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=LATENCY)
+    parser.add_argument('--token-latency', type=float, default=TOKEN_LATENCY)
+    args = parser.parse_args()
+    LATENCY, TOKEN_LATENCY = args.latency, args.token_latency
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
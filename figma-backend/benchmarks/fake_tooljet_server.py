@@ -0,0 +1,77 @@
+"""
+Local stand-in for the ToolJet API endpoints the dashboard pipeline uses (app.tooljet), for running and
+benchmarking it without the network. Imports get fresh ids, as ToolJet's do; a fraction of requests can be
+turned away with a 503 to exercise the client's retries.
+
+    python -m benchmarks.fake_tooljet_server --port 8091 --latency 0.05 --fail-rate 0.1
+    TOOLJET_API_BASE=http://127.0.0.1:8091/api python -m app.main
+"""
+import uuid
+import random
+import asyncio
+import argparse
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+LATENCY = 0.05  # seconds per request
+FAIL_RATE = 0.0  # fraction of requests answered 503 without doing anything
+
+app = FastAPI()
+data_sources = {}  # id -> data source, with the app and version it belongs to
+stats = {'requests': 0, 'rejected': 0, 'imports': 0}
+
+
+async def serve():
+    stats['requests'] += 1
+    await asyncio.sleep(LATENCY)
+    if random.random() < FAIL_RATE:
+        stats['rejected'] += 1
+        raise HTTPException(status_code=503, detail='Service unavailable')
+
+
+@app.get('/api/health')
+async def health():
+    return {'status': 'ok'}
+
+
+@app.post('/api/apps/import')
+async def import_app(request: Request):
+    await serve()
+    body = await request.json()
+    if not body.get('name') or not body.get('appVersions'):
+        raise HTTPException(status_code=400, detail='Invalid import')
+    app_id, version_id = str(uuid.uuid4()), str(uuid.uuid4())
+    for source in body.get('dataSources') or []:
+        source_id = str(uuid.uuid4())
+        data_sources[source_id] = {'id': source_id, 'name': source['name'], 'kind': source.get('kind'),
+                                   'app_id': app_id, 'app_version_id': version_id, 'options': {}}
+    stats['imports'] += 1
+    slug = f'{body["name"].lower().replace(" ", "-")}-{app_id[:8]}'
+    return {'id': app_id, 'name': body['name'], 'slug': slug, 'editing_version': {'id': version_id}}
+
+
+@app.get('/api/data_sources')
+async def get_data_sources(app_id: str, app_version_id: str):
+    await serve()
+    return {'data_sources': [{k: v for k, v in source.items() if k != 'options'} for source in data_sources.values()
+                             if source['app_id'] == app_id and source['app_version_id'] == app_version_id]}
+
+
+@app.put('/api/data_sources/{source_id}')
+async def update_data_source(source_id: str, request: Request):
+    await serve()
+    if source_id not in data_sources:
+        raise HTTPException(status_code=404, detail='No such data source')
+    body = await request.json()
+    data_sources[source_id]['options'] = {option['key']: option['value'] for option in body.get('options') or []}
+    return {k: v for k, v in data_sources[source_id].items() if k != 'options'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8091)
+    parser.add_argument('--latency', type=float, default=LATENCY)
+    parser.add_argument('--fail-rate', type=float, default=FAIL_RATE)
+    args = parser.parse_args()
+    LATENCY, FAIL_RATE = args.latency, args.fail_rate
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
@@ -0,0 +1,99 @@
+"""Deterministic synthetic Figma scenes for benchmarks"""
+import pickle
+import random
+from copy import deepcopy
+from typing import Dict
+from app.types import FigmaNode, Scene
+
+DATA_PATH = 'app/data.pkl'  # the stored training scene
+
+
+def text_leaf(rng: random.Random, ix: int) -> FigmaNode:
+    return {'name': f'Text {ix}', 'type': 'TEXT', 'node': {
+        'characters': f'Label {ix}',
+        'color': {'r': 0, 'g': 0, 'b': 0},
+        'fontSize': rng.randint(8, 48),
+        'fontWeight': 400,
+        'position': {'x': rng.randint(0, 2000), 'y': rng.randint(0, 2000)},
+        'width': rng.randint(20, 400),
+        'height': rng.randint(10, 60),
+        'textAlignHorizontal': 'CENTER'
+    }}
+
+
+def shape_leaf(rng: random.Random, ix: int, node_type: str) -> FigmaNode:
+    return {'name': f'Shape {ix}', 'type': node_type, 'node': {
+        'color': {'r': rng.random(), 'g': rng.random(), 'b': rng.random()},
+        'opacity': 1,
+        'position': {'x': rng.randint(0, 2000), 'y': rng.randint(0, 2000)},
+        'cornerRadius': rng.choice([0, 4, 10]),
+        'width': rng.randint(5, 600),
+        'height': rng.randint(5, 600),
+        'strokeWeight': 1
+    }}
+
+
+def synthetic_leaf(rng: random.Random, ix: int) -> FigmaNode:
+    if rng.random() < 0.3:
+        return text_leaf(rng, ix)
+    return shape_leaf(rng, ix, rng.choice(['RECTANGLE', 'ELLIPSE']))
+
+
+def synthetic_scene(depth: int, fanout: int, seed: int = 0) -> FigmaNode:
+    """A GROUP tree `depth` levels deep where every group has `fanout` children (one of them a subgroup)"""
+    rng = random.Random(seed)
+    counter = [0]
+
+    def build(level: int) -> FigmaNode:
+        children = []
+        for i in range(fanout):
+            counter[0] += 1
+            if level < depth and i == 0:
+                children.append(build(level + 1))
+            else:
+                children.append(synthetic_leaf(rng, counter[0]))
+        return {'name': f'Group {level}', 'type': 'GROUP', 'node': {'children': children}}
+
+    return build(1)
+
+
+def mixed_scene(n_leaves: int, depth: int, mix: Dict[str, float], seed: int = 0) -> FigmaNode:
+    """
+    A FRAME holding `n_leaves` leaves drawn from `mix` (node type -> weight), spread over nested GROUP / FRAME
+    containers `depth` levels deep
+    """
+    rng = random.Random(seed)
+    types, weights = list(mix), list(mix.values())
+
+    def leaf(ix: int) -> FigmaNode:
+        node_type = rng.choices(types, weights)[0]
+        return text_leaf(rng, ix) if node_type == 'TEXT' else shape_leaf(rng, ix, node_type)
+
+    def build(level: int, first: int, n: int) -> FigmaNode:
+        container = 'FRAME' if level == 1 or rng.random() < 0.2 else 'GROUP'
+        if level >= depth or n <= 2:
+            children = [leaf(first + i) for i in range(n)]
+        else:
+            # =====[ Half the leaves sit at this level, the rest go to two or three subtrees ]=====
+            n_here = n // 2
+            children = [leaf(first + i) for i in range(n_here)]
+            n_sub = min(rng.randint(2, 3), n - n_here)
+            sizes = [(n - n_here) // n_sub + (i < (n - n_here) % n_sub) for i in range(n_sub)]
+            start = first + n_here
+            for size in sizes:
+                children.insert(rng.randint(0, len(children)), build(level + 1, start, size))
+                start += size
+        return {'name': f'{container.title()} {level}.{first}', 'type': container, 'node': {'children': children}}
+
+    return build(1, 0, n_leaves)
+
+
+def training_scene(n_frames: int) -> Scene:
+    """The stored training frames, repeated (with distinct names) up to `n_frames`"""
+    frames = pickle.load(open(DATA_PATH, 'rb'))['scene']
+    scene = []
+    for i in range(n_frames):
+        frame = deepcopy(frames[i % len(frames)])
+        frame['name'] = f'{frame["name"]} #{i}'
+        scene.append(frame)
+    return scene
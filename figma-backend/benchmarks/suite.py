@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark suite for the conversion pipeline. Every operation is timed on the shipped example scene
+and on deterministic synthetic scenes of several sizes, depths and node-type mixes; results (latency, throughput
+and peak traced memory) are written as JSON so that runs on different commits can be compared.
+
+    python -m benchmarks.suite                              # writes benchmarks/results/<commit>.json
+    python -m benchmarks.suite --quick --only yaml_         # fewer repeats, only matching operations
+    python -m benchmarks.suite --compare benchmarks/results/<other commit>.json
+
+The model is stubbed out: the primary / edit end-to-end operations format the real prompt, then "complete" it
+with the YAML the model would have produced for the case's scene (or its edit), and post-process that as the
+endpoints do.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from copy import deepcopy
+from typing import Callable, Dict, List, Optional
+from app.types import Scene
+from app.utils import normalize_dims, get_tl_br_w_h
+from app.conversion import figma_to_yaml, yaml_to_figma, get_scene_diff, apply_scene_diff
+from app.scene_diff import dump_ops
+from app.transform import collect_leaves
+from app.format_query import QueryCreator
+from app.batch import primary_result, edit_result
+from app.example_data import example_data
+from benchmarks.scenes import mixed_scene, training_scene, shape_leaf
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+SUITE_FORMAT = 1  # layout of the results file
+MIN_REPEAT, MIN_SECONDS = 5, 0.5  # each operation runs at least this many times and for at least this long
+REGRESSION_THRESHOLD = 1.15  # median slowdown reported by --compare
+
+SHAPES = {'RECTANGLE': 1, 'ELLIPSE': 1}
+MIXED = {'RECTANGLE': 4, 'ELLIPSE': 2, 'TEXT': 3}
+TEXT_HEAVY = {'RECTANGLE': 1, 'TEXT': 4}
+
+
+########################################################################################################################
+# Scenes
+########################################################################################################################
+
+def scene_cases() -> Dict[str, Scene]:
+    return {
+        'example_data': example_data,
+        'small (20 leaves, depth 2, mixed)': [mixed_scene(20, 2, MIXED)],
+        'medium (200 leaves, depth 4, mixed)': [mixed_scene(200, 4, MIXED)],
+        'large (2000 leaves, depth 6, mixed)': [mixed_scene(2000, 6, MIXED)],
+        'deep (500 leaves, depth 30, shapes)': [mixed_scene(500, 30, SHAPES)],
+        'flat (1000 leaves, depth 1, text-heavy)': [mixed_scene(1000, 1, TEXT_HEAVY)],
+    }
+
+
+def edited(scene: Scene, seed: int = 0) -> Scene:
+    """A typical edit of `scene`: a few leaves recolored and resized, one removed, one added, one reordered"""
+    rng = random.Random(seed)
+    scene = deepcopy(scene)
+    leaves = collect_leaves(scene)
+    for leaf in rng.sample(leaves, max(1, len(leaves) // 20)):
+        leaf['node']['color'] = {'r': 1.0, 'g': 0.0, 'b': 0.0}
+        leaf['node']['width'] += 10
+    containers = [node for node in _containers(scene) if len(node['node']['children']) > 1]
+    if containers:
+        children = rng.choice(containers)['node']['children']
+        del children[rng.randrange(len(children))]
+        children.insert(rng.randrange(len(children) + 1), children.pop(rng.randrange(len(children))))
+        children.insert(0, shape_leaf(rng, 10 ** 6, 'RECTANGLE'))
+    return scene
+
+
+def _containers(scene) -> list:
+    nodes = scene if type(scene) is list else [scene]
+    found = []
+    for node in nodes:
+        if node['type'] in ('FRAME', 'GROUP'):
+            found.append(node)
+            found.extend(_containers(node['node']['children']))
+    return found
+
+
+########################################################################################################################
+# Operations
+########################################################################################################################
+
+class StubLLM(object):
+    """Stands in for the completion API: answers every prompt with a canned completion"""
+
+    def __init__(self, completion: str):
+        self.completion = completion
+        self.prompt_chars = 0
+
+    def generate_yaml(self, prompt: str) -> str:
+        self.prompt_chars += len(prompt)
+        return self.completion
+
+
+def scene_operations(scene: Scene, query_creator: QueryCreator) -> Dict[str, Callable[[], object]]:
+    """Operation name -> zero-argument callable; inputs are prepared up front so only the operation is timed"""
+    after = edited(scene)
+    tl, _, w, _ = get_tl_br_w_h(scene)
+    yaml_str = figma_to_yaml(scene)
+    scene_diff = get_scene_diff(scene, after)
+    primary_llm, edit_llm = StubLLM(yaml_str), StubLLM(dump_ops(scene_diff))
+    root = scene[0] if len(scene) == 1 else scene
+
+    def primary_e2e():
+        prompt = query_creator.format_query_primary('a login form with a title and two buttons')
+        return primary_result(primary_llm.generate_yaml(prompt), tl, w)
+
+    def edit_e2e():
+        prompt = query_creator.format_query_edit('make a few of the shapes red', root)
+        return edit_result(edit_llm.generate_yaml(prompt), root)
+
+    return {
+        'figma_to_yaml': lambda: figma_to_yaml(scene),
+        'yaml_to_figma': lambda: yaml_to_figma(yaml_str, tl, w),
+        'get_scene_diff': lambda: get_scene_diff(scene, after),
+        'apply_scene_diff': lambda: apply_scene_diff(scene, scene_diff),
+        'normalize_dims': lambda: normalize_dims(scene),
+        'primary_e2e': primary_e2e,
+        'edit_e2e': edit_e2e,
+    }
+
+
+def prefix_operations(n_frames: int, tmp: str) -> Dict[str, Callable[[], object]]:
+    """/save-scene's prefix compilation on `n_frames` training frames: from scratch, and with one frame changed"""
+    scene = training_scene(n_frames)
+    changed = deepcopy(scene)
+    calls = [0]
+
+    def cold():
+        calls[0] += 1
+        query_creator = QueryCreator(os.path.join(tmp, f'cold-{n_frames}-{calls[0]}.pkl'))
+        query_creator.set_prefixes(scene)
+        query_creator.store.flush()
+
+    warm_creator = QueryCreator(os.path.join(tmp, f'warm-{n_frames}.pkl'))
+    warm_creator.set_prefixes(scene)
+
+    def one_changed():
+        collect_leaves(changed[calls[0] % n_frames])[0]['node']['width'] += 1
+        calls[0] += 1
+        warm_creator.set_prefixes(changed)
+        warm_creator.store.flush()
+
+    return {'set_prefixes (cold)': cold, 'set_prefixes (1 frame changed)': one_changed}
+
+
+########################################################################################################################
+# Measurement
+########################################################################################################################
+
+def measure(fn: Callable[[], object], n_nodes: int, min_repeat: int, min_seconds: float) -> dict:
+    fn()  # warm caches
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_repeat or time.perf_counter() - start < min_seconds:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    median = statistics.median(times)
+    return {
+        'runs': len(times),
+        'median_ms': round(median * 1000, 4),
+        'min_ms': round(min(times) * 1000, 4),
+        'stdev_ms': round(statistics.stdev(times) * 1000, 4) if len(times) > 1 else 0.0,
+        'ops_per_s': round(1 / median, 2),
+        'nodes_per_s': round(n_nodes / median, 1),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def count_nodes(scene) -> int:
+    return len(collect_leaves(scene)) + len(_containers(scene))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+        return out.stdout.strip() + ('-dirty' if dirty.stdout.strip() else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(only: str = '', min_repeat: int = MIN_REPEAT, min_seconds: float = MIN_SECONDS) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        query_creator = QueryCreator(os.path.join(tmp, 'prefixes.pkl'))
+        query_creator.set_prefixes(training_scene(10))
+        cases = [(name, count_nodes(scene), scene_operations(scene, query_creator))
+                 for name, scene in scene_cases().items()]
+        cases += [(f'training ({n} frames)', count_nodes(training_scene(n)), prefix_operations(n, tmp))
+                  for n in (10, 50)]
+        for case, n_nodes, operations in cases:
+            for operation, fn in operations.items():
+                if only not in operation:
+                    continue
+                key = f'{case} :: {operation}'
+                results[key] = {'case': case, 'operation': operation, 'nodes': n_nodes,
+                                **measure(fn, n_nodes, min_repeat, min_seconds)}
+                print(f'{key:<70} {results[key]["median_ms"]:>11.3f} ms {results[key]["peak_kib"]:>10.1f} KiB',
+                      flush=True)
+    return {
+        'format': SUITE_FORMAT,
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Prints median ratios against `baseline`; returns the keys that slowed down by more than `threshold`"""
+    print(f'\nagainst {baseline.get("commit")} ({baseline.get("created")}): current / baseline median')
+    regressions = []
+    for key, result in current['results'].items():
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  <-- slower'
+            regressions.append(key)
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print(f'{key:<70} {ratio:>6.2f}x  peak {before["peak_kib"]:.0f} -> {result["peak_kib"]:.0f} KiB{flag}')
+    return regressions
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    parser.add_argument('--only', default='', help='only run operations whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='fewer repeats; noisier, for smoke-testing')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='slowdown ratio that --compare reports as a regression (exits 1)')
+    args = parser.parse_args(argv)
+
+    report = run(args.only, *((1, 0.0) if args.quick else (MIN_REPEAT, MIN_SECONDS)))
+    out = args.out or os.path.join(RESULTS_DIR, f'{report["commit"] or "results"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nwrote {out}')
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(report, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Production server profile: gunicorn managing uvicorn workers, one per core by default.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Workers share state through files rather than memory: the prompt prefixes live in the prefix store (each worker
+picks up another worker's /save-scene within PREFIX_REFRESH_INTERVAL seconds), and completions and edit sessions
+are kept in shared SQLite files.
+"""
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:8080')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = int(os.environ.get('WORKER_TIMEOUT', 120))  # completions alone can take up to a minute
+graceful_timeout = 30
+keepalive = 5
+# each worker imports the app itself, so it gets its own event loop, HTTP client and SQLite connection
+preload_app = False
+
+# =====[ Shared across workers unless configured otherwise ]=====
+os.environ.setdefault('COMPLETION_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'completions.db'))
+os.environ.setdefault('SESSION_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sessions.db'))
@@ -0,0 +1,23 @@
+"""Figma scene factories shared by the tests"""
+from app.scene import from_figma, to_figma
+from app.scene_diff import Patch
+
+GREY = {'r': 0.5, 'g': 0.5, 'b': 0.5}
+
+
+def rect(name: str, x: int = 0, y: int = 0, w: int = 10, h: int = 10, **props) -> dict:
+    return {'name': name, 'type': 'RECTANGLE',
+            'node': {**props, 'position': {'x': x, 'y': y}, 'width': w, 'height': h}}
+
+
+def group(name: str, *children: dict) -> dict:
+    return {'name': name, 'type': 'GROUP', 'node': {'children': list(children)}}
+
+
+def frame(*children: dict) -> dict:
+    return {'name': 'Frame', 'type': 'FRAME', 'node': {'children': list(children)}}
+
+
+def patched(scene: dict, ops: list) -> dict:
+    """`scene` with the ops applied"""
+    return to_figma(Patch(ops).apply(from_figma(scene)))
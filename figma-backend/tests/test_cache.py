@@ -0,0 +1,93 @@
+import time
+import asyncio
+from app.cache import CompletionCache
+
+
+def test_miss_then_hit():
+    cache = CompletionCache()
+    assert cache.get('a') is None
+    cache.set('a', 'completion')
+    assert cache.get('a') == 'completion'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_keys_cover_params_and_prompt():
+    key = CompletionCache.make_key('a prompt', {'temperature': 0})
+    assert key == CompletionCache.make_key('a prompt', {'temperature': 0})
+    assert key != CompletionCache.make_key('a prompt', {'temperature': 0.7})
+    assert key != CompletionCache.make_key('another prompt', {'temperature': 0})
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = CompletionCache(max_entries=2)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    cache.get('a')  # b is now the least recently used
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1' and cache.get('c') == '3'
+    assert cache.stats()['memory_entries'] == 2
+
+
+def test_ttl_expires_entries():
+    cache = CompletionCache(ttl=0.01)
+    cache.set('a', '1')
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disk_tier_persists_across_instances(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    CompletionCache(db_path=db_path).set('a', 'completion')
+    cache = CompletionCache(db_path=db_path)
+    assert cache.get('a') == 'completion'
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_disk_tier_answers_what_memory_evicted(tmp_path):
+    cache = CompletionCache(max_entries=1, db_path=str(tmp_path / 'cache.db'))
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.get('a') == '1'
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_overwriting_a_key_keeps_one_row(tmp_path):
+    cache = CompletionCache(db_path=str(tmp_path / 'cache.db'))
+    cache.set('a', '1')
+    cache.set('a', '2')
+    assert CompletionCache(db_path=cache.db_path).get('a') == '2'
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_disk_tier_caps_rows_evicting_least_recently_used(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    cache = CompletionCache(max_entries=1, db_path=db_path, max_db_entries=3)
+    for key in 'abc':
+        cache.set(key, key)
+        time.sleep(0.001)  # (distinct access times)
+    cache.get('a')  # read from the file, so b is now its least recently used row
+    time.sleep(0.001)
+    cache.set('d', 'd')
+    assert cache.stats()['disk_entries'] == 3
+    fresh = CompletionCache(db_path=db_path)
+    assert [fresh.get(key) for key in 'abcd'] == ['a', None, 'c', 'd']
+
+
+def test_row_cap_counts_rows_written_by_other_instances(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    first, second = (CompletionCache(db_path=db_path, max_db_entries=4) for _ in range(2))
+    for i in range(4):
+        first.set(f'first {i}', '')
+        second.set(f'second {i}', '')
+    second.set('last', '')
+    assert second.stats()['disk_entries'] == 4
+
+
+def test_aset_writes_through_to_disk(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    cache = CompletionCache(db_path=db_path)
+    asyncio.run(cache.aset('a', 'completion'))
+    assert cache.get('a') == 'completion'
+    assert CompletionCache(db_path=db_path).get('a') == 'completion'
@@ -0,0 +1,127 @@
+import pytest
+from app.batch import edit_result
+from app.context_pruning import Pruning, edit_context, restore_ops, PRUNE_MIN_LEAVES
+from app.conversion import figma_to_yaml
+from app.repair import ParseReport
+from app.scene_diff import dump_ops
+from factories import GREY, rect, group, frame, patched
+
+
+def grid_scene(n: int = 200) -> dict:
+    """`n` tiles in rows of 20, each 10x10 with a 10px gap, named by position; a group of two holds the login"""
+    tiles = [rect(f'Tile {i}', (i % 20) * 20, (i // 20) * 20, color=GREY) for i in range(n)]
+    login = group('Login Group', rect('Login Background', 500, 500, 40, 10, color=GREY),
+                  rect('Login Label', 505, 502, 30, 6, color=GREY))
+    return frame(*tiles[:50], login, *tiles[50:])
+
+
+def names(scene: dict) -> list:
+    return [child['name'] for child in scene['node']['children']]
+
+
+########################################################################################################################
+# Pruning
+########################################################################################################################
+
+def test_small_scenes_are_not_pruned():
+    scene = grid_scene(PRUNE_MIN_LEAVES // 2)
+    assert edit_context('make Tile 3 red', scene) == (figma_to_yaml(scene), None)
+
+
+def test_instructions_naming_nothing_get_the_whole_scene():
+    scene = grid_scene()
+    assert edit_context('add a footer', scene) == (figma_to_yaml(scene), None)
+
+
+def test_named_leaf_and_its_neighbours_are_shown_under_their_full_indices():
+    scene = grid_scene()
+    yaml_str, pruning = edit_context('make Tile 120 red', scene)
+    assert yaml_str.startswith('# not shown: ')
+    assert '  121:\n      name: Tile 120\n' in yaml_str  # (after the login group, at index 50)
+    assert 'Tile 121\n' in yaml_str and 'Tile 100\n' in yaml_str  # its neighbours in the grid
+    assert 'Tile 199\n' not in yaml_str
+    assert pruning.partial == {(): 201} and pruning.total == 202 and pruning.shown < 20
+
+
+def test_a_named_group_is_shown_whole():
+    yaml_str, pruning = edit_context('make the login group wider', grid_scene())
+    assert 'Login Background' in yaml_str and 'Login Label' in yaml_str
+    assert (50,) not in pruning.partial
+
+
+########################################################################################################################
+# Restoring ops
+########################################################################################################################
+
+SCENE = frame(*[rect(f'N{i}', i * 20, 0) for i in range(8)])  # the model saw N1, N4 and N6
+PRUNING = Pruning({(): 8}, 3, 8)
+
+
+def restored(ops: list) -> list:
+    return names(patched(SCENE, restore_ops(ops, PRUNING)))
+
+
+def test_paths_need_no_remapping():
+    ops = [{'update': [4], 'set': {'width': 99}}, {'delete': [6]}]
+    assert restore_ops(ops, PRUNING) == ops
+
+
+def test_insert_goes_before_the_child_with_that_index():
+    insert = {'insert': [], 'at': 4, 'node': rect('New', 0, 0)}
+    assert restored([insert]) == ['N0', 'N1', 'N2', 'N3', 'New', 'N4', 'N5', 'N6', 'N7']
+
+
+def test_insert_after_the_last_shown_child_keeps_the_hidden_ones_before_it():
+    insert = {'insert': [], 'at': 7, 'node': rect('New', 0, 0)}
+    assert restored([insert]) == ['N0', 'N1', 'N2', 'N3', 'N4', 'N5', 'N6', 'New', 'N7']
+    insert = {'insert': [], 'at': 8, 'node': rect('New', 0, 0)}
+    assert restored([insert]) == ['N0', 'N1', 'N2', 'N3', 'N4', 'N5', 'N6', 'N7', 'New']
+
+
+def test_insert_next_to_a_deleted_child():
+    ops = [{'delete': [4]}, {'insert': [], 'at': 4, 'node': rect('New', 0, 0)}]
+    assert restored(ops) == ['N0', 'N1', 'N2', 'N3', 'New', 'N5', 'N6', 'N7']
+
+
+def test_moves_leave_hidden_siblings_in_place():
+    assert restored([{'move': [6], 'to': 1}]) == ['N0', 'N6', 'N1', 'N2', 'N3', 'N4', 'N5', 'N7']
+    assert restored([{'move': [1], 'to': 6}]) == ['N0', 'N2', 'N3', 'N4', 'N5', 'N1', 'N6', 'N7']
+
+
+def test_several_inserts_before_the_same_child_keep_their_order():
+    ops = [{'insert': [], 'at': 4, 'node': rect('A', 0, 0)}, {'insert': [], 'at': 4, 'node': rect('B', 0, 0)},
+           {'move': [6], 'to': 4}]
+    assert restored(ops) == ['N0', 'N1', 'N2', 'N3', 'A', 'B', 'N6', 'N4', 'N5', 'N7']
+
+
+def test_parents_without_hidden_children_are_left_alone():
+    ops = [{'insert': [2], 'at': 0, 'node': rect('New', 0, 0)}]
+    assert restore_ops(ops, Pruning({(): 8}, 3, 8)) == ops
+
+
+def test_replace_is_dropped():
+    report = ParseReport()
+    assert restore_ops([{'replace': [], 'node': rect('All', 0, 0)}], PRUNING, report) == []
+    assert len(report.dropped) == 1
+
+
+def test_no_pruning_passes_ops_through():
+    ops = [{'insert': [], 'at': 4, 'node': rect('New', 0, 0)}]
+    assert restore_ops(ops, None) is ops
+
+
+@pytest.mark.parametrize('target', [0, 37, 120, 200])
+def test_edit_against_the_pruned_scene_lands_on_the_full_scene(target):
+    scene = grid_scene()
+    name = names(scene)[target]
+    yaml_str, pruning = edit_context(f'make {name} red and put a badge before it', scene)
+    assert pruning is not None
+    ops = [{'update': [target], 'set': {'color': '#ff0000'}},
+           {'insert': [], 'at': target, 'node': {'name': 'Badge', 'type': 'RECTANGLE', 'node': {
+               'color': '#00ff00', 'position': {'x': 1, 'y': 1}, 'width': 2, 'height': 2}}}]
+    result = edit_result(dump_ops(ops), scene, pruning)
+    children = result['outputScene'][0]['node']['children']
+    assert [c['name'] for c in children] == names(scene)[:target] + ['Badge'] + names(scene)[target:]
+    assert children[target + 1]['node']['color'] == {'r': 1.0, 'g': 0.0, 'b': 0.0}
+    assert result['outputScene'] == edit_result(dump_ops(ops), scene)['outputScene']  # (the whole scene's diff)
+    assert not result['dropped']
@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from app.dashboard import build_dashboard
+
+
+class StalledClient(object):
+    """A ToolJet client whose connection never finishes warming up"""
+
+    def __init__(self):
+        self.warming = None
+
+    async def warm(self):
+        self.warming = asyncio.current_task()
+        await asyncio.sleep(60)
+
+
+def test_warm_up_is_cancelled_when_the_completion_is_unusable():
+    client = StalledClient()
+
+    async def generate(prompt: str) -> str:
+        await asyncio.sleep(0)
+        return 'not: [an app'
+
+    async def build():
+        with pytest.raises(ValueError):
+            await build_dashboard('films', client, generate)
+        await asyncio.sleep(0)
+        return client.warming.cancelled()
+
+    assert asyncio.run(build())
@@ -0,0 +1,82 @@
+from app.conversion import figma_to_dsl_tree
+from app.dsl_format import CompactDSL, VerboseDSL
+from app.example_data import example_data
+from app.scene import to_dsl
+
+RECT = {'name': 'Window', 'type': 'RECTANGLE', 'node': {
+    'color': '#ffffff', 'opacity': 1, 'position': {'x': 0, 'y': 4}, 'cornerRadius': 0, 'width': 100, 'height': 69,
+    'strokeWeight': 1, 'dropShadow': 4}}
+TEXT = {'name': 'Title', 'type': 'TEXT', 'node': {
+    'characters': 'Sign in', 'position': {'x': 10, 'y': 10}, 'width': 30, 'height': 6, 'fontSize': 4,
+    'fontWeight': 700, 'textAlignHorizontal': 'CENTER'}}
+GROUP = {'name': 'Card', 'type': 'GROUP', 'node': {'children': {0: RECT, 1: TEXT}}}
+
+
+def example_dsl() -> dict:
+    return to_dsl(figma_to_dsl_tree(example_data[0]))
+
+
+def test_compact_nodes_are_flat_with_short_keys_and_no_defaults():
+    assert CompactDSL().encode_node(RECT) == {'n': 'Window', 't': 'RECTANGLE', 'c': '#ffffff', 'b': [0, 4, 100, 69],
+                                              'sh': 4}
+    assert CompactDSL().encode_node(TEXT) == {'n': 'Title', 't': 'TEXT', 'tx': 'Sign in', 'b': [10, 10, 30, 6],
+                                              'fs': 4, 'fw': 700}
+
+
+def test_compact_round_trips():
+    dsl = CompactDSL()
+    for scene in (RECT, TEXT, GROUP, {0: RECT, 1: GROUP}, example_dsl()):
+        assert dsl.decode_scene(dsl.encode_scene(scene)) == scene
+
+
+def test_missing_default_bearing_properties_are_written_as_null():
+    rect = {**RECT, 'node': {k: v for k, v in RECT['node'].items() if k != 'opacity'}}
+    encoded = CompactDSL().encode_node(rect)
+    assert encoded['o'] is None
+    assert CompactDSL().decode_node(encoded) == rect
+
+
+def test_a_default_of_another_type_is_kept():
+    rect = {**RECT, 'node': {**RECT['node'], 'opacity': 1.0}}
+    assert CompactDSL().encode_node(rect)['o'] == 1.0
+
+
+def test_geometry_is_quantized_to_the_grid():
+    dsl = CompactDSL(grid=2)
+    encoded = dsl.encode_node(RECT)
+    assert encoded['b'] == [0, 2, 50, 34]  # (69 / 2 rounds to even)
+    assert dsl.decode_node(encoded)['node']['height'] == 68
+
+
+def test_nodes_outside_the_schema_stay_verbose():
+    reserved = {**RECT, 'node': {**RECT['node'], 'n': 'a property named like an alias'}}
+    extra_key = {**RECT, 'id': 7}
+    nulled = {**RECT, 'node': {**RECT['node'], 'opacity': None}}
+    for node in (reserved, extra_key, nulled):
+        assert CompactDSL().encode_node(node) is node
+
+
+def test_verbose_input_decodes_unchanged():
+    assert CompactDSL().decode_scene(GROUP) == GROUP
+    assert CompactDSL().decode_scene([RECT, TEXT]) == [RECT, TEXT]
+
+
+def test_ops_decode_aliases_and_the_geometry_tuple():
+    ops = [{'update': [0], 'set': {'c': '#ff0000', 'b': [1, 2, 3, 4]}},
+           {'update': [1], 'unset': ['sh', 'b']},
+           {'insert': [], 'at': 0, 'node': CompactDSL().encode_node(TEXT)}]
+    assert CompactDSL().decode_ops(ops) == [
+        {'update': [0], 'set': {'color': '#ff0000', 'position': {'x': 1, 'y': 2}, 'width': 3, 'height': 4}},
+        {'update': [1], 'unset': ['dropShadow', 'position', 'width', 'height']},
+        {'insert': [], 'at': 0, 'node': TEXT}]
+
+
+def test_encode_props_keeps_defaults():
+    assert CompactDSL().encode_props({'opacity': 1, 'position': {'x': 1, 'y': 2}, 'width': 3, 'height': 4}) == \
+        {'o': 1, 'b': [1, 2, 3, 4]}
+
+
+def test_verbose_is_the_identity():
+    dsl = VerboseDSL()
+    assert dsl.encode_scene(GROUP) is GROUP and dsl.decode_scene(GROUP) is GROUP
+    assert dsl.decode_ops([{'delete': [0]}]) == [{'delete': [0]}]
@@ -0,0 +1,42 @@
+import os
+import pickle
+import pytest
+from app import example_selection
+from app.example_selection import approximate_tokens, truncate_tokens, APPROX_TOKEN_MARGIN
+from app.format_query import get_frame_fragments
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'app', 'data.pkl')
+
+
+def training_prompts() -> list:
+    with open(DATA_PATH, 'rb') as f:
+        scene = pickle.load(f)['scene']
+    fragments = [get_frame_fragments(frame) for frame in scene]
+    return [f[kind] for f in fragments for kind in ('primary', 'edit') if f[kind] is not None]
+
+
+@pytest.fixture(scope='module')
+def encoding():
+    tiktoken = pytest.importorskip('tiktoken')
+    try:
+        return tiktoken.get_encoding('p50k_base')
+    except Exception as e:  # (the vocabulary is downloaded on first use)
+        pytest.skip(f'p50k_base unavailable: {e}')
+
+
+def test_the_approximation_never_undercounts_the_tokenizer(encoding):
+    for text in training_prompts():
+        assert approximate_tokens(text) >= len(encoding.encode(text))
+
+
+def test_the_approximation_counts_newlines():
+    assert approximate_tokens('a\nb') == approximate_tokens('a b c') > approximate_tokens('a b')
+
+
+def test_truncation_fits_the_approximate_count(monkeypatch):
+    monkeypatch.setattr(example_selection, '_ENCODING', None)
+    text = training_prompts()[0]
+    for n in (0, 1, 10, 100):
+        truncated = truncate_tokens(text, n)
+        assert text.startswith(truncated) and approximate_tokens(truncated) <= n
+    assert approximate_tokens(text) > 100 * APPROX_TOKEN_MARGIN
@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+from app.hedging import Hedger, HedgeBudget, LatencyWindow, HEDGE_MIN_SAMPLES
+
+CLEAN, UNCLEAN = 'clean\n```', 'unclean\n```'
+
+
+def accept(yaml_str: str):
+    return yaml_str.strip(), yaml_str.strip() == 'clean'
+
+
+def scripted(*answers):
+    """A completion function whose n-th call sleeps, then returns or raises answers[n] = (delay, text / error)"""
+    calls = []
+
+    async def complete(prompt: str, **params) -> str:
+        delay, answer = answers[len(calls)]
+        calls.append(params)
+        await asyncio.sleep(delay)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    return complete, calls
+
+
+def run(hedger: Hedger, complete):
+    return asyncio.run(hedger.run('a prompt', complete, accept))
+
+
+def test_hedging_is_off_with_one_candidate_and_no_percentile():
+    assert not Hedger(candidates=1, percentile=0).enabled
+    assert Hedger(candidates=2, percentile=0).enabled and Hedger(candidates=1, percentile=95).enabled
+    assert not Hedger(candidates=2, max_calls=1).enabled
+
+
+def test_a_clean_first_answer_is_used_as_is():
+    complete, calls = scripted((0, CLEAN))
+    hedged = run(Hedger(candidates=1, percentile=95, delay=5), complete)
+    assert (hedged.result, hedged.kind, hedged.clean, hedged.deterministic) == ('clean', 'first', True, True)
+    assert calls == [{}]
+
+
+def test_candidates_are_sampled_and_not_deterministic():
+    complete, calls = scripted((0.02, UNCLEAN), (0, CLEAN))
+    hedged = run(Hedger(candidates=2, percentile=0, temperature=0.7, budget=HedgeBudget(1, 1)), complete)
+    assert hedged.kind == 'candidate' and hedged.clean and not hedged.deterministic
+    assert calls == [{}, {'temperature': 0.7}]
+
+
+def test_a_slow_first_call_is_hedged_and_cancelled():
+    complete, calls = scripted((1.0, CLEAN), (0, CLEAN))
+    hedger = Hedger(candidates=1, percentile=95, delay=0.01, budget=HedgeBudget(1, 1))
+    hedged = run(hedger, complete)
+    assert hedged.kind == 'hedge' and hedged.deterministic  # (a hedge is a plain call, at the usual temperature)
+    assert calls == [{}, {}]
+    assert hedger.stats()['wins'] == {'hedge': 1}
+
+
+def test_a_failed_call_is_retried():
+    complete, calls = scripted((0, RuntimeError('upstream')), (0, CLEAN))
+    hedged = run(Hedger(candidates=1, percentile=95, delay=5, budget=HedgeBudget(1, 1)), complete)
+    assert hedged.kind == 'retry' and hedged.deterministic
+
+
+def test_an_unclean_answer_is_resampled():
+    complete, calls = scripted((0, UNCLEAN), (0, CLEAN))
+    hedged = run(Hedger(candidates=1, percentile=95, delay=5, temperature=0.5, budget=HedgeBudget(1, 1)), complete)
+    assert hedged.kind == 'resample' and not hedged.deterministic
+    assert calls[1] == {'temperature': 0.5}
+
+
+def test_the_first_answer_is_the_fallback_when_none_is_clean():
+    complete, calls = scripted((0, UNCLEAN), (0, UNCLEAN), (0, UNCLEAN))
+    hedged = run(Hedger(candidates=1, percentile=95, delay=5, max_calls=3, budget=HedgeBudget(5, 5)), complete)
+    assert (hedged.result, hedged.kind, hedged.clean) == ('unclean', 'first', False)
+    assert len(calls) == 3  # max_calls
+
+
+def test_an_empty_budget_allows_no_extra_calls():
+    complete, calls = scripted((0, RuntimeError('upstream')), (0, CLEAN))
+    with pytest.raises(RuntimeError):
+        run(Hedger(candidates=2, percentile=0, budget=HedgeBudget(0, 0)), complete)
+    assert len(calls) == 1
+
+
+def test_budget_earns_a_fraction_of_a_call_per_request():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    budget.tokens = 0
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw() and not budget.withdraw()
+
+
+def test_latency_window_needs_enough_samples():
+    window = LatencyWindow()
+    for ix in range(HEDGE_MIN_SAMPLES - 1):
+        window.observe(ix)
+    assert window.percentile(50) is None
+    window.observe(HEDGE_MIN_SAMPLES - 1)
+    assert window.percentile(50) == HEDGE_MIN_SAMPLES // 2
+    assert window.percentile(100) == HEDGE_MIN_SAMPLES - 1
@@ -0,0 +1,62 @@
+from app.output_budget import (OutputBudget, BudgetFeatures, budget_features, size_class, OUTPUT_BUDGET_MIN_SAMPLES,
+                               OUTPUT_BUDGET_MARGIN, OUTPUT_BUDGET_SLACK)
+
+EDIT = BudgetFeatures('edit', 40, 5)
+
+
+def trained(budget: OutputBudget, features: BudgetFeatures, tokens: int, n: int = OUTPUT_BUDGET_MIN_SAMPLES):
+    for _ in range(n):
+        budget.observe(features, tokens)
+    return budget
+
+
+def test_features_count_leaves_and_words():
+    scene = {'name': 'Frame', 'type': 'FRAME', 'node': {'children': [
+        {'name': 'A', 'type': 'RECTANGLE', 'node': {}}, {'name': 'B', 'type': 'RECTANGLE', 'node': {}}]}}
+    assert budget_features('edit', 'make it red', scene) == BudgetFeatures('edit', 2, 3)
+    assert budget_features('primary', 'a login form') == BudgetFeatures('primary', 0, 3)
+
+
+def test_sizes_are_bucketed_by_powers_of_two():
+    assert [size_class(n) for n in (0, 1, 2, 3, 4, 7, 8)] == [0, 1, 2, 2, 3, 3, 4]
+
+
+def test_no_prediction_until_enough_samples():
+    budget = trained(OutputBudget(path=None, enabled=True), EDIT, 100, OUTPUT_BUDGET_MIN_SAMPLES - 1)
+    assert budget.predict(EDIT) is None
+    budget.observe(EDIT, 100)
+    assert budget.predict(EDIT) == int(100 * OUTPUT_BUDGET_MARGIN) + OUTPUT_BUDGET_SLACK
+
+
+def test_similar_requests_share_the_less_specific_buckets():
+    budget = trained(OutputBudget(path=None, enabled=True), EDIT, 100)
+    assert budget.predict(BudgetFeatures('edit', 40, 100)) is not None  # same kind and scene size
+    assert budget.predict(BudgetFeatures('edit', 5000, 100)) is not None  # same kind
+    assert budget.predict(BudgetFeatures('primary', 0, 5)) is None
+
+
+def test_the_most_specific_bucket_wins():
+    budget = trained(OutputBudget(path=None, enabled=True), EDIT, 100)
+    trained(budget, BudgetFeatures('edit', 4000, 5), 600)
+    assert budget.predict(EDIT) == int(100 * OUTPUT_BUDGET_MARGIN) + OUTPUT_BUDGET_SLACK
+
+
+def test_predictions_over_the_ceiling_use_the_ceiling():
+    budget = OutputBudget(path=None, enabled=True)
+    trained(budget, EDIT, budget.ceiling)
+    assert budget.predict(EDIT) is None
+
+
+def test_disabled_budgets_neither_learn_nor_predict():
+    budget = trained(OutputBudget(path=None, enabled=False), EDIT, 100)
+    assert budget.predict(EDIT) is None and budget.stats()['observations'] == 0
+
+
+def test_observations_persist_and_torn_lines_are_skipped(tmp_path):
+    path = str(tmp_path / 'budget.jsonl')
+    first = trained(OutputBudget(path=path, enabled=True), EDIT, 100)
+    with open(path, 'a') as f:
+        f.write('{"kind": "edit", "leav')
+    second = OutputBudget(path=path, enabled=True)
+    assert second.predict(EDIT) == first.predict(EDIT)
+    assert second.stats()['observations'] == OUTPUT_BUDGET_MIN_SAMPLES
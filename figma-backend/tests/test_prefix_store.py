@@ -0,0 +1,50 @@
+import pickle
+import shutil
+from app import format_query
+from app.format_query import QueryCreator
+from app.prefix_store import PrefixStore
+
+FRAME = {'name': '1. A login form', 'type': 'FRAME', 'node': {'children': []}}
+
+
+def write_seed(path: str, scene: list) -> bytes:
+    with open(path, 'wb') as f:
+        pickle.dump({'scene': scene, 'primary_prefix': 'seeded', 'edit_prefix': ''}, f)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_the_seed_is_read_until_the_store_is_written(tmp_path):
+    seed_path, path = str(tmp_path / 'seed.pkl'), str(tmp_path / 'state' / 'prefixes.pkl')
+    seed = write_seed(seed_path, [FRAME])
+    store = PrefixStore(path, seed_path=seed_path)
+    assert store.load() and store.primary_prefix == 'seeded' and not store.stale()
+    store.update([FRAME], {}, 'saved', '')
+    store.flush()
+    assert PrefixStore(path, seed_path=seed_path).load() and PrefixStore(path).load()
+    restarted = PrefixStore(path, seed_path=seed_path)
+    restarted.load()
+    assert restarted.primary_prefix == 'saved'
+    with open(seed_path, 'rb') as f:
+        assert f.read() == seed
+
+
+def test_a_store_without_a_file_or_seed_loads_nothing(tmp_path):
+    assert not PrefixStore(str(tmp_path / 'prefixes.pkl')).load()
+
+
+def test_saving_a_scene_leaves_the_seed_alone(tmp_path, monkeypatch):
+    seed_path, path = str(tmp_path / 'seed.pkl'), str(tmp_path / 'prefixes.pkl')
+    shutil.copy(format_query.PREFIX_SEED_PATH, seed_path)
+    with open(seed_path, 'rb') as f:
+        seed = f.read()
+    monkeypatch.setattr(format_query, 'PREFIX_SEED_PATH', seed_path)
+    monkeypatch.setattr(format_query, 'PREFIX_STORE_PATH', path)
+    query_creator = QueryCreator()
+    query_creator.refresh()
+    assert query_creator.primary_prefix == pickle.loads(seed)['primary_prefix']
+    query_creator.set_prefixes(query_creator.training_scene[:1])
+    query_creator.store.flush()
+    assert len(QueryCreator().snapshot('primary')[1].fragments) == 1
+    with open(seed_path, 'rb') as f:
+        assert f.read() == seed
@@ -0,0 +1,148 @@
+from app.repair import ParseReport, parse_diff_yaml, parse_dsl_yaml, tolerant_load
+
+SCENE = """\
+0:
+  name: Title
+  type: TEXT
+  node:
+    characters: Sign in
+    color: '#000000'
+    position:
+      x: 10
+      y: 5
+    width: 80
+    height: 10
+1:
+  name: Button
+  type: RECTANGLE
+  node:
+    color: '#0d99ff'
+    position:
+      x: 10
+      y: 30
+    width: 80
+    height: 12
+"""
+
+
+def parse(text: str):
+    report = ParseReport()
+    return parse_dsl_yaml(text, report), report
+
+
+def names(scene: dict) -> list:
+    return [node['name'] for _, node in sorted(scene.items())]
+
+
+def test_clean_input_is_untouched():
+    scene, report = parse(SCENE)
+    assert names(scene) == ['Title', 'Button']
+    assert report.as_dict() == {'repairs': [], 'dropped': []}
+
+
+def test_unquoted_hex_color_is_quoted():
+    scene, report = parse(SCENE.replace("'#0d99ff'", '#0d99ff'))
+    assert scene[1]['node']['color'] == '#0d99ff'
+    assert report.repairs == ['line 16: quoted hex color #0d99ff'] and not report.dropped
+
+
+########################################################################################################################
+# Truncated
+########################################################################################################################
+
+def test_truncated_mid_node_drops_only_that_node():
+    scene, report = parse(SCENE[:SCENE.index('      y: 30')])
+    assert names(scene) == ['Title']
+    assert report.dropped == ['Button: incomplete geometry']
+
+
+def test_truncated_inside_a_scalar_drops_the_item():
+    text = SCENE + '2:\n  name: Footer\n  type: TEXT\n  node:\n    characters: "Forgot your pass'
+    scene, report = parse(text)
+    assert names(scene) == ['Title', 'Button']
+    assert report.dropped == ['Footer (lines 22-26)']
+
+
+def test_truncated_diff_keeps_the_complete_ops():
+    text = "- update: [0]\n  set:\n    width: 90\n- delete: [1]\n- insert: []\n  at: 1\n  node: {name: Lin"
+    report = ParseReport()
+    ops = parse_diff_yaml(text, report)
+    assert ops == [{'update': [0], 'set': {'width': 90}}, {'delete': [1]}]
+    assert len(report.dropped) == 1 and report.dropped[0].startswith('- insert: []')
+
+
+########################################################################################################################
+# Mis-indented
+########################################################################################################################
+
+def test_stray_indentation_is_snapped_to_the_enclosing_block():
+    text = SCENE.replace('    width: 80\n    height: 12', '    width: 80\n     height: 12')
+    scene, report = parse(text)
+    assert scene[1]['node']['height'] == 12
+    assert report.repairs == ['line 21: re-indented from 5 to 4 spaces'] and not report.dropped
+
+
+def test_tab_indentation_is_expanded():
+    text = SCENE.replace('    width: 80\n    height: 12', '\t\twidth: 80\n\t\theight: 12')
+    scene, report = parse(text)
+    assert scene[1]['node']['width'] == 80 and scene[1]['node']['height'] == 12
+    assert 'replaced tab indentation on 2 lines' in report.repairs
+
+
+def test_children_outside_node_are_moved_under_it():
+    text = ("0:\n  name: Card\n  type: GROUP\n  node: {}\n  children:\n    0:\n      name: Bg\n      type: RECTANGLE\n"
+            "      node: {position: {x: 0, y: 0}, width: 5, height: 5}\n")
+    scene, report = parse(text)
+    assert names(scene[0]['node']['children']) == ['Bg']
+    assert report.repairs == ['Card: moved children under node']
+
+
+########################################################################################################################
+# Unterminated
+########################################################################################################################
+
+def test_unterminated_quote_drops_the_item_it_opens():
+    text = SCENE.replace('characters: Sign in', 'characters: "Sign in')
+    scene, report = parse(text)
+    assert names(scene) == ['Button']
+    assert report.dropped == ['Title (lines 1-11)']
+
+
+def test_unterminated_flow_mapping_swallows_what_follows():
+    report = ParseReport()
+    ops = parse_diff_yaml("- update: [0]\n  set: {width: 90\n- delete: [1]\n", report)
+    assert ops == []  # the flow mapping runs on into the next op, so neither can be kept
+    assert report.dropped == ['- delete: [1] (lines 3-4)', '- update: [0] (lines 1-2)']
+
+
+########################################################################################################################
+# Failure paths
+########################################################################################################################
+
+def test_nothing_salvageable_is_none():
+    scene, report = parse('0:\n  name: "unterminated\n')
+    assert scene is None
+    assert report.dropped
+
+
+def test_malformed_ops_are_dropped():
+    report = ParseReport()
+    ops = parse_diff_yaml("- update: 0\n- move: [1]\n- delete: [2]\n  update: [3]\n- delete: [4]\n", report)
+    assert ops == [{'delete': [4]}]
+    assert len(report.dropped) == 3 and all(d.startswith('malformed diff op') for d in report.dropped)
+
+
+def test_node_without_type_is_dropped():
+    scene, report = parse(SCENE.replace('  type: RECTANGLE\n', ''))
+    assert names(scene) == ['Title']
+    assert report.dropped == ["'Button': no type"]
+
+
+def test_empty_diff_means_no_changes():
+    assert parse_diff_yaml('') == []
+
+
+def test_garbage_gives_up_after_every_line():
+    report = ParseReport()
+    assert tolerant_load(':\n  - ]\n: [', report) is None
+    assert report.dropped
@@ -0,0 +1,133 @@
+import random
+import pytest
+from app.scene import from_figma
+from app.scene_diff import diff_trees, longest_increasing
+from factories import rect, group, patched
+
+
+def round_trip(a: dict, b: dict) -> dict:
+    return patched(a, diff_trees(from_figma(a), from_figma(b)))
+
+
+SCENE = group('Form', rect('Title', 0, 0), rect('Email', 0, 20), rect('Password', 0, 40), rect('Submit', 0, 60))
+
+
+########################################################################################################################
+# Ops
+########################################################################################################################
+
+def test_update_merges_nested_props():
+    out = patched(SCENE, [{'update': [1], 'set': {'position': {'x': 5}, 'cornerRadius': 4}}])
+    assert out['node']['children'][1]['node']['position'] == {'x': 5, 'y': 20}
+    assert out['node']['children'][1]['node']['cornerRadius'] == 4
+    assert out['node']['children'][0] == SCENE['node']['children'][0]
+
+
+def test_update_renames_and_unsets():
+    a = group('Form', rect('Title', dropShadow={'radius': 4}))
+    out = patched(a, [{'update': [0], 'name': 'Heading', 'unset': ['dropShadow']}])
+    assert out['node']['children'][0] == rect('Heading')
+
+
+def test_delete():
+    out = patched(SCENE, [{'delete': [1]}])
+    assert [c['name'] for c in out['node']['children']] == ['Title', 'Password', 'Submit']
+
+
+def test_insert_at_position_in_patched_parent():
+    out = patched(SCENE, [{'delete': [0]}, {'insert': [], 'at': 1, 'node': rect('Name', 0, 10)}])
+    assert [c['name'] for c in out['node']['children']] == ['Email', 'Name', 'Password', 'Submit']
+
+
+def test_move_to_position_in_patched_parent():
+    out = patched(SCENE, [{'move': [3], 'to': 0}])
+    assert [c['name'] for c in out['node']['children']] == ['Submit', 'Title', 'Email', 'Password']
+
+
+def test_replace():
+    out = patched(SCENE, [{'replace': [], 'node': rect('Only')}])
+    assert out == rect('Only')
+
+
+def test_paths_index_the_original_tree():
+    a = group('Root', group('Left', rect('A'), rect('B')), group('Right', rect('C')))
+    out = patched(a, [{'delete': [0, 0]}, {'update': [0, 1], 'set': {'width': 99}}, {'move': [1], 'to': 0}])
+    assert out == group('Root', group('Right', rect('C')), group('Left', rect('B', w=99)))
+
+
+@pytest.mark.parametrize('op', [{'insert': [], 'at': 9, 'node': rect('X')}, {'move': [0], 'to': 9}])
+def test_out_of_range_positions_raise(op):
+    with pytest.raises(ValueError):
+        patched(SCENE, [op])
+
+
+########################################################################################################################
+# Diff / patch round trips
+########################################################################################################################
+
+def test_identical_scenes_have_an_empty_diff():
+    assert diff_trees(from_figma(SCENE), from_figma(SCENE)) == []
+
+
+def test_round_trip_of_property_changes():
+    b = group('Form', rect('Title', 0, 0, w=40), rect('Email', 3, 20), rect('Password', 0, 40, color='#ff0000'),
+              rect('Submit', 0, 60))
+    assert round_trip(SCENE, b) == b
+
+
+def test_round_trip_of_insert_and_delete():
+    b = group('Form', rect('Logo', 0, -20), rect('Title', 0, 0), rect('Password', 0, 40), rect('Submit', 0, 60))
+    ops = diff_trees(from_figma(SCENE), from_figma(b))
+    assert {next(iter(op)) for op in ops} == {'insert', 'delete'}
+    assert round_trip(SCENE, b) == b
+
+
+def test_reorder_moves_only_what_left_the_longest_run():
+    b = group('Form', rect('Submit', 0, 60), rect('Title', 0, 0), rect('Email', 0, 20), rect('Password', 0, 40))
+    ops = diff_trees(from_figma(SCENE), from_figma(b))
+    assert ops == [{'move': [3], 'to': 0}]
+    assert round_trip(SCENE, b) == b
+
+
+def test_reversal_round_trips():
+    b = group('Form', *reversed(SCENE['node']['children']))
+    assert round_trip(SCENE, b) == b
+
+
+def test_same_named_siblings_are_matched_by_geometry():
+    a = group('List', rect('Item', 0, 0), rect('Item', 0, 20), rect('Item', 0, 40))
+    b = group('List', rect('Item', 0, 40), rect('Item', 0, 0, w=50), rect('Item', 0, 20))
+    ops = diff_trees(from_figma(a), from_figma(b))
+    assert [op for op in ops if 'update' in op] == [{'update': [0], 'set': {'width': 50}}]
+    assert round_trip(a, b) == b
+
+
+def test_nested_round_trip():
+    a = group('Root', group('Header', rect('Logo'), rect('Menu', 20)), group('Body', rect('Card', 0, 50)))
+    b = group('Root', group('Body', rect('Card', 0, 50), rect('Card 2', 0, 80)), group('Header', rect('Menu', 25)))
+    assert round_trip(a, b) == b
+
+
+def test_root_type_change_is_a_replace():
+    ops = diff_trees(from_figma(rect('A')), from_figma(group('A', rect('B'))))
+    assert ops[0]['replace'] == []
+    assert round_trip(rect('A'), group('A', rect('B'))) == group('A', rect('B'))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_edits_round_trip(seed):
+    rng = random.Random(seed)
+    children = [rect(f'Node {i}', rng.randint(0, 500), rng.randint(0, 500)) for i in range(12)]
+    a = group('Frame', *children, group('Inner', *[rect(f'Inner {i}', i * 30) for i in range(4)]))
+    b_children = [dict(c) for c in children if rng.random() > 0.2]
+    rng.shuffle(b_children)
+    for i in rng.sample(range(len(b_children)), min(3, len(b_children))):
+        b_children[i] = {**b_children[i], 'node': {**b_children[i]['node'], 'width': rng.randint(1, 99)}}
+    b_children.insert(rng.randint(0, len(b_children)), rect('New', 999, 999))
+    b = group('Frame', group('Inner', *[rect(f'Inner {i}', i * 30) for i in (3, 1, 0)]), *b_children)
+    assert round_trip(a, b) == b
+
+
+def test_longest_increasing():
+    assert longest_increasing([3, 0, 1, 4, 2]) in ({0, 1, 2}, {0, 1, 4})
+    assert longest_increasing([]) == set()
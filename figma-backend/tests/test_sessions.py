@@ -0,0 +1,63 @@
+import time
+import asyncio
+import pytest
+from app.sessions import SceneSessions, StaleSession, scene_hash
+
+
+def scene(*names: str) -> dict:
+    return {'name': 'Frame', 'type': 'FRAME', 'node': {'children': [
+        {'name': name, 'type': 'RECTANGLE', 'node': {
+            'color': {'r': 0.5, 'g': 0.5, 'b': 0.5}, 'position': {'x': ix * 20, 'y': 0}, 'width': 10, 'height': 10}}
+        for ix, name in enumerate(names)]}}
+
+
+def test_put_returns_the_scene_hash():
+    sessions = SceneSessions(db_path=None)
+    assert sessions.put('s', scene('A')) == scene_hash(scene('A')) != scene_hash(scene('B'))
+
+
+def test_get_needs_the_current_hash():
+    sessions = SceneSessions(db_path=None)
+    base = sessions.put('s', scene('A'))
+    assert sessions.get('s', base) == scene('A')
+    sessions.put('s', scene('B'))
+    with pytest.raises(StaleSession):
+        sessions.get('s', base)
+
+
+def test_unknown_and_expired_sessions_are_stale():
+    sessions = SceneSessions(ttl=0.01, db_path=None)
+    with pytest.raises(StaleSession):
+        sessions.get('nobody', 'abc')
+    base = sessions.put('s', scene('A'))
+    time.sleep(0.02)
+    with pytest.raises(StaleSession):
+        sessions.get('s', base)
+
+
+def test_resolve_applies_the_clients_changes():
+    sessions = SceneSessions(db_path=None)
+    base = sessions.put('s', scene('A', 'B'))
+    resolved = sessions.resolve('s', base, [{'update': [1], 'name': 'Renamed'}, {'delete': [0]}])
+    assert [child['name'] for child in resolved['node']['children']] == ['Renamed']
+    assert sessions.resolve('s', base, []) == scene('A', 'B')
+
+
+def test_malformed_changes_are_rejected():
+    sessions = SceneSessions(db_path=None)
+    base = sessions.put('s', scene('A'))
+    for change in ({'update': 'A'}, {'insert': [], 'at': 0}, {'delete': [0], 'move': [0]}, 'delete A'):
+        with pytest.raises(ValueError):
+            sessions.resolve('s', base, [change])
+
+
+def test_sessions_are_shared_through_the_file(tmp_path):
+    db_path = str(tmp_path / 'sessions.db')
+    base = SceneSessions(db_path=db_path).put('s', scene('A'))
+    assert SceneSessions(db_path=db_path).get('s', base) == scene('A')
+
+
+def test_aput_matches_put(tmp_path):
+    sessions = SceneSessions(db_path=str(tmp_path / 'sessions.db'))
+    base = asyncio.run(sessions.aput('s', scene('A')))
+    assert base == scene_hash(scene('A')) and sessions.get('s', base) == scene('A')
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from app.singleflight import SingleFlight
+
+
+def counting(result='done', delay: float = 0.01, error: Exception = None):
+    """A call that sleeps for `delay`, counting how often it was made"""
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return fn, calls
+
+
+def test_concurrent_calls_with_one_key_share_one_call():
+    flight = SingleFlight()
+    fn, calls = counting()
+
+    async def run():
+        return await asyncio.gather(*[flight.do('k', fn) for _ in range(5)])
+
+    assert asyncio.run(run()) == ['done'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'calls': 5, 'upstream_calls': 1, 'saved_upstream_calls': 4, 'in_flight': 0}
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+    fn, calls = counting()
+
+    async def run():
+        return await asyncio.gather(flight.do('a', fn), flight.do('b', fn))
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_finished_calls_are_not_reused():
+    flight = SingleFlight()
+    fn, calls = counting()
+
+    async def run():
+        await flight.do('k', fn)
+        await flight.do('k', fn)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_every_waiter_gets_the_error_and_the_key_is_forgotten():
+    flight = SingleFlight()
+    fn, calls = counting(error=RuntimeError('upstream'))
+
+    async def run():
+        return await asyncio.gather(*[flight.do('k', fn) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 1 and flight.stats()['in_flight'] == 0
+
+
+def test_a_cancelled_waiter_leaves_the_call_running_for_the_others():
+    flight = SingleFlight()
+    fn, calls = counting(delay=0.05)
+
+    async def run():
+        first = asyncio.ensure_future(flight.do('k', fn))
+        second = asyncio.ensure_future(flight.do('k', fn))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == 'done'
+    assert len(calls) == 1
@@ -0,0 +1,58 @@
+import yaml
+import pytest
+from app.conversion import figma_to_dsl_tree
+from app.example_data import example_data
+from app.scene import to_dsl
+from app.yaml_codec import CODECS, DSLDumper, DSLEmitter
+
+TRICKY_STRINGS = [
+    'plain', 'yes', 'No', 'null', '~', '1', '1.5', '0x1F', '12:30', '2022-01-01', '', ' leading', 'trailing ',
+    "it's", 'a: b', 'a #b', 'a#b', '#ffffff', '- item', '? key', '---', '...', '{{x}}', '[0]', '@at', '%d',
+    'a ' * 50, 'word ' * 30 + 'end', 'x' * 100, "quoted '" + ' spaced' * 15,
+]
+
+
+def reference(data) -> str:
+    return yaml.dump(data, Dumper=DSLDumper, sort_keys=False)
+
+
+def example_dsl() -> dict:
+    return to_dsl(figma_to_dsl_tree(example_data[0]))
+
+
+def test_emitter_matches_pyyaml_on_the_example_scene():
+    assert DSLEmitter().dump(example_dsl()) == reference(example_dsl())
+
+
+@pytest.mark.parametrize('text', TRICKY_STRINGS)
+def test_emitter_matches_pyyaml_on_strings(text):
+    data = {'name': text, 'node': {'characters': text, 'children': {0: {'name': text}}}}
+    assert DSLEmitter().dump(data) == reference(data)
+
+
+@pytest.mark.parametrize('value', [0, -3, 1.5, 1e20, 1e-7, float('inf'), float('-inf'), True, False, None])
+def test_emitter_matches_pyyaml_on_scalars(value):
+    assert DSLEmitter().dump({'v': value, 'b': [0, 1.5, -2]}) == reference({'v': value, 'b': [0, 1.5, -2]})
+
+
+@pytest.mark.parametrize('data', [
+    {'name': 'café'},  # non-ASCII
+    {'name': 'two\nlines'},
+    {'ops': [{'delete': [0]}]},  # lists other than numbers
+    {'b': list(range(40))},  # a list PyYAML would fold
+    {'a key': 1},
+    [1, 2],
+    {},
+])
+def test_emitter_declines_what_it_does_not_emit(data):
+    assert DSLEmitter().dump(data) is None
+
+
+def test_codecs_dump_the_same_text():
+    for data in (example_dsl(), {'name': 'café', 'ops': [{'delete': [0]}]}):
+        assert CODECS['fast'].dump(data) == CODECS['pyyaml'].dump(data)
+
+
+def test_codecs_load_the_same_data():
+    text = CODECS['pyyaml'].dump(example_dsl())
+    assert CODECS['fast'].load(text) == CODECS['pyyaml'].load(text) == example_dsl()
@@ -78,6 +78,25 @@ const clone = (x: object | Array<any>): Array<any> => {
   return JSON.parse(JSON.stringify(x));
 };
 
+const dropShadowEffect = (offset: number): Effect => ({
+  type: "DROP_SHADOW",
+  color: {
+    r: 0,
+    g: 0,
+    b: 0,
+    a: 0.25,
+  },
+  offset: {
+    x: 0,
+    y: offset,
+  },
+  radius: 4,
+  spread: 0,
+  visible: true,
+  blendMode: "NORMAL",
+  showShadowBehindNode: false,
+});
+
 const createRectangle = (
   name: string,
   spec: Rectangle,
@@ -94,26 +113,7 @@ const createRectangle = (
   node.strokeWeight = node.strokeWeight;
   node.cornerRadius = spec.cornerRadius;
   if (spec.dropShadow) {
-    node.effects = [
-      {
-        type: "DROP_SHADOW",
-        color: {
-          r: 0,
-          g: 0,
-          b: 0,
-          a: 0.25,
-        },
-        offset: {
-          x: 0,
-          y: spec.dropShadow,
-        },
-        radius: 4,
-        spread: 0,
-        visible: true,
-        blendMode: "NORMAL",
-        showShadowBehindNode: false,
-      },
-    ];
+    node.effects = [dropShadowEffect(spec.dropShadow)];
   }
   return node;
 };
@@ -295,6 +295,146 @@ const serializeFrameNode = (node: FrameNode): Node => {
   };
 };
 
+/* ####################################################################################################
+ * # PATCHING
+ * #################################################################################################### */
+
+// Scene diff ops (see figma-backend/app/scene_diff.py); paths are child indices from the edited root
+type Op = {
+  update?: number[];
+  delete?: number[];
+  move?: number[];
+  insert?: number[];
+  replace?: number[];
+  name?: string;
+  set?: { [key: string]: any };
+  unset?: string[];
+  to?: number;
+  at?: number;
+  node?: Node;
+};
+
+const isContainer = (node: Node): boolean =>
+  node.type === "GROUP" || node.type === "FRAME";
+
+// Ops that turn serialized scene `a` into `b`, or null if the structure changed (then the full scene is sent)
+const diffScenes = (a: Node, b: Node): Array<Op> | null => {
+  const ops: Array<Op> = [];
+  const diffNodes = (a: Node, b: Node, path: number[]): boolean => {
+    if (a.type !== b.type) return false;
+    const op: Op = { update: path };
+    if (a.name !== b.name) op.name = b.name;
+    if (isContainer(a)) {
+      const childrenA = (a.node as Group).children;
+      const childrenB = (b.node as Group).children;
+      if (childrenA.length !== childrenB.length) return false;
+      if (op.name !== undefined) ops.push(op);
+      return childrenA.every((child, ix) =>
+        diffNodes(child, childrenB[ix], [...path, ix])
+      );
+    }
+    const propsA = a.node as { [key: string]: any };
+    const propsB = b.node as { [key: string]: any };
+    const set: { [key: string]: any } = {};
+    Object.keys(propsB).forEach((key) => {
+      if (JSON.stringify(propsA[key]) !== JSON.stringify(propsB[key]))
+        set[key] = propsB[key];
+    });
+    const unset = Object.keys(propsA).filter((key) => !(key in propsB));
+    if (Object.keys(set).length > 0) op.set = set;
+    if (unset.length > 0) op.unset = unset;
+    if (op.name !== undefined || op.set || op.unset) ops.push(op);
+    return true;
+  };
+  return diffNodes(clone(a) as any, clone(b) as any, []) ? ops : null;
+};
+
+const nodeAt = (root: SceneNode, path: number[]): SceneNode =>
+  path.reduce(
+    (node: SceneNode, ix: number) => (node as GroupNode).children[ix],
+    root
+  );
+
+const setFill = (node: GeometryMixin, color?: object, opacity?: number) => {
+  const fills = clone(node.fills as Array<any>);
+  if (fills.length === 0) fills.push({ type: "SOLID", color: { r: 0, g: 0, b: 0 } }); // (a node without fills)
+  if (color) fills[0].color = { ...fills[0].color, ...color };
+  if (opacity !== undefined) fills[0].opacity = opacity;
+  node.fills = fills;
+};
+
+const applyProps = (node: SceneNode, set: { [key: string]: any }, unset: string[]) => {
+  const shape = node as RectangleNode & TextNode;
+  if (set.position) {
+    if (set.position.x !== undefined) shape.x = set.position.x;
+    if (set.position.y !== undefined) shape.y = set.position.y;
+  }
+  if (set.width !== undefined || set.height !== undefined)
+    shape.resize(set.width ?? shape.width, set.height ?? shape.height);
+  if (set.color || set.opacity !== undefined)
+    setFill(shape, set.color, set.opacity);
+  if (set.cornerRadius !== undefined) shape.cornerRadius = set.cornerRadius;
+  if (set.characters !== undefined) shape.characters = set.characters;
+  if (set.fontSize !== undefined) shape.fontSize = set.fontSize;
+  if (set.textAlignHorizontal !== undefined)
+    shape.textAlignHorizontal = set.textAlignHorizontal;
+  if (set.dropShadow) shape.effects = [dropShadowEffect(set.dropShadow)];
+  if (unset.indexOf("dropShadow") >= 0) shape.effects = [];
+};
+
+// Applies a server patch to the live nodes under `root`; returns the (possibly replaced) root
+const applyPatch = (root: SceneNode, patch: Array<Op>, frame: FrameNode): SceneNode => {
+  const replace = patch.find((op) => op.replace);
+  if (replace) {
+    const { x, y } = root;
+    const outputGroup = createScene([replace.node as Node], frame);
+    outputGroup.x = x;
+    outputGroup.y = y;
+    root.remove();
+    return outputGroup;
+  }
+
+  //=====[ Resolve every path against the original tree before changing anything ]=====
+  const key = (path: number[]) => path.join("/");
+  const parents: { [key: string]: { parent: SceneNode; inserts: Array<Op>; moves: Array<[SceneNode, number]>; deletes: Array<SceneNode> } } = {};
+  const parentOf = (path: number[]) => {
+    if (!parents[key(path)])
+      parents[key(path)] = { parent: nodeAt(root, path), inserts: [], moves: [], deletes: [] };
+    return parents[key(path)];
+  };
+  const updates = patch
+    .filter((op) => op.update)
+    .map((op): [SceneNode, Op] => [nodeAt(root, op.update as number[]), op]);
+  patch.forEach((op) => {
+    if (op.insert) parentOf(op.insert).inserts.push(op);
+    if (op.move) parentOf(op.move.slice(0, -1)).moves.push([nodeAt(root, op.move), op.to as number]);
+    if (op.delete) parentOf(op.delete.slice(0, -1)).deletes.push(nodeAt(root, op.delete));
+  });
+
+  //=====[ Node properties ]=====
+  updates.forEach(([node, op]) => {
+    if (op.name !== undefined) node.name = op.name;
+    if (op.set || op.unset) applyProps(node, op.set || {}, op.unset || []);
+  });
+
+  //=====[ Children: place inserted and moved nodes, keep the rest in order, then drop deletions ]=====
+  Object.keys(parents).forEach((path) => {
+    const { parent, inserts, moves, deletes } = parents[path];
+    const group = parent as GroupNode;
+    const moved = moves.map(([node]) => node);
+    const rest = group.children.filter(
+      (child) => deletes.indexOf(child) < 0 && moved.indexOf(child) < 0
+    );
+    const order: Array<SceneNode | null> = new Array(rest.length + moves.length + inserts.length).fill(null);
+    inserts.forEach((op) => (order[op.at as number] = createNode(op.node as Node, frame)));
+    moves.forEach(([node, to]) => (order[to] = node));
+    let next = 0;
+    order.forEach((node, ix) => group.insertChild(ix, node || rest[next++]));
+    deletes.forEach((node) => node.remove());
+  });
+  return root;
+};
+
 /* ####################################################################################################
  * # UTILS
  * #################################################################################################### */
@@ -347,6 +487,28 @@ const saveScene = async () => {
 
 type TaskType = "primary" | "edit";
 
+// The last edit's result as the server has it, so the next edit can send just its hash and our changes
+const session = {
+  id: Math.random().toString(36).slice(2),
+  hash: null as string | null,
+  rootId: null as string | null,
+  scene: null as Node | null,
+};
+
+const runDeltaPrompt = async (prompt: string, changes: Array<Op>) => {
+  const response = await fetch(`${serverUrl}/convert/edit/delta`, {
+    method: "POST",
+    headersObject: { "Content-Type": "application/json" },
+    body: str2ab(
+      JSON.stringify({ prompt, session: session.id, base: session.hash, changes })
+    ),
+  });
+  if (response.status === 409) return null; // the server lost the session; send the full scene instead
+  const json = JSON.parse(await response.text());
+  console.log("runDeltaPrompt success", { json });
+  return json;
+};
+
 const runPrompt = async (task: TaskType, data: object) => {
   const endpoint = {
     primary: "/convert/primary",
@@ -401,8 +563,34 @@ async function main() {
       const frame = getFrame();
       const task = selection.length === 0 ? "primary" : "edit";
       const scene = selection.map((node) => serializeNode(node));
+
+      //=====[ Continuing a session: send only the hash and what changed by hand ]=====
+      if (
+        task === "edit" &&
+        selection.length === 1 &&
+        selection[0].id === session.rootId &&
+        session.scene
+      ) {
+        const changes = diffScenes(session.scene, scene[0]);
+        const result = changes && (await runDeltaPrompt(prompt, changes));
+        if (result) {
+          const root = applyPatch(selection[0], result.patch, frame);
+          session.hash = result.sceneHash;
+          session.rootId = root.id;
+          session.scene = result.scene; // the server's copy: the next changes are applied to it
+          signalComplete();
+          figma.currentPage.selection = [root];
+          figma.viewport.scrollAndZoomIntoView([root]);
+          return;
+        }
+      }
+
       console.log(`Running task: ${task}`);
-      const { outputScene, x, y } = await runPrompt(task, { prompt, scene });
+      const { outputScene, x, y, sceneHash } = await runPrompt(task, {
+        prompt,
+        scene,
+        session: session.id,
+      });
       const outputGroup = createScene(outputScene, frame);
       if (task === "primary") {
         outputGroup.x = 400;
@@ -411,6 +599,9 @@ async function main() {
         outputGroup.x = x;
         outputGroup.y = y;
         selection.map((x) => x.remove());
+        session.hash = sceneHash;
+        session.rootId = outputGroup.id;
+        session.scene = outputScene[0];
       }
       signalComplete();
       figma.currentPage.selection = [outputGroup];